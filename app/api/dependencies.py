@@ -3,26 +3,39 @@ from typing import Annotated
 
 from app.config.security import security
 from app.services.mistral_service import mistral_service
-from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.config.settings import settings
 
 async def get_api_key(api_key: str = Depends(security)) -> str:
     """Dependency to get and validate API key"""
     return api_key
 
+async def get_admin_key(api_key: str = Depends(security)) -> str:
+    """Dependency restricting a route to admin API keys"""
+    if api_key not in settings.ADMIN_API_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return api_key
+
 async def get_mistral_service():
-    """Dependency to get Mistral service instance"""
-    if not mistral_service.loaded and not mistral_service.loading:
-        logger.warning("Model not loaded, attempting to load")
-        await mistral_service.load_model_async()
-    
+    """Dependency to get Mistral service instance
+
+    Loading runs in the background from startup; until it finishes,
+    requests are turned away at once instead of waiting for it.
+    """
     if not mistral_service.loaded:
+        metrics.requests_rejected.labels(reason="model_not_loaded").inc()
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Model service is not available"
+            detail=f"Model service is not available ({mistral_service.status})",
+            headers={"Retry-After": str(settings.NOT_READY_RETRY_AFTER_SECONDS)}
         )
     
     return mistral_service
 
 # Type annotations for dependencies
 APIKeyDep = Annotated[str, Depends(get_api_key)]
+AdminKeyDep = Annotated[str, Depends(get_admin_key)]
 MistralServiceDep = Annotated[any, Depends(get_mistral_service)]
\ No newline at end of file
@@ -0,0 +1,132 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.api.dependencies import AdminKeyDep
+from app.models.schemas import ModelSwapRequest
+from app.services.mistral_service import mistral_service
+from app.services.model_registry import model_registry
+from app.utils.tracing import trace_buffer, export_traces
+from app.utils.profiler import profiler
+from app.config.settings import settings
+
+router = APIRouter()
+
+@router.get(
+    "/traces",
+    summary="Recent request traces",
+    description="Per-phase timings of the most recent requests (requires ENABLE_TRACING)"
+)
+async def recent_traces(
+    api_key: AdminKeyDep,
+    limit: int = Query(default=50, ge=1, le=10000)
+):
+    """List recent request traces"""
+    return {
+        "enabled": settings.ENABLE_TRACING,
+        "traces": [trace.to_dict() for trace in trace_buffer.recent(limit)]
+    }
+
+@router.get(
+    "/traces/export",
+    summary="Export request traces",
+    description="Recent traces as Chrome trace events or OTLP/JSON"
+)
+async def export_recent_traces(
+    api_key: AdminKeyDep,
+    format: str = Query(default="chrome", pattern="^(chrome|otlp)$"),
+    limit: int = Query(default=256, ge=1, le=10000)
+):
+    """Download recent traces in a trace-viewer format"""
+    payload = export_traces(trace_buffer.recent(limit), format)
+    return JSONResponse(
+        content=payload,
+        headers={"Content-Disposition": f'attachment; filename="traces-{format}.json"'}
+    )
+
+@router.post(
+    "/profile",
+    summary="Profile the live process",
+    description="Sample every thread's stack for a while and return collapsed stacks or a speedscope file"
+)
+async def profile_process(
+    api_key: AdminKeyDep,
+    seconds: float = Query(default=10.0, gt=0, le=120),
+    hz: float = Query(default=97.0, gt=0, le=1000),
+    format: str = Query(default="speedscope", pattern="^(speedscope|collapsed)$"),
+    include_idle: bool = Query(default=False)
+):
+    """Run the sampling profiler for ``seconds``, tagged by phase"""
+    if profiler.busy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running"
+        )
+    
+    # Sampling runs on its own thread so the event loop keeps serving (and
+    # shows up in the profile)
+    result = await asyncio.to_thread(profiler.run, seconds, hz, include_idle)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running"
+        )
+    
+    if format == "collapsed":
+        return PlainTextResponse(result.collapsed())
+    return JSONResponse(
+        content=result.speedscope(),
+        headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'}
+    )
+
+@router.get(
+    "/model",
+    summary="Served model",
+    description="Checkpoint being served and the state of the last hot swap"
+)
+async def model_status(api_key: AdminKeyDep):
+    """Current checkpoint, model version and swap progress"""
+    return {
+        "model_path": mistral_service.model_path,
+        "model_version": mistral_service.model_version,
+        "status": mistral_service.status,
+        "swap": mistral_service.swap_status
+    }
+
+@router.post(
+    "/model/swap",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Hot swap the checkpoint",
+    description="Load another checkpoint in the background and switch to it without dropping requests"
+)
+async def swap_model(api_key: AdminKeyDep, request: ModelSwapRequest):
+    """Start swapping to ``model_path``; poll GET /admin/model for progress"""
+    if not mistral_service.loaded:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"No model to swap out ({mistral_service.status})"
+        )
+    if mistral_service.swapping:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A model swap is already running"
+        )
+    if settings.WORKERS > 1:
+        # Each worker holds its own model; a swap would only reach this one
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Hot swap needs a single worker (WORKERS={settings.WORKERS})"
+        )
+    
+    mistral_service.start_swap(request.model_path)
+    return {"swap": mistral_service.swap_status}
+
+@router.get(
+    "/models",
+    summary="Model residency",
+    description="Every registered model with its load state, traffic and weight memory"
+)
+async def model_residency(api_key: AdminKeyDep):
+    """Registry state against the model memory budget"""
+    return model_registry.stats()
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import time
 import uuid
 import json
 
+from app.models import codec
 from app.models.schemas import (
-    ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChoice,
-    UsageStats, ModelsListResponse, ModelInfo, ChatMessage, Role
+    ChatCompletionRequest, ChatCompletionResponse, ModelsListResponse, ModelInfo, Role
 )
-from app.api.dependencies import APIKeyDep, MistralServiceDep
-from app.utils.logging import logger
+from app.api.dependencies import APIKeyDep
+from app.services.constrained import constraint_compiler
+from app.services.mistral_service import GenerationStats
+from app.services.model_registry import ModelEntry, model_registry
+from app.utils.logging import current_sampling, logger, start_request_sampling
+from app.utils.tracing import span
+from app.utils.profiler import phase
+from app.utils.traffic import traffic_recorder
 from app.config.settings import settings
 
 router = APIRouter()
@@ -19,14 +26,22 @@ router = APIRouter()
     response_model=ChatCompletionResponse,
     status_code=status.HTTP_200_OK,
     summary="Create chat completion",
-    description="Generate a chat completion using the Mistral model"
+    description="Generate a chat completion using the Mistral model",
+    openapi_extra=codec.openapi_request_body(ChatCompletionRequest)
 )
 async def create_chat_completion(
-    request: ChatCompletionRequest,
-    api_key: APIKeyDep,
-    mistral_service: MistralServiceDep
+    raw_request: Request,
+    api_key: APIKeyDep
 ):
-    """Create chat completion"""
+    """Create chat completion on the model the request names"""
+    # The body is decoded with the msgspec codec rather than through pydantic;
+    # ChatCompletionRequest only documents the body in the OpenAPI schema.
+    with span("validation"):
+        request = codec.decode_chat_request(await raw_request.body())
+    
+    # Keeps or drops all of this request's sampled log events together
+    request_id = str(uuid.uuid4())
+    sampling = start_request_sampling(request_id)
     try:
         start_time = time.time()
         
@@ -35,100 +50,155 @@ async def create_chat_completion(
             model=request.model,
             message_count=len(request.messages),
             max_tokens=request.max_tokens,
-            stream=request.stream
+            stream=request.stream,
+            sample=True
         )
         
+        # Waits for the model if it has to be loaded first
+        model = await model_registry.acquire(request.model)
         if request.stream:
-            return await handle_streaming_completion(request, mistral_service)
-        else:
-            return await handle_normal_completion(request, mistral_service, start_time)
+            if request.response_format is not None:
+                # A bad response_format fails here with a 400, not mid-stream;
+                # the stream then finds it compiled
+                try:
+                    await constraint_compiler.compile(model.service.backend, request.response_format)
+                except Exception:
+                    model_registry.release(model)
+                    raise
+            # Released by the response once the stream ends
+            return await handle_streaming_completion(request, model, api_key, start_time, request_id)
+        try:
+            return await handle_normal_completion(request, model, api_key, start_time, request_id)
+        finally:
+            model_registry.release(model)
+            sampling.close()
             
     except Exception as e:
         logger.error("Chat completion failed", error=str(e))
+        sampling.close()
         raise
 
 async def handle_normal_completion(
-    request: ChatCompletionRequest,
-    mistral_service: MistralServiceDep,
-    start_time: float
-) -> ChatCompletionResponse:
+    request: codec.ChatCompletionRequest,
+    model: ModelEntry,
+    api_key: str,
+    start_time: float,
+    request_id: str
+) -> Response:
     """Handle non-streaming completion"""
     # Generate completion
-    response_text = await mistral_service.generate_completion_async(
+    stats = GenerationStats()
+    response_text = await model.service.chat(
         messages=request.messages,
         max_tokens=request.max_tokens or settings.MAX_TOKENS,
         temperature=request.temperature or settings.DEFAULT_TEMPERATURE,
-        stream=False
+        stats=stats,
+        tenant=api_key,
+        adapter=model.adapter,
+        response_format=request.response_format
     )
     
-    # Calculate tokens (approximate)
-    prompt_tokens = sum(
-        mistral_service._count_tokens_approximate(msg.content) 
-        for msg in request.messages
-    )
-    completion_tokens = mistral_service._count_tokens_approximate(response_text)
-    
     # Log performance
     processing_time = time.time() - start_time
+    traffic_recorder.record(
+        api_key, start_time, stats.prompt_tokens, request.max_tokens or settings.MAX_TOKENS,
+        stats.completion_tokens, stats.ttft, processing_time, status=200, stream=False
+    )
     logger.info(
         "Chat completion completed",
         processing_time=round(processing_time, 2),
-        prompt_tokens=prompt_tokens,
-        completion_tokens=completion_tokens
+        prompt_tokens=stats.prompt_tokens,
+        completion_tokens=stats.completion_tokens,
+        sample=True
     )
     
     # Create response
-    return ChatCompletionResponse(
-        id=f"chatcmpl-{uuid.uuid4()}",
+    response = codec.ChatCompletionResponse(
+        id=f"chatcmpl-{request_id}",
         created=int(start_time),
         model=request.model,
         choices=[
-            ChatCompletionChoice(
+            codec.ChatCompletionChoice(
                 index=0,
-                message=ChatMessage(role=Role.ASSISTANT, content=response_text),
-                finish_reason="stop"
+                message=codec.ChatMessage(role=Role.ASSISTANT, content=response_text),
+                finish_reason=stats.finish_reason
             )
         ],
-        usage=UsageStats(
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=prompt_tokens + completion_tokens
+        usage=codec.UsageStats(
+            prompt_tokens=stats.prompt_tokens,
+            completion_tokens=stats.completion_tokens,
+            total_tokens=stats.prompt_tokens + stats.completion_tokens
         )
     )
+    with span("serialize"), phase("serialize"):
+        body = codec.encode(response)
+    return Response(content=body, media_type="application/json")
 
 async def handle_streaming_completion(
-    request: ChatCompletionRequest,
-    mistral_service: MistralServiceDep
+    request: codec.ChatCompletionRequest,
+    model: ModelEntry,
+    api_key: str,
+    start_time: float,
+    request_id: str
 ) -> StreamingResponse:
-    """Handle streaming completion"""
+    """Handle streaming completion, forwarding tokens as the engine produces them"""
+    completion_id = f"chatcmpl-{request_id}"
+    sampling = current_sampling()
+    created = int(time.time())
+    
+    def make_chunk(delta: dict, finish_reason: str = None, usage: dict = None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": request.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason
+                }
+            ]
+        }
+        if usage is not None:
+            chunk["usage"] = usage
+        with span("serialize"), phase("serialize"):
+            return f"data: {codec.encode(chunk).decode()}\n\n"
+    
     async def generate_stream():
+        stats = GenerationStats()
+        # Recorded as client-closed unless the stream completes or fails
+        status_code = 499
         try:
-            response_text = await mistral_service.generate_completion_async(
+            # First chunk carries the role, as in the OpenAI wire format
+            yield make_chunk({"role": "assistant", "content": ""})
+            
+            async for token in model.service.stream_chat(
                 messages=request.messages,
                 max_tokens=request.max_tokens or settings.MAX_TOKENS,
                 temperature=request.temperature or settings.DEFAULT_TEMPERATURE,
-                stream=False
-            )
+                stats=stats,
+                tenant=api_key,
+                adapter=model.adapter,
+                response_format=request.response_format
+            ):
+                yield make_chunk({"content": token})
             
-            # Send response as a single chunk (simplified streaming)
-            chunk = {
-                "id": f"chatcmpl-{uuid.uuid4()}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": request.model,
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"role": "assistant", "content": response_text},
-                        "finish_reason": "stop"
-                    }
-                ]
-            }
-            
-            yield f"data: {json.dumps(chunk)}\n\n"
+            # Final chunk carries finish reason and usage
+            yield make_chunk(
+                {},
+                finish_reason=stats.finish_reason,
+                usage={
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "total_tokens": stats.prompt_tokens + stats.completion_tokens
+                }
+            )
+            status_code = 200
             yield "data: [DONE]\n\n"
             
         except Exception as e:
+            logger.error("Streaming completion failed", error=str(e))
             error_chunk = {
                 "error": {
                     "message": str(e),
@@ -136,7 +206,26 @@ async def handle_streaming_completion(
                     "code": "generation_failed"
                 }
             }
+            status_code = 500
             yield f"data: {json.dumps(error_chunk)}\n\n"
+        finally:
+            processing_time = time.time() - start_time
+            traffic_recorder.record(
+                api_key, start_time, stats.prompt_tokens, request.max_tokens or settings.MAX_TOKENS,
+                stats.completion_tokens, stats.ttft, processing_time, status=status_code, stream=True
+            )
+            # A slow stream releases the events its sampling held back
+            logger.info(
+                "Chat completion completed",
+                processing_time=round(processing_time, 2),
+                prompt_tokens=stats.prompt_tokens,
+                completion_tokens=stats.completion_tokens,
+                status=status_code,
+                stream=True,
+                sample=sampling or True
+            )
+            if sampling is not None:
+                sampling.close()
     
     return StreamingResponse(
         generate_stream(),
@@ -145,7 +234,9 @@ async def handle_streaming_completion(
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no"  # Disable buffering for nginx
-        }
+        },
+        # Runs after the stream, also when the client disconnects
+        background=BackgroundTask(model_registry.release, model)
     )
 
 @router.get(
@@ -155,12 +246,13 @@ async def handle_streaming_completion(
     description="List available models"
 )
 async def list_models(api_key: APIKeyDep):
-    """List available models"""
+    """List the models requests can name, resident or not"""
     models = [
         ModelInfo(
-            id=settings.MODEL_PATH,
+            id=model_id,
             created=int(time.time()),
             owned_by="mistral"
         )
+        for model_id in model_registry.model_ids()
     ]
     return ModelsListResponse(data=models)
\ No newline at end of file
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 import json
 from typing import AsyncGenerator, List, Optional
 import asyncio
 
-from app.services.mistral_service import MistralService
+from app.services.mistral_service import MistralService, GenerationStats
+from app.services.session_service import session_manager
 from app.core.dependencies import get_mistral_service
+from app.utils.logging import logger
+from app.utils.tracing import span
+from app.utils.profiler import phase
 
 router = APIRouter()
 
@@ -31,6 +36,13 @@ class ChatResponse(BaseModel):
     model: str
     choices: List[ChatResponseChoice]
 
+class WSChatTurn(BaseModel):
+    type: str = "message"
+    content: Optional[str] = None
+    system: Optional[str] = None
+    max_tokens: Optional[int] = 1000
+    temperature: Optional[float] = 0.7
+
 class StreamResponseChoice(BaseModel):
     index: int
     delta: dict
@@ -63,12 +75,14 @@ async def stream_chat_completions(request: ChatRequest, mistral_service: Mistral
             # Generate a unique ID for this completion
             import time
             completion_id = f"chatcmpl-{int(time.time())}"
+            stats = GenerationStats()
             
             # Start streaming
             async for token in mistral_service.stream_chat(
                 messages=request.messages,
                 max_tokens=request.max_tokens,
-                temperature=request.temperature
+                temperature=request.temperature,
+                stats=stats
             ):
                 # Create streaming response
                 stream_response = StreamResponse(
@@ -82,7 +96,9 @@ async def stream_chat_completions(request: ChatRequest, mistral_service: Mistral
                         )
                     ]
                 )
-                yield f"data: {stream_response.json()}\n\n"
+                with span("serialize"), phase("serialize"):
+                    data = stream_response.json()
+                yield f"data: {data}\n\n"
             
             # Send final chunk with finish reason
             final_response = StreamResponse(
@@ -93,7 +109,7 @@ async def stream_chat_completions(request: ChatRequest, mistral_service: Mistral
                     StreamResponseChoice(
                         index=0,
                         delta={},
-                        finish_reason="stop"
+                        finish_reason=stats.finish_reason
                     )
                 ]
             )
@@ -155,6 +171,95 @@ async def non_stream_chat_completions(request: ChatRequest, mistral_service: Mis
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.websocket("/ws/chat")
+async def websocket_chat(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    mistral_service: MistralService = Depends(get_mistral_service)
+):
+    """Multi-turn chat over a WebSocket with conversation state kept on the server
+
+    The client sends ``{"type": "message", "content": ...}`` per turn (plus an
+    optional ``system`` prompt on the first one) and receives ``token`` events
+    followed by a ``done`` event. Reconnecting with ``?session_id=`` resumes a
+    session until it expires; ``{"type": "close"}`` ends it.
+    """
+    await websocket.accept()
+    
+    session = session_manager.get(session_id) if session_id else None
+    if session is None:
+        session = await session_manager.create()
+    await websocket.send_json({
+        "type": "session",
+        "session_id": session.session_id,
+        "turns": session.turns
+    })
+    
+    try:
+        while True:
+            try:
+                turn = WSChatTurn(**await websocket.receive_json())
+            except (ValidationError, ValueError, TypeError) as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
+            
+            if turn.type == "close":
+                session_manager.close(session.session_id)
+                await websocket.close()
+                return
+            if not turn.content:
+                await websocket.send_json({"type": "error", "message": "content is required"})
+                continue
+            
+            messages = []
+            if turn.system and not session.state.token_ids:
+                messages.append(ChatMessage(role="system", content=turn.system))
+            messages.append(ChatMessage(role="user", content=turn.content))
+            
+            async with session.lock:
+                stats = GenerationStats()
+                try:
+                    await session_manager.ensure_resident(session)
+                    async for token in mistral_service.stream_session_turn(
+                        state=session.state,
+                        messages=messages,
+                        max_tokens=turn.max_tokens,
+                        temperature=turn.temperature,
+                        stats=stats
+                    ):
+                        await websocket.send_json({"type": "token", "content": token})
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    # stream_session_turn has already undone the turn
+                    logger.error("Session turn failed", session_id=session.session_id, error=str(e))
+                    await websocket.send_json({"type": "error", "message": str(e)})
+                    continue
+                
+                session.turns += 1
+                session.touch()
+                await websocket.send_json({
+                    "type": "done",
+                    "finish_reason": stats.finish_reason,
+                    "usage": {
+                        "prompt_tokens": stats.prompt_tokens,
+                        "completion_tokens": stats.completion_tokens,
+                        "total_tokens": stats.prompt_tokens + stats.completion_tokens
+                    },
+                    "context_tokens": len(session.state.token_ids)
+                })
+            
+            await session_manager.evict()
+    
+    except WebSocketDisconnect:
+        # The session stays resumable until its TTL runs out
+        session.touch()
+
+@router.get("/ws/chat/stats")
+async def websocket_chat_stats():
+    """Session residency, spill and restore-latency statistics"""
+    return session_manager.stats()
+
 @router.get("/stream/health")
 async def stream_health():
     return {"status": "healthy", "streaming": True}
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import asdict
+
+from app.benchmarks.replay import build_replay, describe, load_records
+from app.benchmarks.report import SLO, build_report, compare_reports, format_summary, write_csv, write_json
+from app.benchmarks.runner import BenchmarkConfig, run_benchmark, run_workload
+
+# Usage:
+#   python -m app.benchmarks run --rate 4 --requests 200 --slo-ttft 1.0 --json run.json
+#   python -m app.benchmarks replay traffic-*.htr --speed 1.5 --json replay.json
+#   python -m app.benchmarks describe traffic-*.htr
+#   python -m app.benchmarks compare baseline.json run.json
+
+def _config(args, **workload) -> BenchmarkConfig:
+    return BenchmarkConfig(
+        base_url=args.url,
+        endpoint=args.endpoint,
+        api_key=args.api_key,
+        model=args.model,
+        stream=not args.no_stream,
+        temperature=args.temperature,
+        timeout=args.timeout,
+        max_in_flight=args.max_in_flight,
+        seed=args.seed,
+        **workload
+    )
+
+def _report(args, config_dict, results, duration):
+    slo = SLO(ttft=args.slo_ttft, tpot=args.slo_tpot, e2e=args.slo_e2e)
+    report = build_report(config_dict, results, duration, slo)
+    print(format_summary(report["summary"]))
+    if args.json:
+        write_json(report, args.json)
+    if args.csv:
+        write_csv(report, args.csv)
+
+def _run(args):
+    config = _config(
+        args,
+        requests=args.requests,
+        rate=args.rate,
+        arrival=args.arrival,
+        burstiness=args.burstiness,
+        prompt_tokens=args.prompt_tokens,
+        output_tokens=args.output_tokens
+    )
+    results, duration = asyncio.run(run_benchmark(config))
+    print(f"{config.requests} requests at {config.rate} req/s ({config.arrival}) against {config.base_url}")
+    _report(args, asdict(config), results, duration)
+
+def _replay(args):
+    config = _config(args)
+    records = load_records(args.recordings)
+    workload = build_replay(
+        records,
+        speed=args.speed,
+        api_keys=args.api_keys.split(",") if args.api_keys else None,
+        cap_to_recorded_output=not args.uncapped,
+        seed=args.seed
+    )
+    results, duration = asyncio.run(run_workload(config, workload))
+    print(f"Replayed {len(workload)} recorded requests at {args.speed}x against {config.base_url}")
+    _report(args, {**asdict(config), "recordings": args.recordings, "speed": args.speed}, results, duration)
+
+def _describe(args):
+    print(json.dumps(describe(load_records(args.recordings)), indent=2))
+
+def _compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(compare_reports(baseline, candidate))
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks", description="Open-loop load generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_client_options(command):
+        command.add_argument("--url", default="http://localhost:8000")
+        command.add_argument("--endpoint", default="/v1/chat/completions")
+        command.add_argument("--api-key", default="token-abc123")
+        command.add_argument("--model", default="mistral")
+        command.add_argument("--no-stream", action="store_true")
+        command.add_argument("--temperature", type=float, default=0.7)
+        command.add_argument("--timeout", type=float, default=300.0)
+        command.add_argument("--max-in-flight", type=int, default=None)
+        command.add_argument("--seed", type=int, default=0)
+        command.add_argument("--slo-ttft", type=float, default=None, help="Seconds")
+        command.add_argument("--slo-tpot", type=float, default=None, help="Seconds per output token")
+        command.add_argument("--slo-e2e", type=float, default=None, help="Seconds")
+        command.add_argument("--json", help="Write the full report here")
+        command.add_argument("--csv", help="Write per-request rows here")
+
+    run = commands.add_parser("run", help="Run a synthetic benchmark")
+    add_client_options(run)
+    run.add_argument("--requests", type=int, default=100)
+    run.add_argument("--rate", type=float, default=2.0, help="Mean arrival rate, requests per second")
+    run.add_argument("--arrival", choices=["poisson", "constant", "gamma"], default="poisson")
+    run.add_argument("--burstiness", type=float, default=1.0, help="Gamma shape; below 1 is burstier")
+    run.add_argument("--prompt-tokens", default="lognormal:256:0.5", help="e.g. fixed:128, uniform:64:512")
+    run.add_argument("--output-tokens", default="uniform:32:256")
+    run.set_defaults(func=_run)
+
+    replay = commands.add_parser("replay", help="Replay recorded traffic")
+    add_client_options(replay)
+    replay.add_argument("recordings", nargs="+")
+    replay.add_argument("--speed", type=float, default=1.0, help="Time compression; 2.0 doubles the load")
+    replay.add_argument("--api-keys", help="Comma-separated keys that recorded tenants are mapped onto")
+    replay.add_argument("--uncapped", action="store_true", help="Send recorded max_tokens instead of recorded output length")
+    replay.set_defaults(func=_replay)
+
+    describe_cmd = commands.add_parser("describe", help="Summarize recorded traffic")
+    describe_cmd.add_argument("recordings", nargs="+")
+    describe_cmd.set_defaults(func=_describe)
+
+    compare = commands.add_parser("compare", help="Compare two JSON reports")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(func=_compare)
+
+    args = parser.parse_args()
+    # Per-request client logs would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import time
+from typing import List
+
+from app.services.backends import InferenceBackend, TransformersBackend
+from app.services.cost_model import CostModel, StepSample
+from app.services.kv_cache import KVState
+
+# Fits the simulated backend's cost model to a real checkpoint:
+#   python -m app.benchmarks.calibrate /path/to/checkpoint --out cost_model.json
+#   MODEL_BACKEND=simulated SIM_COST_MODEL_PATH=cost_model.json uvicorn app.main:app
+
+def _timed_forward(backend: InferenceBackend, batch) -> StepSample:
+    tokens = sum(len(ids) for _, ids in batch)
+    context = sum(state.kv_len + len(ids) for state, ids in batch)
+    start = time.perf_counter()
+    backend.forward(batch)
+    return StepSample(tokens=tokens, context_tokens=context, seconds=time.perf_counter() - start)
+
+def measure(
+    backend: InferenceBackend,
+    batch_sizes: List[int],
+    prompt_lengths: List[int],
+    decode_contexts: List[int],
+    repeats: int = 3
+) -> List[StepSample]:
+    """Time prefill passes over the prompt lengths and single decode steps at
+    each context length, for every batch size"""
+    samples = []
+    for batch_size in batch_sizes:
+        for length in prompt_lengths:
+            for _ in range(repeats):
+                batch = [(KVState(token_ids=[5] * length), [5] * length) for _ in range(batch_size)]
+                samples.append(_timed_forward(backend, batch))
+        for context in decode_contexts:
+            states = [KVState(token_ids=[5] * context) for _ in range(batch_size)]
+            backend.forward([(state, state.token_ids) for state in states])
+            for _ in range(repeats):
+                samples.append(_timed_forward(backend, [(state, [5]) for state in states]))
+    return samples
+
+def _ints(value: str) -> List[int]:
+    return [int(x) for x in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the simulated backend's cost model")
+    parser.add_argument("model_path")
+    parser.add_argument("--out", default="cost_model.json")
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 2, 4])
+    parser.add_argument("--prompt-lengths", type=_ints, default=[16, 64, 256])
+    parser.add_argument("--decode-contexts", type=_ints, default=[64, 512, 2048])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    backend = TransformersBackend(args.model_path)
+    backend.load()
+    # Warm up allocator and kernels before timing
+    backend.forward([(KVState(token_ids=[5] * 8), [5] * 8)])
+
+    samples = measure(backend, args.batch_sizes, args.prompt_lengths, args.decode_contexts, args.repeats)
+    model = CostModel.fit(samples)
+    model.save(args.out)
+
+    worst = max(abs(model.step_time(s.tokens, s.context_tokens) - s.seconds) / s.seconds for s in samples)
+    print(f"Fitted on {len(samples)} passes: {model}")
+    print(f"Worst relative error: {worst:.1%}; written to {args.out}")
+
+if __name__ == "__main__":
+    main()
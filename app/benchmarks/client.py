@@ -0,0 +1,108 @@
+import json
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+
+@dataclass
+class RequestResult:
+    index: int
+    scheduled: float
+    start: float = 0.0
+    ttft: Optional[float] = None
+    e2e: Optional[float] = None
+    itl: List[float] = field(default_factory=list)
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    max_tokens: int = 0
+    status: int = 0
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None and self.status == 200
+
+    @property
+    def tpot(self) -> Optional[float]:
+        """Mean time per output token after the first"""
+        if self.ttft is None or self.e2e is None or self.output_tokens < 2:
+            return None
+        return (self.e2e - self.ttft) / (self.output_tokens - 1)
+
+async def send_chat_request(
+    client: httpx.AsyncClient,
+    url: str,
+    api_key: str,
+    model: str,
+    prompt: str,
+    max_tokens: int,
+    stream: bool,
+    result: RequestResult,
+    temperature: float = 0.7
+) -> RequestResult:
+    """Issue one chat completion and record streaming-aware timings into ``result``"""
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": stream
+    }
+    headers = {"Authorization": f"Bearer {api_key}"}
+    result.max_tokens = max_tokens
+    start = time.perf_counter()
+    result.start = start
+
+    try:
+        if not stream:
+            response = await client.post(url, json=payload, headers=headers)
+            result.status = response.status_code
+            result.e2e = result.ttft = time.perf_counter() - start
+            if response.status_code != 200:
+                result.error = response.text[:200]
+                return result
+            usage = response.json().get("usage", {})
+            result.prompt_tokens = usage.get("prompt_tokens", 0)
+            result.output_tokens = usage.get("completion_tokens", 0)
+            return result
+
+        async with client.stream("POST", url, json=payload, headers=headers) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                result.error = (await response.aread()).decode()[:200]
+                return result
+
+            last = None
+            chunks = 0
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    result.error = chunk["error"].get("message", "stream error")
+                    break
+                if chunk.get("usage"):
+                    result.prompt_tokens = chunk["usage"].get("prompt_tokens", 0)
+                    result.output_tokens = chunk["usage"].get("completion_tokens", 0)
+                content = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                if not content:
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    result.ttft = now - start
+                else:
+                    result.itl.append(now - last)
+                last = now
+                chunks += 1
+
+            result.e2e = time.perf_counter() - start
+            if not result.output_tokens:
+                result.output_tokens = chunks
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+        result.e2e = time.perf_counter() - start
+    return result
@@ -0,0 +1,272 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import types
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+# In-process microbenchmarks for the request hot path, one target per
+# component:
+#   python -m app.benchmarks.micro                       run all, compare to baseline
+#   python -m app.benchmarks.micro sampler sse_chunk     run a subset
+#   python -m app.benchmarks.micro --save                record a new baseline
+# Exits with status 1 when a target regresses past its threshold.
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+DEFAULT_THRESHOLD = 0.10
+
+@dataclass
+class Target:
+    name: str
+    setup: Callable[[], Callable[[], object]]
+    threshold: Optional[float] = None
+
+TARGETS: Dict[str, Target] = {}
+
+def target(name: str, threshold: Optional[float] = None):
+    """Register ``setup``; it builds the fixtures and returns the timed call"""
+    def register(setup):
+        TARGETS[name] = Target(name, setup, threshold)
+        return setup
+    return register
+
+def _chat_history(turns: int):
+    from app.models import codec
+    messages = [codec.ChatMessage(role="system", content="You are a helpful assistant.")]
+    for i in range(turns):
+        messages.append(codec.ChatMessage(role="user", content=f"Question {i}: " + "lorem ipsum " * 40))
+        messages.append(codec.ChatMessage(role="assistant", content=f"Answer {i}: " + "dolor sit amet " * 60))
+    return messages
+
+@target("sampler")
+def _sampler():
+    import torch
+    from app.services.sampling import sample_tokens
+    logits = torch.randn(8, 32000)
+    temperatures = torch.tensor([0.7, 0.0, 1.0, 0.7, 0.2, 0.0, 0.9, 0.7])
+    return lambda: sample_tokens(logits, temperatures)
+
+@target("sampler_greedy")
+def _sampler_greedy():
+    import torch
+    from app.services.sampling import sample_tokens
+    logits = torch.randn(8, 32000)
+    temperatures = torch.zeros(8)
+    return lambda: sample_tokens(logits, temperatures)
+
+@target("sampler_masked")
+def _sampler_masked():
+    """Sampling with a token bitmask on every row, as under response_format"""
+    import torch
+    from app.services.sampling import sample_tokens
+    logits = torch.randn(8, 32000)
+    temperatures = torch.tensor([0.7, 0.0, 1.0, 0.7, 0.2, 0.0, 0.9, 0.7])
+    masks = torch.randint(-2 ** 31, 2 ** 31 - 1, (8, 1000), dtype=torch.int32)
+    return lambda: sample_tokens(logits, temperatures, masks)
+
+@target("detokenize")
+def _detokenize():
+    """Per-token decode as the engine does it; uses the MODEL_PATH tokenizer
+    when MICRO_TOKENIZER=1, the simulated one otherwise"""
+    if os.getenv("MICRO_TOKENIZER") == "1":
+        from transformers import AutoTokenizer
+        from app.config.settings import settings
+        tokenizer = AutoTokenizer.from_pretrained(settings.MODEL_PATH)
+        decode = tokenizer.decode
+    else:
+        from app.services.backends import SimulatedBackend
+        decode = SimulatedBackend().decode
+    token_ids = list(range(1000, 1064))
+    return lambda: [decode([token_id]) for token_id in token_ids]
+
+@target("sse_chunk")
+def _sse_chunk():
+    """Encoding of one streamed token chunk, as in the /v1 streaming handler"""
+    from app.models import codec
+
+    def make_chunk():
+        chunk = {
+            "id": "chatcmpl-4f1b2c3d-0000-0000-0000-000000000000",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "mistral",
+            "choices": [{"index": 0, "delta": {"content": " token"}, "finish_reason": None}]
+        }
+        return f"data: {codec.encode(chunk).decode()}\n\n"
+    return make_chunk
+
+@target("rate_limiter")
+def _rate_limiter():
+    """One check for a key with a minute of history at 1000 req/min"""
+    from app.config import security
+    limiter = security.RateLimiter()
+    now = time.time()
+    # Frozen clock for the limiter, so the history neither ages out nor
+    # shrinks across repeats
+    security.time = types.SimpleNamespace(time=lambda: now)
+    limiter.requests["api_key_bench"] = [now - i * 0.06 for i in range(999, 0, -1)]
+
+    def check():
+        # No awaits inside, so the coroutine completes on the first send
+        coro = limiter.is_rate_limited("api_key_bench", 10 ** 9)
+        try:
+            coro.send(None)
+        except StopIteration:
+            pass
+        limiter.requests["api_key_bench"].pop()
+    return check
+
+@target("format_messages")
+def _format_messages():
+    from app.services.mistral_service import MistralService
+    messages = _chat_history(20)
+    return lambda: MistralService._format_messages(None, messages)
+
+@target("fit_messages")
+def _fit_messages():
+    from app.services.context_manager import ContextManager
+    messages = _chat_history(100)
+    encoded = [[0] * (len(m.content) // 4) for m in messages]
+    context = ContextManager(8192)
+    return lambda: context.fit_messages(messages, encoded, 512)
+
+@target("request_decode")
+def _request_decode():
+    from app.codec_benchmark import build_request_body
+    from app.models import codec
+    body = build_request_body(20)
+    return lambda: codec.decode_chat_request(body)
+
+@dataclass
+class Result:
+    name: str
+    median: float
+    p25: float
+    p75: float
+    minimum: float
+    repeats: int
+    number: int
+
+def measure(fn: Callable[[], object], repeats: int, min_time: float) -> Tuple[List[float], int]:
+    """Per-call seconds for each repeat, and the calls per repeat; the loop
+    count is sized so every repeat runs for at least ``min_time``, with the
+    GC off as in timeit"""
+    for _ in range(3):
+        fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return samples, number
+
+def run_target(t: Target, repeats: int, min_time: float) -> Result:
+    samples, number = measure(t.setup(), repeats, min_time)
+    quartiles = statistics.quantiles(samples, n=4)
+    return Result(
+        name=t.name,
+        median=statistics.median(samples),
+        p25=quartiles[0],
+        p75=quartiles[2],
+        minimum=min(samples),
+        repeats=repeats,
+        number=number
+    )
+
+def machine_id() -> str:
+    return f"{platform.node()}/{platform.machine()}/{os.cpu_count()}cpu/py{platform.python_version()}"
+
+def is_regression(result: Result, baseline: dict, threshold: float) -> bool:
+    """Slower by more than ``threshold`` at the median, and the interquartile
+    ranges do not overlap, so one noisy run does not fail the suite"""
+    return result.median > baseline["median"] * (1 + threshold) and result.p25 > baseline["p75"]
+
+def _us(seconds: float) -> str:
+    return f"{seconds * 1e6:.2f}µs"
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks")
+    parser.add_argument("targets", nargs="*", help=f"Subset of: {', '.join(TARGETS)}")
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--min-time", type=float, default=0.02, help="Seconds per repeat")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown, 0.1 = 10%%")
+    parser.add_argument("--json", help="Write results here")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(unknown)}")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get("machine") != machine_id():
+            print(f"Baseline was recorded on {stored.get('machine')}; comparisons are indicative only")
+        baseline = stored["results"]
+
+    results = []
+    regressions = []
+    print(f"  {'target':<18} {'median':>11} {'iqr':>11} {'baseline':>11} {'change':>8}")
+    for name in args.targets or TARGETS:
+        t = TARGETS[name]
+        result = run_target(t, args.repeats, args.min_time)
+        results.append(result)
+        base = baseline.get(name)
+        change = ""
+        status = ""
+        if base is not None:
+            change = f"{(result.median - base['median']) / base['median'] * 100:+.1f}%"
+            if is_regression(result, base, t.threshold if t.threshold is not None else args.threshold):
+                regressions.append(name)
+                status = "  REGRESSION"
+        print(
+            f"  {name:<18} {_us(result.median):>11} {_us(result.p75 - result.p25):>11} "
+            f"{_us(base['median']) if base else '-':>11} {change:>8}{status}"
+        )
+
+    payload = {"machine": machine_id(), "results": {r.name: asdict(r) for r in results}}
+    if args.save:
+        # Saving a subset of targets keeps the others' baselines from the
+        # same machine
+        stored_results = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            if stored.get("machine") == machine_id():
+                stored_results = stored["results"]
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine_id(), "results": {**stored_results, **payload["results"]}}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(payload, f, indent=2)
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import copy
+import math
+import sys
+from typing import List
+
+import torch
+
+from app.services.quantization import QUANT_BITS, quantize_model
+
+# Accuracy check for weight-only quantization: perplexity of the full
+# precision checkpoint against its quantized copy on the same text.
+#   python -m app.benchmarks.perplexity /path/to/checkpoint --mode int4 --text eval.txt
+
+_DEFAULT_TEXT = """\
+The city council met on Tuesday to discuss the budget for the coming year. Most of the debate focused on road repairs and on whether the library should extend its opening hours.
+Photosynthesis converts light energy into chemical energy. Plants take in carbon dioxide and water and, using sunlight, produce glucose and release oxygen.
+To reset your password, open the settings page, choose the security tab and follow the link that is sent to your registered email address.
+The recipe calls for two cups of flour, a pinch of salt, one egg and enough milk to make a smooth batter. Let it rest for ten minutes before cooking.
+In 1969 the first crewed mission landed on the Moon. The astronauts collected rock samples and set up experiments before returning safely to Earth.
+"""
+
+def perplexity(model, token_ids: List[int], window: int, stride: int) -> float:
+    """Sliding-window perplexity over ``token_ids``; every token after the
+    first is scored once, with up to ``window`` tokens of context"""
+    nll, scored = 0.0, 0
+    with torch.no_grad():
+        for start in range(0, len(token_ids) - 1, stride):
+            begin = max(start + stride - window, 0)
+            end = min(start + stride, len(token_ids) - 1)
+            ids = torch.tensor([token_ids[begin:end + 1]])
+            logits = model(ids[:, :-1]).logits[0].float()
+            targets = ids[0, 1:]
+            losses = torch.nn.functional.cross_entropy(logits, targets, reduction="none")
+            new = end - max(start, begin)
+            nll += losses[-new:].sum().item()
+            scored += new
+    return math.exp(nll / scored)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare perplexity of a checkpoint before and after quantization")
+    parser.add_argument("model_path")
+    parser.add_argument("--mode", choices=sorted(QUANT_BITS), default="int8")
+    parser.add_argument("--group-size", type=int, default=128)
+    parser.add_argument("--text", help="UTF-8 text file to score (a short built-in sample by default)")
+    parser.add_argument("--window", type=int, default=512)
+    parser.add_argument("--stride", type=int, default=256)
+    parser.add_argument("--max-increase", type=float, default=0.05,
+                        help="Exit with status 1 if perplexity rises by more than this fraction")
+    args = parser.parse_args()
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    text = open(args.text, encoding="utf-8").read() if args.text else _DEFAULT_TEXT
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    token_ids = tokenizer.encode(text)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path).eval()
+
+    baseline = perplexity(model, token_ids, args.window, args.stride)
+    quantized_model = copy.deepcopy(model)
+    layers = quantize_model(quantized_model, QUANT_BITS[args.mode], args.group_size)
+    quantized = perplexity(quantized_model, token_ids, args.window, args.stride)
+
+    increase = quantized / baseline - 1
+    print(f"Scored {len(token_ids) - 1} tokens; {layers} linear layers quantized to {args.mode}")
+    print(f"  full precision  {baseline:.3f}")
+    print(f"  {args.mode:<15} {quantized:.3f}  ({increase:+.2%})")
+    if increase > args.max_increase:
+        print(f"Perplexity increase above {args.max_increase:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.benchmarks.report import percentile
+from app.benchmarks.workload import RequestSpec, synthetic_prompt
+from app.utils.traffic import TrafficRecord, read_traffic
+
+# Replays traffic recorded with TRAFFIC_RECORD_DIR. Prompts are synthesized
+# to the recorded token counts; arrivals keep their recorded spacing,
+# compressed by ``speed`` (2.0 replays a day of traffic in twelve hours,
+# i.e. at twice the load).
+
+def load_records(paths: Sequence[str]) -> List[TrafficRecord]:
+    """Records from one or more files (e.g. one per worker), by arrival"""
+    records = [record for path in paths for record in read_traffic(path)]
+    records.sort(key=lambda r: r.arrival)
+    return records
+
+def build_replay(
+    records: List[TrafficRecord],
+    speed: float = 1.0,
+    api_keys: Optional[List[str]] = None,
+    cap_to_recorded_output: bool = True,
+    seed: int = 0
+) -> List[RequestSpec]:
+    """Request schedule reproducing ``records``
+
+    With ``cap_to_recorded_output`` each request asks for as many tokens as
+    the recorded one produced, so the server does the same decode work
+    whatever the model says. Tenants are mapped onto ``api_keys``
+    consistently, keeping per-tenant limits meaningful.
+    """
+    if not records:
+        return []
+    rng = random.Random(seed)
+    start = records[0].arrival
+    tenants: Dict[int, str] = {}
+    specs = []
+    for index, record in enumerate(records):
+        api_key = None
+        if api_keys:
+            if record.tenant not in tenants:
+                tenants[record.tenant] = api_keys[len(tenants) % len(api_keys)]
+            api_key = tenants[record.tenant]
+        max_tokens = record.output_tokens if cap_to_recorded_output else record.max_tokens
+        specs.append(RequestSpec(
+            index=index,
+            arrival=(record.arrival - start) / speed,
+            prompt=synthetic_prompt(record.prompt_tokens, rng),
+            prompt_tokens=record.prompt_tokens,
+            max_tokens=max(max_tokens, 1),
+            api_key=api_key,
+            stream=record.stream
+        ))
+    return specs
+
+def describe(records: List[TrafficRecord]) -> Dict[str, Any]:
+    """Workload shape of a recording: rates, burstiness, tenants, lengths"""
+    if not records:
+        return {"requests": 0}
+    span = records[-1].arrival - records[0].arrival
+    per_minute: Dict[int, int] = {}
+    for record in records:
+        minute = int((record.arrival - records[0].arrival) // 60)
+        per_minute[minute] = per_minute.get(minute, 0) + 1
+    prompts = [r.prompt_tokens for r in records]
+    outputs = [r.output_tokens for r in records]
+    return {
+        "requests": len(records),
+        "span_s": span,
+        "mean_rps": len(records) / span if span > 0 else None,
+        "peak_rpm": max(per_minute.values()),
+        "tenants": len({r.tenant for r in records}),
+        "stream_share": sum(r.stream for r in records) / len(records),
+        "error_share": sum(r.status >= 400 for r in records) / len(records),
+        "prompt_tokens": {"p50": percentile(prompts, 50), "p99": percentile(prompts, 99)},
+        "output_tokens": {"p50": percentile(outputs, 50), "p99": percentile(outputs, 99)},
+        "recorded_ttft": {"p50": percentile([r.ttft for r in records], 50), "p99": percentile([r.ttft for r in records], 99)},
+        "recorded_e2e": {"p50": percentile([r.e2e for r in records], 50), "p99": percentile([r.e2e for r in records], 99)}
+    }
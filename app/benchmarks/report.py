@@ -0,0 +1,132 @@
+import csv
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.benchmarks.client import RequestResult
+
+PERCENTILES = (50, 90, 95, 99)
+
+@dataclass
+class SLO:
+    """Per-request latency objectives; None means unconstrained"""
+    ttft: Optional[float] = None
+    tpot: Optional[float] = None
+    e2e: Optional[float] = None
+
+    def met(self, result: RequestResult) -> bool:
+        if not result.success:
+            return False
+        if self.ttft is not None and (result.ttft is None or result.ttft > self.ttft):
+            return False
+        if self.tpot is not None and result.tpot is not None and result.tpot > self.tpot:
+            return False
+        if self.e2e is not None and (result.e2e is None or result.e2e > self.e2e):
+            return False
+        return True
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Linear-interpolated percentile, None for no samples"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def distribution(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    summary = {"mean": sum(values) / len(values) if values else None}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p)
+    summary["max"] = max(values) if values else None
+    return summary
+
+def summarize(results: List[RequestResult], duration: float, slo: SLO) -> Dict[str, Any]:
+    """Run-level metrics; rates are over the wall-clock ``duration``"""
+    ok = [r for r in results if r.success]
+    output_tokens = sum(r.output_tokens for r in ok)
+    good = sum(1 for r in results if slo.met(r))
+    return {
+        "requests": len(results),
+        "successful": len(ok),
+        "failed": len(results) - len(ok),
+        "duration_s": duration,
+        "throughput_rps": len(ok) / duration if duration > 0 else 0.0,
+        "output_tokens_per_s": output_tokens / duration if duration > 0 else 0.0,
+        "goodput_rps": good / duration if duration > 0 else 0.0,
+        "slo_attainment": good / len(results) if results else 0.0,
+        "ttft": distribution([r.ttft for r in ok if r.ttft is not None]),
+        "tpot": distribution([r.tpot for r in ok if r.tpot is not None]),
+        "itl": distribution([gap for r in ok for gap in r.itl]),
+        "e2e": distribution([r.e2e for r in ok if r.e2e is not None])
+    }
+
+def build_report(config: Dict[str, Any], results: List[RequestResult], duration: float, slo: SLO) -> Dict[str, Any]:
+    return {
+        "config": {**config, "slo": asdict(slo)},
+        "summary": summarize(results, duration, slo),
+        "requests": [
+            {
+                "index": r.index,
+                "scheduled": r.scheduled,
+                "status": r.status,
+                "error": r.error,
+                "prompt_tokens": r.prompt_tokens,
+                "max_tokens": r.max_tokens,
+                "output_tokens": r.output_tokens,
+                "ttft": r.ttft,
+                "tpot": r.tpot,
+                "e2e": r.e2e,
+                "slo_met": slo.met(r)
+            }
+            for r in results
+        ]
+    }
+
+def write_json(report: Dict[str, Any], path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+def write_csv(report: Dict[str, Any], path: str):
+    """One row per request"""
+    rows = report["requests"]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["index"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _flatten(summary: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = []
+    for key, value in _flatten(summary).items():
+        lines.append(f"  {key:<26} {_fmt(value)}")
+    return "\n".join(lines)
+
+def compare_reports(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> str:
+    """Side-by-side summary metrics of two reports with the relative change"""
+    base = _flatten(baseline["summary"])
+    cand = _flatten(candidate["summary"])
+    lines = [f"  {'metric':<26} {'baseline':>12} {'candidate':>12} {'change':>9}"]
+    for key in base:
+        before, after = base[key], cand.get(key)
+        change = ""
+        if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+            change = f"{(after - before) / before * 100:+.1f}%"
+        lines.append(f"  {key:<26} {_fmt(before):>12} {_fmt(after):>12} {change:>9}")
+    return "\n".join(lines)
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+
+from app.benchmarks.client import RequestResult, send_chat_request
+from app.benchmarks.workload import LengthDistribution, RequestSpec, build_workload
+
+@dataclass
+class BenchmarkConfig:
+    base_url: str = "http://localhost:8000"
+    endpoint: str = "/v1/chat/completions"
+    api_key: str = "token-abc123"
+    model: str = "mistral"
+    requests: int = 100
+    rate: float = 2.0
+    arrival: str = "poisson"
+    burstiness: float = 1.0
+    prompt_tokens: str = "lognormal:256:0.5"
+    output_tokens: str = "uniform:32:256"
+    stream: bool = True
+    temperature: float = 0.7
+    timeout: float = 300.0
+    max_in_flight: Optional[int] = None
+    seed: int = 0
+
+async def run_benchmark(config: BenchmarkConfig):
+    """Run a synthetic workload built from ``config``"""
+    workload = list(build_workload(
+        config.requests,
+        config.rate,
+        config.arrival,
+        LengthDistribution(config.prompt_tokens),
+        LengthDistribution(config.output_tokens),
+        seed=config.seed,
+        burstiness=config.burstiness
+    ))
+    return await run_workload(config, workload)
+
+async def run_workload(config: BenchmarkConfig, workload: List[RequestSpec]):
+    """Fire requests at their scheduled arrival times, independent of completions
+
+    Arrivals are open-loop: a slow server builds a queue instead of slowing
+    the offered load down. ``max_in_flight`` only protects the client.
+    Returns the per-request results and the wall-clock duration.
+    """
+    url = config.base_url.rstrip("/") + config.endpoint
+    gate = asyncio.Semaphore(config.max_in_flight) if config.max_in_flight else None
+    limits = httpx.Limits(max_connections=config.max_in_flight, max_keepalive_connections=config.max_in_flight)
+    results: List[RequestResult] = []
+
+    async with httpx.AsyncClient(timeout=config.timeout, limits=limits) as client:
+        async def fire(spec):
+            result = RequestResult(index=spec.index, scheduled=spec.arrival, prompt_tokens=spec.prompt_tokens)
+            results.append(result)
+            api_key = spec.api_key or config.api_key
+            stream = config.stream if spec.stream is None else spec.stream
+            if gate is None:
+                await send_chat_request(
+                    client, url, api_key, config.model, spec.prompt,
+                    spec.max_tokens, stream, result, config.temperature
+                )
+                return
+            async with gate:
+                await send_chat_request(
+                    client, url, api_key, config.model, spec.prompt,
+                    spec.max_tokens, stream, result, config.temperature
+                )
+
+        start = time.perf_counter()
+        tasks = []
+        for spec in workload:
+            delay = spec.arrival - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(spec)))
+        await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    results.sort(key=lambda r: r.index)
+    return results, duration
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# OpenAI-compatible stand-in for the inference server, for exercising the
+# benchmark harness without a model. Prefill costs ``prefill_per_token``
+# seconds per prompt word, each output token ``decode_step`` seconds, and at
+# most ``concurrency`` requests generate at once; the rest queue.
+
+def create_app(prefill_per_token: float = 0.0002, decode_step: float = 0.02, concurrency: int = 4) -> FastAPI:
+    app = FastAPI(title="hostllm benchmark stub")
+    slots = asyncio.Semaphore(concurrency)
+
+    async def generate(prompt_tokens: int, max_tokens: int):
+        async with slots:
+            await asyncio.sleep(prompt_tokens * prefill_per_token)
+            for i in range(max_tokens):
+                if i:
+                    await asyncio.sleep(decode_step)
+                yield "tok "
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(len(m["content"].split()) for m in body["messages"])
+        max_tokens = body.get("max_tokens", 16)
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max_tokens,
+            "total_tokens": prompt_tokens + max_tokens
+        }
+
+        if not body.get("stream"):
+            content = "".join([token async for token in generate(prompt_tokens, max_tokens)])
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "length"}],
+                "usage": usage
+            })
+
+        async def events():
+            def chunk(delta, finish_reason=None, usage=None):
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                if usage:
+                    data["usage"] = usage
+                return f"data: {json.dumps(data)}\n\n"
+
+            yield chunk({"role": "assistant"})
+            async for token in generate(prompt_tokens, max_tokens):
+                yield chunk({"content": token})
+            yield chunk({}, "length", usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub chat completion server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--prefill-per-token", type=float, default=0.0002)
+    parser.add_argument("--decode-step", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.prefill_per_token, args.decode_step, args.concurrency),
+        host=args.host,
+        port=args.port,
+        log_level="warning"
+    )
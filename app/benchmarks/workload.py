@@ -0,0 +1,101 @@
+import math
+import random
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+# Filler vocabulary for synthetic prompts; roughly 1.3 tokens per word with
+# the Mistral tokenizer
+_WORDS = (
+    "the model server handles streaming requests with low latency while batching "
+    "prompts of different lengths across many concurrent users and tenants"
+).split()
+TOKENS_PER_WORD = 1.3
+
+class LengthDistribution:
+    """Token-length sampler parsed from a spec string
+
+    ``fixed:N``, ``uniform:LO:HI``, ``normal:MEAN:STD``,
+    ``lognormal:MEDIAN:SIGMA`` or ``choice:A,B,C``.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        if kind == "choice":
+            self.args = [int(x) for x in args.split(",")]
+        else:
+            self.args = [float(x) for x in args.split(":")] if args else []
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "choice"):
+            raise ValueError(f"Unknown length distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> int:
+        if self.kind == "fixed":
+            value = self.args[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(self.args[0], self.args[1])
+        elif self.kind == "normal":
+            value = rng.gauss(self.args[0], self.args[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        else:
+            value = rng.choice(self.args)
+        return max(1, int(round(value)))
+
+def arrival_times(process: str, rate: float, count: int, rng: random.Random, burstiness: float = 1.0) -> List[float]:
+    """Open-loop arrival offsets (seconds) for ``count`` requests at ``rate`` req/s
+
+    ``poisson`` has exponential gaps, ``constant`` even spacing and ``gamma``
+    gamma-distributed gaps whose shape is ``burstiness`` (below 1 is burstier
+    than Poisson, above 1 smoother).
+    """
+    times = []
+    t = 0.0
+    for _ in range(count):
+        if process == "constant":
+            gap = 1.0 / rate
+        elif process == "poisson":
+            gap = rng.expovariate(rate)
+        elif process == "gamma":
+            gap = rng.gammavariate(burstiness, 1.0 / (rate * burstiness))
+        else:
+            raise ValueError(f"Unknown arrival process: {process}")
+        t += gap
+        times.append(t)
+    return times
+
+def synthetic_prompt(tokens: int, rng: random.Random) -> str:
+    words = max(1, int(tokens / TOKENS_PER_WORD))
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+@dataclass
+class RequestSpec:
+    index: int
+    arrival: float
+    prompt: str
+    prompt_tokens: int
+    max_tokens: int
+    # Overrides of the run-wide settings (replayed traffic)
+    api_key: Optional[str] = None
+    stream: Optional[bool] = None
+
+def build_workload(
+    count: int,
+    rate: float,
+    process: str,
+    prompt_lengths: LengthDistribution,
+    output_lengths: LengthDistribution,
+    seed: int = 0,
+    burstiness: float = 1.0
+) -> Iterator[RequestSpec]:
+    """Deterministic (seeded) request schedule"""
+    rng = random.Random(seed)
+    for index, arrival in enumerate(arrival_times(process, rate, count, rng, burstiness)):
+        prompt_tokens = prompt_lengths.sample(rng)
+        yield RequestSpec(
+            index=index,
+            arrival=arrival,
+            prompt=synthetic_prompt(prompt_tokens, rng),
+            prompt_tokens=prompt_tokens,
+            max_tokens=output_lengths.sample(rng)
+        )
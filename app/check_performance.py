@@ -1,3 +1,4 @@
+import os
 import requests
 import time
 import statistics
@@ -6,6 +7,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_URL = "http://localhost:8000"
 API_KEY = "token-abc123"
+MODEL = os.getenv("MODEL_NAME", "mistral")
 
 def test_single_request():
     """Test single request response time"""
@@ -15,7 +17,7 @@ def test_single_request():
     }
     
     data = {
-        "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+        "model": MODEL,
         "messages": [
             {"role": "user", "content": "What is the capital of France? Answer in one word."}
         ],
@@ -46,7 +48,7 @@ def test_concurrent_requests(num_requests=10, max_workers=5):
         }
         
         data = {
-            "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+            "model": MODEL,
             "messages": [
                 {"role": "user", "content": f"Request {i}: What is {i} + {i}? Answer with just the number."}
             ],
@@ -60,6 +62,8 @@ def test_concurrent_requests(num_requests=10, max_workers=5):
         
         return {
             "request_id": i,
+            "start_time": start_time,
+            "end_time": end_time,
             "response_time": end_time - start_time,
             "status_code": response.status_code,
             "success": response.status_code == 200
@@ -89,7 +93,7 @@ def test_different_prompt_lengths():
         }
         
         data = {
-            "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+            "model": MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 50,
             "temperature": 0.7
@@ -123,10 +127,11 @@ def analyze_results(results):
         print(f"   Max Response Time: {max(response_times):.3f}s")
         print(f"   Standard Deviation: {statistics.stdev(response_times):.3f}s")
         
-        # Calculate requests per second
-        total_time = sum(response_times)
-        rps = len(results) / total_time if total_time > 0 else 0
-        print(f"   Estimated RPS: {rps:.2f} requests/second")
+        # Requests per second over the wall-clock span of the run
+        if all("start_time" in r for r in results):
+            wall_time = max(r["end_time"] for r in results) - min(r["start_time"] for r in results)
+            rps = len(results) / wall_time if wall_time > 0 else 0
+            print(f"   Throughput: {rps:.2f} requests/second")
 
 if __name__ == "__main__":
     print("🎯 Performance Testing Mistral API Server\n")
@@ -0,0 +1,82 @@
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import codec
+from app.models.schemas import (
+    ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChoice,
+    UsageStats, ChatMessage, Role
+)
+
+def build_request_body(turns: int) -> bytes:
+    """Multi-turn chat history of the size batch clients send"""
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}: " + "lorem ipsum " * 40})
+        messages.append({"role": "assistant", "content": f"Answer {i}: " + "dolor sit amet " * 60})
+    messages.append({"role": "user", "content": "Summarise the conversation."})
+    return json.dumps({
+        "model": "mistral",
+        "messages": messages,
+        "max_tokens": 256,
+        "temperature": 0.7
+    }).encode()
+
+RESPONSE_TEXT = "consectetur adipiscing elit " * 80
+
+def pydantic_round_trip(body: bytes) -> bytes:
+    """What FastAPI did per request: json.loads + model validation, then
+    response model construction, jsonable_encoder and json.dumps"""
+    request = ChatCompletionRequest.model_validate(json.loads(body))
+    response = ChatCompletionResponse(
+        id="chatcmpl-bench",
+        created=0,
+        model=request.model,
+        choices=[
+            ChatCompletionChoice(
+                index=0,
+                message=ChatMessage(role=Role.ASSISTANT, content=RESPONSE_TEXT),
+                finish_reason="stop"
+            )
+        ],
+        usage=UsageStats(prompt_tokens=1000, completion_tokens=200, total_tokens=1200)
+    )
+    return json.dumps(jsonable_encoder(response)).encode()
+
+def codec_round_trip(body: bytes) -> bytes:
+    """Fast path used by the chat endpoints"""
+    request = codec.decode_chat_request(body)
+    response = codec.ChatCompletionResponse(
+        id="chatcmpl-bench",
+        created=0,
+        model=request.model,
+        choices=[
+            codec.ChatCompletionChoice(
+                index=0,
+                message=codec.ChatMessage(role=Role.ASSISTANT, content=RESPONSE_TEXT),
+                finish_reason="stop"
+            )
+        ],
+        usage=codec.UsageStats(prompt_tokens=1000, completion_tokens=200, total_tokens=1200)
+    )
+    return codec.encode(response)
+
+def measure(fn, body: bytes, repeat: int = 5, number: int = 200) -> float:
+    """Best-of-N per-call time in microseconds"""
+    best = min(timeit.repeat(lambda: fn(body), repeat=repeat, number=number))
+    return best / number * 1e6
+
+if __name__ == "__main__":
+    print("⚡ Chat codec per-request overhead (decode request + encode response)\n")
+    print(f"   {'turns':>6} {'bytes':>9} {'pydantic':>12} {'msgspec':>12} {'speedup':>9}")
+
+    for turns in [1, 10, 50, 200]:
+        body = build_request_body(turns)
+        assert json.loads(pydantic_round_trip(body)) == json.loads(codec_round_trip(body))
+
+        before = measure(pydantic_round_trip, body)
+        after = measure(codec_round_trip, body)
+        print(
+            f"   {turns:>6} {len(body):>9} {before:>10.1f}µs {after:>10.1f}µs {before / after:>8.1f}x"
+        )
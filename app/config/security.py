@@ -6,6 +6,8 @@ from collections import defaultdict
 import asyncio
 
 from .settings import settings
+from app.utils.monitoring import metrics
+from app.utils.tracing import span
 
 class RateLimiter:
     """Simple in-memory rate limiter"""
@@ -30,6 +32,10 @@ class APIKeyBearer(HTTPBearer):
     """API Key authentication scheme"""
     
     async def __call__(self, request: Request) -> str:
+        with span("auth"):
+            return await self._authenticate(request)
+    
+    async def _authenticate(self, request: Request) -> str:
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
         
         if credentials.scheme != "Bearer":
@@ -38,7 +44,7 @@ class APIKeyBearer(HTTPBearer):
                 detail="Invalid authentication scheme"
             )
         
-        if credentials.credentials not in settings.API_KEYS:
+        if credentials.credentials not in settings.API_KEYS and credentials.credentials not in settings.ADMIN_API_KEYS:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid API key"
@@ -49,6 +55,7 @@ class APIKeyBearer(HTTPBearer):
             f"api_key_{credentials.credentials}", 
             settings.RATE_LIMIT_PER_MINUTE
         ):
+            metrics.requests_rejected.labels(reason="rate_limited").inc()
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Rate limit exceeded"
@@ -1,5 +1,12 @@
 import os
-from typing import List
+from typing import Dict, List
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    """Parse "id=path,id=path" into a dict; a bare path is its own id"""
+    return {
+        name.strip(): (path or name).strip()
+        for name, _, path in (item.partition("=") for item in value.split(",") if item.strip())
+    }
 
 class Settings:
     """Simplified application settings without complex parsing"""
@@ -13,10 +20,82 @@ class Settings:
         
         # Model
         self.MODEL_PATH = os.getenv("MODEL_PATH", "Aadarsh183/Mentay-Files")
+        # Id of the MODEL_PATH model in requests and /v1/models; unlike the
+        # path it stays the same across hot swaps
+        self.MODEL_ID = os.getenv("MODEL_ID", "mistral")
         self.MAX_TOKENS = int(os.getenv("MAX_TOKENS", "4096"))
         self.DEFAULT_TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
         self.DEFAULT_TOP_P = float(os.getenv("TOP_P", "1.0"))
         
+        # Model backend: "transformers" (MODEL_PATH checkpoint) or "simulated"
+        # (no model; latencies from a cost model, for load tests)
+        self.MODEL_BACKEND = os.getenv("MODEL_BACKEND", "transformers")
+        # Step cost model (python -m app.benchmarks.calibrate); drives the
+        # simulated backend's latencies and the engine's preemption choices
+        self.SIM_COST_MODEL_PATH = os.getenv("SIM_COST_MODEL_PATH", "")
+        self.SIM_VOCAB_SIZE = int(os.getenv("SIM_VOCAB_SIZE", "32000"))
+        self.SIM_MEAN_OUTPUT_TOKENS = int(os.getenv("SIM_MEAN_OUTPUT_TOKENS", "0"))
+        
+        # Forward pass execution: "eager" or "torch_compile". Compiled calls
+        # pad the fed ids to the next COMPILE_BUCKETS length; every bucket is
+        # compiled at startup, with artifacts cached under COMPILE_CACHE_DIR
+        self.COMPILE_MODE = os.getenv("COMPILE_MODE", "eager")
+        compile_buckets_str = os.getenv("COMPILE_BUCKETS", "1,8,32,128,512")
+        self.COMPILE_BUCKETS = [int(size) for size in compile_buckets_str.split(",") if size.strip()]
+        self.COMPILE_CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", "/tmp/hostllm-compile")
+        
+        # Weight-only quantization: "none", "int8" (per-channel scales) or
+        # "int4" (per-group scales, QUANT_GROUP_SIZE of 32/64/128/256). The
+        # quantized weights are cached next to a local checkpoint, or under
+        # QUANT_CACHE_DIR for a hub model id or a read-only checkpoint
+        self.QUANTIZATION = os.getenv("QUANTIZATION", "none")
+        self.QUANT_GROUP_SIZE = int(os.getenv("QUANT_GROUP_SIZE", "128"))
+        self.QUANT_CACHE_DIR = os.getenv("QUANT_CACHE_DIR", "/tmp/hostllm-quant")
+        # Checkpoint hot swap (POST /admin/model/swap): seconds the old model
+        # gets to finish its in-flight sequences before they are failed
+        # (0 waits for them however long they take)
+        self.MODEL_SWAP_DRAIN_TIMEOUT_SECONDS = float(os.getenv("MODEL_SWAP_DRAIN_TIMEOUT_SECONDS", "600"))
+        
+        # Further checkpoints served next to MODEL_PATH, selected by the
+        # request's "model": comma-separated "id=path" pairs. They load on
+        # first use and are unloaded least recently used first to keep all
+        # resident weights within MODEL_MEMORY_BUDGET_MB (0: no limit); when
+        # several wait to load, the one with the most recent traffic
+        # (decaying with MODEL_TRAFFIC_HALF_LIFE_SECONDS) goes first. MODEL_PATH
+        # stays resident. With no MODELS, every request goes to MODEL_PATH
+        # whatever its "model".
+        self.MODELS = _parse_pairs(os.getenv("MODELS", ""))
+        self.MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+        self.MODEL_TRAFFIC_HALF_LIFE_SECONDS = float(os.getenv("MODEL_TRAFFIC_HALF_LIFE_SECONDS", "300"))
+        
+        # LoRA adapters of the MODEL_PATH model, selected like models by the
+        # request's "model": comma-separated "id=path" pairs of PEFT adapter
+        # directories. Up to LORA_MAX_ADAPTERS are kept in memory, least
+        # recently used out; the rest are read from disk when requested.
+        self.LORA_ADAPTERS = _parse_pairs(os.getenv("LORA_ADAPTERS", ""))
+        self.LORA_MAX_ADAPTERS = int(os.getenv("LORA_MAX_ADAPTERS", "8"))
+        
+        # Constrained decoding ("response_format"): compiled token automata
+        # kept for reuse (by count and by memory), and how deeply objects and
+        # arrays may nest where a schema leaves the value open
+        # ({"type": "json_object"}, {}). Client regexes (a "regex" format or
+        # a schema "pattern") get a smaller automaton limit; compiles run at
+        # most CONSTRAINT_MAX_CONCURRENT_COMPILES at a time and are abandoned
+        # after CONSTRAINT_COMPILE_TIMEOUT_SECONDS
+        self.CONSTRAINT_CACHE_SIZE = int(os.getenv("CONSTRAINT_CACHE_SIZE", "64"))
+        self.CONSTRAINT_CACHE_MB = int(os.getenv("CONSTRAINT_CACHE_MB", "512"))
+        self.CONSTRAINT_JSON_MAX_DEPTH = int(os.getenv("CONSTRAINT_JSON_MAX_DEPTH", "3"))
+        self.CONSTRAINT_REGEX_MAX_STATES = int(os.getenv("CONSTRAINT_REGEX_MAX_STATES", "512"))
+        self.CONSTRAINT_MAX_CONCURRENT_COMPILES = int(os.getenv("CONSTRAINT_MAX_CONCURRENT_COMPILES", "2"))
+        self.CONSTRAINT_COMPILE_TIMEOUT_SECONDS = float(os.getenv("CONSTRAINT_COMPILE_TIMEOUT_SECONDS", "10"))
+        
+        # Context: prompt + completion budget, and KV cache mode for long
+        # sequences ("full" or "sink_window")
+        self.MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "32768"))
+        self.KV_CACHE_MODE = os.getenv("KV_CACHE_MODE", "full")
+        self.KV_SINK_TOKENS = int(os.getenv("KV_SINK_TOKENS", "4"))
+        self.KV_WINDOW_TOKENS = int(os.getenv("KV_WINDOW_TOKENS", "4092"))
+        
         # Security - Handle comma-separated lists
         api_keys_str = os.getenv("API_KEYS", "token-abc123")
         self.API_KEYS = [key.strip() for key in api_keys_str.split(",") if key.strip()]
@@ -26,12 +105,80 @@ class Settings:
         
         self.RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
         
+        # API keys allowed on /admin endpoints (none by default)
+        admin_keys_str = os.getenv("ADMIN_API_KEYS", "")
+        self.ADMIN_API_KEYS = [key.strip() for key in admin_keys_str.split(",") if key.strip()]
+        
         # Monitoring
         self.ENABLE_METRICS = os.getenv("ENABLE_METRICS", "true").lower() == "true"
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         
+        # Logging pipeline: background writer, and sampling of per-request
+        # events (slow requests are always kept)
+        self.LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+        self.LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+        self.LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+        self.LOG_SLOW_REQUEST_SECONDS = float(os.getenv("LOG_SLOW_REQUEST_SECONDS", "5.0"))
+        
+        # Per-request phase tracing (Server-Timing header + /admin/traces)
+        self.ENABLE_TRACING = os.getenv("ENABLE_TRACING", "false").lower() == "true"
+        self.TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "256"))
+        self.TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR", "")
+        
+        # Per-request traffic recording for replay (empty disables)
+        self.TRAFFIC_RECORD_DIR = os.getenv("TRAFFIC_RECORD_DIR", "")
+        
+        # Event-loop lag monitor and blocking-call detector
+        self.LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+        self.LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+        
         # Performance
         self.MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "100"))
+        self.MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
         self.REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "300"))
+        # Retry-After sent with the 503s answered before the model is ready
+        self.NOT_READY_RETRY_AFTER_SECONDS = int(os.getenv("NOT_READY_RETRY_AFTER_SECONDS", "5"))
+        
+        # Admission order: "fcfs", or "sjf" (shortest predicted output first,
+        # with SCHEDULER_AGING_RATE tokens of credit per second waited)
+        self.SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "fcfs")
+        self.SCHEDULER_AGING_RATE = float(os.getenv("SCHEDULER_AGING_RATE", "50"))
+        
+        # Long prompts are prefilled PREFILL_CHUNK_TOKENS at a time alongside
+        # decode steps, with at most MAX_STEP_TOKENS fed per forward pass
+        # (0 disables either limit)
+        self.PREFILL_CHUNK_TOKENS = int(os.getenv("PREFILL_CHUNK_TOKENS", "512"))
+        self.MAX_STEP_TOKENS = int(os.getenv("MAX_STEP_TOKENS", "2048"))
+        
+        # KV positions the running batch may hold (0 = unlimited). Past it,
+        # the lowest-priority sequences are preempted: their KV cache is
+        # swapped to a host pool of KV_SWAP_POOL_MB or dropped and recomputed,
+        # whichever the cost model rates faster at KV_SWAP_BANDWIDTH_GBPS
+        self.KV_TOKEN_BUDGET = int(os.getenv("KV_TOKEN_BUDGET", "0"))
+        self.KV_SWAP_POOL_MB = int(os.getenv("KV_SWAP_POOL_MB", "4096"))
+        self.KV_SWAP_BANDWIDTH_GBPS = float(os.getenv("KV_SWAP_BANDWIDTH_GBPS", "8"))
+        
+        # Online tuning of MAX_BATCH_SIZE and MAX_STEP_TOKENS (as starting
+        # points) to keep p95 inter-token latency under the target
+        self.AUTOTUNE_ENABLED = os.getenv("AUTOTUNE_ENABLED", "false").lower() == "true"
+        self.AUTOTUNE_ITL_P95_MS = float(os.getenv("AUTOTUNE_ITL_P95_MS", "100"))
+        self.AUTOTUNE_MIN_BATCH_SIZE = int(os.getenv("AUTOTUNE_MIN_BATCH_SIZE", "1"))
+        self.AUTOTUNE_MAX_BATCH_SIZE = int(os.getenv("AUTOTUNE_MAX_BATCH_SIZE", "64"))
+        self.AUTOTUNE_MIN_STEP_TOKENS = int(os.getenv("AUTOTUNE_MIN_STEP_TOKENS", "256"))
+        self.AUTOTUNE_MAX_STEP_TOKENS = int(os.getenv("AUTOTUNE_MAX_STEP_TOKENS", "8192"))
+        self.AUTOTUNE_INTERVAL_STEPS = int(os.getenv("AUTOTUNE_INTERVAL_STEPS", "50"))
+        
+        # WebSocket chat sessions
+        self.SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "900"))
+        self.SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "2048"))
+        self.SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+        
+        # Idle session KV caches spilled to disk (fp16 or int8)
+        self.KV_SPILL_ENABLED = os.getenv("KV_SPILL_ENABLED", "true").lower() == "true"
+        self.KV_SPILL_DIR = os.getenv("KV_SPILL_DIR", "/tmp/hostllm-kv")
+        self.KV_SPILL_DTYPE = os.getenv("KV_SPILL_DTYPE", "fp16")
+        self.KV_SPILL_DISK_BUDGET_MB = int(os.getenv("KV_SPILL_DISK_BUDGET_MB", "10240"))
 
 settings = Settings()
\ No newline at end of file
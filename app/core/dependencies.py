@@ -1,7 +1,6 @@
+from app.api.dependencies import get_mistral_service as _get_ready_service
 from app.services.mistral_service import MistralService
 
 async def get_mistral_service() -> MistralService:
-    # This should return your initialized MistralService instance
-    # You might want to use a singleton pattern or dependency injection
-    from app.main import mistral_service
-    return mistral_service
\ No newline at end of file
+    # Same readiness check as the /v1 routes: 503 until the model is loaded
+    return await _get_ready_service()
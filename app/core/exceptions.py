@@ -9,19 +9,30 @@ class MistralAPIException(HTTPException):
         status_code: int,
         detail: str,
         error_code: str = None,
-        error_type: str = None
+        error_type: str = None,
+        headers: Dict[str, str] = None
     ):
-        super().__init__(status_code=status_code, detail=detail)
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
         self.error_code = error_code
         self.error_type = error_type
 
 class ModelNotLoadedException(MistralAPIException):
-    def __init__(self, detail: str = "Model is not loaded"):
+    def __init__(self, detail: str = "Model is not loaded", headers: Dict[str, str] = None):
         super().__init__(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=detail,
             error_code="model_not_loaded",
-            error_type="service_unavailable"
+            error_type="service_unavailable",
+            headers=headers
+        )
+
+class ModelNotFoundException(MistralAPIException):
+    def __init__(self, detail: str = "Model not found"):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=detail,
+            error_code="model_not_found",
+            error_type="invalid_request"
         )
 
 class ModelLoadException(MistralAPIException):
@@ -42,6 +53,15 @@ class TokenizationException(MistralAPIException):
             error_type="invalid_request"
         )
 
+class ResponseFormatException(MistralAPIException):
+    def __init__(self, detail: str = "Invalid response_format"):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail,
+            error_code="invalid_response_format",
+            error_type="invalid_request"
+        )
+
 class GenerationException(MistralAPIException):
     def __init__(self, detail: str = "Generation failed"):
         super().__init__(
@@ -5,6 +5,7 @@ import os
 
 BASE_URL = "http://localhost:8000"
 API_KEY = "token-abc123"
+MODEL = os.getenv("MODEL_NAME", "mistral")
 
 def check_server_health():
     """Check basic server health and configuration"""
@@ -27,7 +28,7 @@ def check_server_health():
     }
     
     data = {
-        "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+        "model": MODEL,
         "messages": [{"role": "user", "content": "Say hello"}],
         "max_tokens": 5,
         "temperature": 0.1
@@ -70,7 +71,7 @@ def test_concurrent_capacity(max_workers=3, total_requests=10):
         }
         
         data = {
-            "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+            "model": MODEL,
             "messages": [{"role": "user", "content": f"Request {req_id}: OK"}],
             "max_tokens": 3,
             "temperature": 0.1
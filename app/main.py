@@ -114,10 +114,19 @@
 #         reload=settings.RELOAD
 #     )
 
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import streaming
-from app.services.mistral_service import MistralService
+from fastapi.responses import JSONResponse, Response
+from app.api.endpoints import admin, chat, streaming
+from app.services.mistral_service import mistral_service
+from app.services.session_service import session_manager
+from app.utils.monitoring import render_metrics, mark_process_dead, CONTENT_TYPE_LATEST
+from app.utils.tracing import TracingMiddleware
+from app.utils.loop_monitor import loop_monitor
+from app.utils.traffic import traffic_recorder
+from app.config.settings import settings
 
 app = FastAPI(title="Mistral API", version="1.0.0")
 
@@ -130,6 +139,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request phase timing; without it tracing spans are no-ops
+if settings.ENABLE_TRACING:
+    app.add_middleware(TracingMiddleware)
+
+# OpenAI-compatible router
+app.include_router(
+    chat.router,
+    prefix="/v1",
+    tags=["chat"]
+)
+
 # Include streaming router
 app.include_router(
     streaming.router,
@@ -137,13 +157,28 @@ app.include_router(
     tags=["chat"]
 )
 
-# Global mistral service instance
-mistral_service = MistralService()
+# Operator endpoints (admin API keys only)
+app.include_router(
+    admin.router,
+    prefix="/admin",
+    tags=["admin"]
+)
 
 @app.on_event("startup")
 async def startup_event():
-    # Initialize your model here
-    await mistral_service.load_model_async()
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    
+    # Load in the background so the server answers probes meanwhile;
+    # /health/ready passes once the model is loaded and warmed up
+    mistral_service.start_loading()
+    asyncio.create_task(session_manager.run_sweeper())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    loop_monitor.stop()
+    traffic_recorder.close()
+    mark_process_dead()
 
 @app.get("/")
 async def root():
@@ -151,7 +186,31 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    """Readiness with details; 503 until the model is ready"""
+    health_status = mistral_service.get_health_status()
+    if not mistral_service.loaded:
+        return JSONResponse(status_code=503, content=health_status)
+    return {**health_status, "status": "healthy"}
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up; fails only when model loading has failed, which
+    takes a restart to fix"""
+    if mistral_service.status == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": mistral_service.load_error})
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """The model is loaded and warmed up, so requests can be routed here"""
+    if not mistral_service.loaded:
+        return JSONResponse(status_code=503, content={"status": mistral_service.status})
+    return {"status": "ready"}
+
+if settings.ENABLE_METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,109 @@
+import re
+from typing import Annotated, Any, Dict, List, Optional, Type, Union
+
+import msgspec
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+
+from app.models.schemas import Role, FinishReason
+
+# msgspec mirrors of the pydantic schemas used on the chat hot path. The
+# pydantic models stay the source of truth for the OpenAPI docs; these structs
+# carry the same fields, defaults and bounds so both accept the same payloads.
+
+class ChatMessage(msgspec.Struct):
+    role: Role
+    content: str
+    name: Optional[str] = None
+
+class ChatCompletionRequest(msgspec.Struct):
+    model: str
+    messages: List[ChatMessage]
+    max_tokens: Optional[Annotated[int, msgspec.Meta(ge=1, le=32000)]] = None
+    temperature: Optional[Annotated[float, msgspec.Meta(ge=0.0, le=2.0)]] = 0.7
+    top_p: Optional[Annotated[float, msgspec.Meta(ge=0.0, le=1.0)]] = 1.0
+    stream: Optional[bool] = False
+    stop: Optional[Union[str, List[str]]] = None
+    presence_penalty: Optional[Annotated[float, msgspec.Meta(ge=-2.0, le=2.0)]] = 0.0
+    frequency_penalty: Optional[Annotated[float, msgspec.Meta(ge=-2.0, le=2.0)]] = 0.0
+    response_format: Optional[Dict[str, Any]] = None
+
+class ChatCompletionChoice(msgspec.Struct):
+    index: int
+    message: ChatMessage
+    finish_reason: Optional[FinishReason] = None
+
+class UsageStats(msgspec.Struct):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+class ChatCompletionResponse(msgspec.Struct, kw_only=True):
+    id: str
+    object: str = "chat.completion"
+    created: int
+    model: str
+    choices: List[ChatCompletionChoice]
+    usage: UsageStats
+
+_request_decoder = msgspec.json.Decoder(ChatCompletionRequest, strict=False)
+_encoder = msgspec.json.Encoder()
+
+_ERROR_PATH = re.compile(r"^(?P<msg>.*?)(?: - at `\$(?P<path>[^`]*)`)?$")
+_PATH_PART = re.compile(r"\.(\w+)|\[(\d+)\]")
+
+def _error_loc(path: Optional[str]) -> List[Union[str, int]]:
+    """Turn a msgspec path like ``.messages[0].role`` into a FastAPI ``loc``"""
+    loc: List[Union[str, int]] = ["body"]
+    for name, index in _PATH_PART.findall(path or ""):
+        loc.append(name if name else int(index))
+    return loc
+
+def decode_chat_request(body: bytes) -> ChatCompletionRequest:
+    """Decode and validate a chat completion request body
+
+    Raises ``RequestValidationError`` so failures produce the same 422
+    response FastAPI would give for the pydantic model.
+    """
+    try:
+        return _request_decoder.decode(body)
+    except msgspec.ValidationError as e:
+        match = _ERROR_PATH.match(str(e))
+        raise RequestValidationError([{
+            "type": "value_error",
+            "loc": _error_loc(match.group("path")),
+            "msg": match.group("msg"),
+            "input": None
+        }])
+    except msgspec.DecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid",
+            "loc": ["body"],
+            "msg": f"JSON decode error: {e}",
+            "input": None
+        }])
+
+def encode(obj: Any) -> bytes:
+    """Encode a struct (or plain dict) to JSON bytes"""
+    return _encoder.encode(obj)
+
+def _inline_refs(schema: Any, defs: Dict[str, Any]) -> Any:
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if ref is not None:
+            return _inline_refs(defs[ref.rsplit("/", 1)[-1]], defs)
+        return {k: _inline_refs(v, defs) for k, v in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(v, defs) for v in schema]
+    return schema
+
+def openapi_request_body(model: Type[BaseModel]) -> Dict[str, Any]:
+    """``openapi_extra`` documenting a raw-body route with a pydantic model's schema"""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_refs(schema, defs)}}
+        }
+    }
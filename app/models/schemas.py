@@ -22,6 +22,9 @@ class ChatCompletionRequest(BaseModel):
     stop: Optional[Union[str, List[str]]] = None
     presence_penalty: Optional[float] = Field(default=0.0, ge=-2.0, le=2.0)
     frequency_penalty: Optional[float] = Field(default=0.0, ge=-2.0, le=2.0)
+    # {"type": "json_object"}, {"type": "json_schema", "json_schema": {"schema": {...}}}
+    # or {"type": "regex", "regex": "..."}: output is constrained to match
+    response_format: Optional[Dict[str, Any]] = None
 
 class FinishReason(str, Enum):
     STOP = "stop"
@@ -77,4 +80,11 @@ class ServerInfo(BaseModel):
     max_concurrent_requests: int
 
     class Config:
-        protected_namespaces = ()  # Fix protected namespace warning
\ No newline at end of file
+        protected_namespaces = ()  # Fix protected namespace warning
+
+
+class ModelSwapRequest(BaseModel):
+    model_path: str = Field(..., min_length=1)
+
+    class Config:
+        protected_namespaces = ()
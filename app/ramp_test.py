@@ -1,3 +1,4 @@
+import os
 import requests
 import time
 import statistics
@@ -5,6 +6,7 @@ from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = "http://localhost:8000"
 API_KEY = "token-abc123"
+MODEL = os.getenv("MODEL_NAME", "mistral")
 
 def ramp_up_test():
     """Gradually increase load to find breaking point"""
@@ -23,7 +25,7 @@ def ramp_up_test():
             }
             
             data = {
-                "model": "/teamspace/studios/this_studio/Mentay-Complete-Model-v1/checkpoints/checkpoint_000100/consolidated",
+                "model": MODEL,
                 "messages": [
                     {"role": "user", "content": f"Ramp test {i} at concurrency {concurrency}: Answer 'OK'"}
                 ],
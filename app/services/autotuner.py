@@ -0,0 +1,89 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.utils.monitoring import metrics
+
+class BatchAutotuner:
+    """Feedback controller for the engine's batch size and step token budget
+
+    Collects inter-token latencies and, every ``interval_steps`` passes,
+    compares their p95 over the last ``window`` tokens with ``target_itl``.
+    Over target, both limits shrink multiplicatively; comfortably under it
+    (below ``headroom`` of the target) with requests queued, they grow
+    additively. Otherwise they hold, so an idle server does not drift to its
+    maximum.
+    """
+
+    def __init__(
+        self,
+        target_itl: float,
+        batch_size: int,
+        step_tokens: int,
+        batch_bounds: Tuple[int, int],
+        step_token_bounds: Tuple[int, int],
+        interval_steps: int = 50,
+        window: int = 1024,
+        headroom: float = 0.8,
+        decrease: float = 0.75
+    ):
+        self.target_itl = target_itl
+        self.min_batch, self.max_batch = batch_bounds
+        self.min_step_tokens, self.max_step_tokens = step_token_bounds
+        self.batch_size = min(max(batch_size, self.min_batch), self.max_batch)
+        self.step_tokens = min(max(step_tokens, self.min_step_tokens), self.max_step_tokens)
+        self.interval_steps = interval_steps
+        self.headroom = headroom
+        self.decrease = decrease
+        # Additive growth of the token budget per adjustment
+        self.step_token_increment = self.min_step_tokens
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.steps = 0
+        self.last_p95: Optional[float] = None
+        self._export()
+
+    def observe(self, itl: float):
+        self.samples.append(itl)
+
+    def update(self, queue_depth: int) -> Optional[Tuple[int, int]]:
+        """Called once per pass; returns new ``(batch_size, step_tokens)`` when they change"""
+        self.steps += 1
+        if self.steps % self.interval_steps or len(self.samples) < self.interval_steps:
+            return None
+
+        p95 = float(np.percentile(self.samples, 95))
+        self.last_p95 = p95
+        metrics.autotune_itl_p95.set(p95)
+
+        if p95 > self.target_itl:
+            batch_size = max(int(self.batch_size * self.decrease), self.min_batch)
+            step_tokens = max(int(self.step_tokens * self.decrease), self.min_step_tokens)
+            direction = "down"
+        elif p95 < self.target_itl * self.headroom and queue_depth > 0:
+            batch_size = min(self.batch_size + 1, self.max_batch)
+            step_tokens = min(self.step_tokens + self.step_token_increment, self.max_step_tokens)
+            direction = "up"
+        else:
+            return None
+
+        if (batch_size, step_tokens) == (self.batch_size, self.step_tokens):
+            return None
+        self.batch_size, self.step_tokens = batch_size, step_tokens
+        # Latencies measured under the old limits no longer apply
+        self.samples.clear()
+        metrics.autotune_adjustments.labels(direction=direction).inc()
+        self._export()
+        return batch_size, step_tokens
+
+    def _export(self):
+        metrics.engine_max_batch_size.set(self.batch_size)
+        metrics.engine_max_step_tokens.set(self.step_tokens)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            "target_itl": self.target_itl,
+            "itl_p95": self.last_p95,
+            "batch_size": self.batch_size,
+            "step_tokens": self.step_tokens
+        }
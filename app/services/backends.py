@@ -0,0 +1,402 @@
+import hashlib
+import itertools
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import torch
+
+from app.services.compiled import CompiledForward
+from app.services.cost_model import CostModel
+from app.services.kv_cache import KVState, from_layers, to_layers
+from app.services.lora import AdapterBank
+from app.services.quantization import (
+    KERNELS, QUANT_BITS, cache_paths, checkpoint_fingerprint, kernels_available, load_quantized, quantize_model,
+    save_quantized
+)
+from app.utils.logging import logger
+
+# One entry per sequence in a forward pass: its state and the token ids to
+# feed, which follow the ``state.kv_len`` positions already cached
+StepInput = Tuple[KVState, List[int]]
+
+class InferenceBackend(ABC):
+    """Model execution behind MistralService
+
+    ``forward`` runs one pass over a batch of sequences, extends each
+    sequence's KV cache by the tokens it was fed and returns the next-token
+    logits of every sequence, shaped [batch, vocab].
+    """
+
+    name = "base"
+    # Underlying torch module, when there is one (RoPE parameters, etc.)
+    model: Any = None
+    vocab_size: int = 0
+    # Step latency model used for scheduling decisions, when calibrated
+    cost_model: Optional[CostModel] = None
+    # LoRA adapters sequences can select through ``state.adapter``
+    adapters: Optional[AdapterBank] = None
+    eos_tokens: Set[str] = {"</s>", "<|endoftext|>"}
+    eos_token_id: Optional[int] = None
+
+    @abstractmethod
+    def load(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def encode(self, text: str) -> List[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, token_ids: Sequence[int]) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def forward(self, batch: List[StepInput]) -> torch.Tensor:
+        raise NotImplementedError
+
+    def compile(self, buckets: List[int], cache_dir: str):
+        """Switch to a compiled forward pass and warm it up; a no-op where there is none"""
+
+    @abstractmethod
+    def tokenizer_key(self) -> str:
+        """Equal for two backends exactly when they tokenize text the same way"""
+        raise NotImplementedError
+
+    def token_strings(self) -> List[Optional[str]]:
+        """The text each token id streams as on its own; None for tokens that
+        are never part of the output, like end of sequence"""
+        return [None if i == self.eos_token_id else self.decode([i]) for i in range(self.vocab_size)]
+
+    def unload(self):
+        """Drop the weights so their memory can be reclaimed"""
+        self.model = None
+
+    def weight_bytes(self) -> int:
+        """Memory held by the model's parameters and buffers"""
+        if self.model is None:
+            return 0
+        return sum(
+            t.numel() * t.element_size()
+            for t in itertools.chain(self.model.parameters(), self.model.buffers())
+        )
+
+class TransformersBackend(InferenceBackend):
+    """Hugging Face causal LM checkpoint
+
+    Sequences in a batch keep separate caches of different lengths. The
+    decoding ones run together in one call over their left-padded caches;
+    prefill chunks get a call each, through a CompiledForward after
+    ``compile`` whenever the ids fit one of its buckets.
+
+    With ``quantization`` ("int8" or "int4") the linear layers run on
+    integer weights. They are quantized on first load and cached; later
+    loads read the cache without the full-precision weights.
+
+    ``adapters`` (name -> PEFT adapter directory) are served from an
+    AdapterBank of ``adapter_slots`` resident adapters on top of the base
+    weights, each row of the batched decode on its own adapter.
+    """
+
+    name = "transformers"
+
+    def __init__(
+        self,
+        model_path: str,
+        quantization: str = "none",
+        group_size: int = 128,
+        quant_cache_dir: str = "",
+        adapters: Optional[Dict[str, str]] = None,
+        adapter_slots: int = 8
+    ):
+        if quantization != "none" and quantization not in QUANT_BITS:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        if quantization != "none" and not kernels_available(QUANT_BITS[quantization]):
+            raise ValueError(
+                f"Quantization mode {quantization} needs torch.ops.aten.{KERNELS[QUANT_BITS[quantization]]}, "
+                f"which torch {torch.__version__} does not have"
+            )
+        self.model_path = model_path
+        self.quantization = quantization
+        self.group_size = group_size
+        self.quant_cache_dir = quant_cache_dir
+        self.adapter_paths = adapters or {}
+        self.adapter_slots = adapter_slots
+        self.model = None
+        self.tokenizer = None
+        self.compiled: Optional[CompiledForward] = None
+        # Per-sequence caches that are views into the last batched decode,
+        # and that decode's cache, attention mask and row lengths
+        self._decoded: List[Any] = []
+        self._decoded_batch: Optional[Tuple[Any, torch.Tensor, List[int]]] = None
+
+    def load(self):
+        from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        if self.quantization == "none":
+            self.model = AutoModelForCausalLM.from_pretrained(self.model_path)
+        else:
+            bits = QUANT_BITS[self.quantization]
+            paths = cache_paths(self.model_path, self.quantization, self.group_size, self.quant_cache_dir)
+            fingerprint = checkpoint_fingerprint(self.model_path)
+            config = AutoConfig.from_pretrained(self.model_path)
+            for path in paths:
+                self.model = load_quantized(config, path, bits, self.group_size, fingerprint)
+                if self.model is not None:
+                    break
+            if self.model is None:
+                self.model = AutoModelForCausalLM.from_pretrained(self.model_path)
+                layers = quantize_model(self.model, bits, self.group_size)
+                cached = None
+                for path in paths:
+                    try:
+                        save_quantized(self.model, path, fingerprint)
+                    except OSError as e:
+                        logger.warning("Could not write the quantized weight cache", path=path, error=str(e))
+                        continue
+                    cached = path
+                    break
+                logger.info("Model quantized", mode=self.quantization, layers=layers, cache=cached)
+        if self.adapter_paths:
+            self.adapters = AdapterBank(self.model, self.adapter_paths, self.adapter_slots)
+        self.model.eval()
+        self.vocab_size = self.model.config.vocab_size
+        self.eos_token_id = self.tokenizer.eos_token_id
+
+    def tokenizer_key(self) -> str:
+        vocab = sorted(self.tokenizer.get_vocab().items())
+        return hashlib.sha1(repr((type(self.tokenizer).__name__, vocab)).encode()).hexdigest()
+
+    def token_strings(self) -> List[Optional[str]]:
+        special = set(self.tokenizer.all_special_ids)
+        known = len(self.tokenizer)
+        return [
+            None if i in special or i >= known else self.decode([i])
+            for i in range(self.vocab_size)
+        ]
+
+    def unload(self):
+        self.model = None
+        self.compiled = None
+        self._decoded, self._decoded_batch = [], None
+        self.adapters = None
+
+    def encode(self, text: str) -> List[int]:
+        # The chat template already carries the <s> markers
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def decode(self, token_ids: Sequence[int]) -> str:
+        return self.tokenizer.decode(token_ids)
+
+    def forward(self, batch: List[StepInput]) -> torch.Tensor:
+        logits: List[Optional[torch.Tensor]] = [None] * len(batch)
+        decoding = [
+            row for row, (state, ids) in enumerate(batch)
+            if len(ids) == 1 and state.past_key_values is not None
+        ]
+        with torch.no_grad():
+            self._compact_departed(batch)
+            if len(decoding) > 1:
+                for row, logit in zip(decoding, self._forward_decode([batch[row] for row in decoding])):
+                    logits[row] = logit
+            else:
+                self._decoded, self._decoded_batch = [], None
+            for row, (state, ids) in enumerate(batch):
+                if logits[row] is not None:
+                    continue
+                if self.adapters is not None:
+                    self.adapters.select([state.adapter])
+                if self.compiled is not None and self.compiled.bucket(len(ids)) is not None:
+                    logit, state.past_key_values = self.compiled(ids, state.past_key_values)
+                else:
+                    outputs = self.model(
+                        torch.tensor([ids]),
+                        past_key_values=state.past_key_values,
+                        use_cache=True
+                    )
+                    state.past_key_values = outputs.past_key_values
+                    logit = outputs.logits[0, -1]
+                state.kv_len += len(ids)
+                logits[row] = logit
+        # Sampling works in fp32 whatever dtype the model runs in
+        return torch.stack(logits).float()
+
+    def _forward_decode(self, rows: List[StepInput]) -> List[torch.Tensor]:
+        """One token for each of several decoding sequences in a single call
+
+        The caches are left-padded to the longest and stacked; the attention
+        mask hides the padding and each row's position is its own cache
+        length. Each sequence's cache comes back as a view of its row of the
+        batched cache. While the same sequences keep decoding together, the
+        batched cache carries over to the next call as it is.
+        """
+        if len(rows) == len(self._decoded) and all(
+            state.past_key_values is cache for (state, _), cache in zip(rows, self._decoded)
+        ):
+            past_key_values, attention_mask, lengths = self._decoded_batch
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones(len(rows), 1)], dim=1)
+        else:
+            caches = [to_layers(state.past_key_values) for state, _ in rows]
+            lengths = [cache[0][0].shape[-2] for cache in caches]
+            width = max(lengths)
+            layers = []
+            for layer in range(len(caches[0])):
+                padded = []
+                for part in (0, 1):
+                    first = caches[0][layer][part]
+                    stacked = first.new_zeros((len(rows), first.shape[1], width, first.shape[3]))
+                    for row, cache in enumerate(caches):
+                        stacked[row, :, width - lengths[row]:] = cache[layer][part][0]
+                    padded.append(stacked)
+                layers.append(tuple(padded))
+            past_key_values = from_layers(layers)
+            attention_mask = torch.ones(len(rows), width + 1, dtype=torch.long)
+            for row, length in enumerate(lengths):
+                attention_mask[row, :width - length] = 0
+
+        if self.adapters is not None:
+            self.adapters.select([state.adapter for state, _ in rows])
+        outputs = self.model(
+            torch.tensor([ids for _, ids in rows]),
+            past_key_values=past_key_values,
+            attention_mask=attention_mask,
+            position_ids=torch.tensor([[length] for length in lengths]),
+            use_cache=True
+        )
+        lengths = [length + 1 for length in lengths]
+        width = attention_mask.shape[1]
+        batched = to_layers(outputs.past_key_values)
+        self._decoded = []
+        for row, (state, _) in enumerate(rows):
+            start = width - lengths[row]
+            state.past_key_values = from_layers([
+                (keys[row:row + 1, :, start:], values[row:row + 1, :, start:]) for keys, values in batched
+            ])
+            state.kv_len += 1
+            self._decoded.append(state.past_key_values)
+        self._decoded_batch = (outputs.past_key_values, attention_mask, lengths)
+        return list(outputs.logits[:, -1])
+
+    def _compact_departed(self, batch: List[StepInput]):
+        """Copy out the caches of sequences that left the last batched decode,
+        so a finished or preempted sequence does not keep the whole batch's
+        cache alive"""
+        current = {id(state.past_key_values) for state, _ in batch}
+        for cache in self._decoded:
+            if id(cache) not in current:
+                for layer in cache.layers:
+                    layer.keys = layer.keys.clone()
+                    layer.values = layer.values.clone()
+
+    def compile(self, buckets: List[int], cache_dir: str):
+        if self.adapters is not None:
+            # The adapter slot indices change between calls outside the
+            # compiled graph's view
+            logger.warning("Compiled forward is not used with LoRA adapters")
+            return
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id or 0
+        self.compiled = CompiledForward(self.model, buckets, cache_dir, pad_token_id, key=self.model_path)
+        self.compiled.warmup()
+
+_SIM_WORDS = (
+    "the a of to and in is that for it as with on was by be this are from at or "
+    "an model data system can which more not use time have will each one all"
+).split()
+
+def _mix(*values: int) -> int:
+    """Small deterministic integer hash"""
+    h = 0x9E3779B9
+    for v in values:
+        h = ((h ^ (v & 0xFFFFFFFF)) * 0x85EBCA6B) & 0xFFFFFFFF
+        h ^= h >> 13
+    return h
+
+class SimulatedBackend(InferenceBackend):
+    """Model-free backend for load tests on any machine
+
+    Tokens are one per whitespace-separated word and the next token is a
+    hash of the last token and its position, so a given prompt always
+    produces the same output. With ``mean_output_tokens`` set, end of
+    sequence is emitted with probability 1/mean per step, giving a geometric
+    output-length distribution; otherwise generation runs to ``max_tokens``.
+    Each pass sleeps for the time ``cost_model`` predicts for its batch.
+    """
+
+    name = "simulated"
+    EOS_ID = 2
+    eos_token_id = EOS_ID
+
+    def __init__(self, cost_model: Optional[CostModel] = None, vocab_size: int = 32000, mean_output_tokens: int = 0):
+        self.cost_model = cost_model or CostModel()
+        self.vocab_size = vocab_size
+        self.mean_output_tokens = mean_output_tokens
+
+    def load(self):
+        pass
+
+    def tokenizer_key(self) -> str:
+        return f"{self.name}-{self.vocab_size}"
+
+    def encode(self, text: str) -> List[int]:
+        return [3 + zlib.crc32(word.encode()) % (self.vocab_size - 3) for word in text.split()]
+
+    def decode(self, token_ids: Sequence[int]) -> str:
+        return "".join(
+            "</s>" if i == self.EOS_ID else f" {_SIM_WORDS[i % len(_SIM_WORDS)]}" for i in token_ids
+        )
+
+    def forward(self, batch: List[StepInput]) -> torch.Tensor:
+        tokens = sum(len(ids) for _, ids in batch)
+        context = sum(state.kv_len + len(ids) for state, ids in batch)
+        deadline = time.perf_counter() + self.cost_model.step_time(tokens, context)
+
+        logits = torch.zeros(len(batch), self.vocab_size)
+        for row, (state, ids) in enumerate(batch):
+            state.kv_len += len(ids)
+            state.past_key_values = self._cache(state.past_key_values, len(ids))
+            h = _mix(ids[-1], state.kv_len)
+            if self.mean_output_tokens and h % self.mean_output_tokens == 0:
+                next_id = self.EOS_ID
+            else:
+                next_id = 3 + h % (self.vocab_size - 3)
+            logits[row, next_id] = 50.0
+
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        return logits
+
+    @staticmethod
+    def _cache(past_key_values: Any, added: int) -> Any:
+        """Placeholder single-layer cache with one zero-stride element per position"""
+        layers = to_layers(past_key_values)
+        length = (layers[0][0].shape[-2] if layers else 0) + added
+        placeholder = torch.zeros(1, 1, 1, 1, dtype=torch.float16).expand(1, 1, length, 1)
+        return ((placeholder, placeholder),)
+
+def create_backend(name: str, model_path: str, **options) -> InferenceBackend:
+    """Backend for the MODEL_BACKEND setting"""
+    cost_model_path = options.get("cost_model_path")
+    cost_model = CostModel.load(cost_model_path) if cost_model_path else None
+    if name == "transformers":
+        backend = TransformersBackend(
+            model_path,
+            quantization=options.get("quantization", "none"),
+            group_size=options.get("quant_group_size", 128),
+            quant_cache_dir=options.get("quant_cache_dir", ""),
+            adapters=options.get("adapters"),
+            adapter_slots=options.get("adapter_slots", 8)
+        )
+        backend.cost_model = cost_model
+        return backend
+    if name == "simulated":
+        return SimulatedBackend(
+            cost_model=cost_model,
+            vocab_size=options.get("vocab_size", 32000),
+            mean_output_tokens=options.get("mean_output_tokens", 0)
+        )
+    raise ValueError(f"Unknown model backend: {name}")
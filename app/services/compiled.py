@@ -0,0 +1,64 @@
+import hashlib
+import os
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+import torch
+
+from app.utils.logging import logger
+
+class CompiledForward:
+    """torch.compile'd forward pass over padded sequence-length buckets
+
+    The ids fed in one call are right-padded to the smallest bucket that
+    holds them, so only ``len(buckets)`` input shapes ever reach the
+    compiler; the KV length stays a dynamic dimension. Padding sits after
+    the real tokens, where causal attention cannot see it, and is cropped
+    from the cache again after the call.
+
+    Inductor's artifacts go to a per-model directory under ``cache_dir``,
+    which later processes reuse instead of compiling again.
+    """
+
+    def __init__(self, model: torch.nn.Module, buckets: Sequence[int], cache_dir: str, pad_token_id: int, key: str):
+        self.buckets = sorted(set(buckets))
+        self.pad_token_id = pad_token_id
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha1(
+            f"{key}|{torch.__version__}|{self.buckets}".encode()
+        ).hexdigest()[:16])
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Read by inductor whenever it looks up its cache
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = self.cache_dir
+        self.module = torch.compile(model, dynamic=True)
+
+    def bucket(self, length: int) -> Optional[int]:
+        """Smallest bucket holding ``length`` tokens, or None if none does"""
+        for size in self.buckets:
+            if size >= length:
+                return size
+        return None
+
+    def __call__(self, ids: List[int], past_key_values: Any) -> Tuple[torch.Tensor, Any]:
+        """Next-token logits after ``ids`` and the extended cache"""
+        size = self.bucket(len(ids))
+        padding = size - len(ids)
+        outputs = self.module(
+            torch.tensor([ids + [self.pad_token_id] * padding]),
+            past_key_values=past_key_values,
+            use_cache=True
+        )
+        cache = outputs.past_key_values
+        if padding:
+            cache.crop(-padding)
+        return outputs.logits[0, len(ids) - 1], cache
+
+    def warmup(self):
+        """Compile every bucket, with and without a cache in front of it"""
+        for size in self.buckets:
+            start = time.perf_counter()
+            with torch.no_grad():
+                _, cache = self([self.pad_token_id] * size, None)
+                # Two cached calls, so the KV length is seen to vary
+                for _ in range(2):
+                    _, cache = self([self.pad_token_id] * size, cache)
+            logger.info("Compiled forward bucket warmed up", bucket=size, seconds=round(time.perf_counter() - start, 2))
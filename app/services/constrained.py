@@ -0,0 +1,813 @@
+import asyncio
+import bisect
+import json
+import re
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import torch
+
+from app.core.exceptions import ResponseFormatException
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.config.settings import settings
+
+# Constrained decoding: a request's "response_format" (a JSON schema or a
+# regex) becomes a regular expression, the expression a DFA over characters,
+# and the DFA a token automaton over the backend's vocabulary: for every
+# state, the tokens whose text keeps the output on a path to a full match,
+# and where each one leads. The allowed tokens of every state are packed
+# into int32 bitmasks once, so the sampler only gathers and applies them.
+
+MAX_CHAR = 0x10FFFF
+# Past this a pattern (usually a large min/max repetition) is refused
+MAX_DFA_STATES = 4096
+# Characters a JSON string only holds escaped
+_STRING_ESCAPED = ((0x00, 0x1F), (0x22, 0x22), (0x5C, 0x5C))
+
+# Sorted, disjoint, inclusive code point ranges
+Ranges = Tuple[Tuple[int, int], ...]
+
+def _ranges(pairs) -> Ranges:
+    merged: List[List[int]] = []
+    for low, high in sorted(pairs):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return tuple((low, high) for low, high in merged)
+
+def _negate(ranges: Ranges) -> Ranges:
+    result, start = [], 0
+    for low, high in ranges:
+        if low > start:
+            result.append((start, low - 1))
+        start = high + 1
+    if start <= MAX_CHAR:
+        result.append((start, MAX_CHAR))
+    return tuple(result)
+
+_DIGIT = ((48, 57),)
+_WORD = _ranges([(48, 57), (65, 90), (95, 95), (97, 122)])
+_SPACE = _ranges([(9, 13), (32, 32)])
+_CLASS_ESCAPES = {"d": _DIGIT, "w": _WORD, "s": _SPACE}
+_CHAR_ESCAPES = {"n": 10, "t": 9, "r": 13, "f": 12, "v": 11}
+
+class _RegexParser:
+    """Python regex syntax without backreferences, lookarounds or anchors
+    inside the pattern; the whole output must match. Nodes:
+    ("set", ranges), ("cat", [nodes]), ("alt", [nodes]), ("rep", node, min, max)
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        node = self._alternation()
+        if self.pos != len(self.pattern):
+            raise ValueError(f"Unbalanced parenthesis at position {self.pos}")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def _next(self) -> str:
+        if self.pos >= len(self.pattern):
+            raise ValueError("Unexpected end of pattern")
+        self.pos += 1
+        return self.pattern[self.pos - 1]
+
+    def _alternation(self):
+        options = [self._concatenation()]
+        while self._peek() == "|":
+            self.pos += 1
+            options.append(self._concatenation())
+        return options[0] if len(options) == 1 else ("alt", options)
+
+    def _concatenation(self):
+        items = []
+        while self._peek() not in (None, "|", ")"):
+            items.append(self._quantified())
+        return ("cat", items)
+
+    def _quantified(self):
+        node = self._atom()
+        while True:
+            ch = self._peek()
+            if ch == "*":
+                low, high, length = 0, None, 1
+            elif ch == "+":
+                low, high, length = 1, None, 1
+            elif ch == "?":
+                low, high, length = 0, 1, 1
+            elif ch == "{" and (match := re.match(r"\{(\d+)(,(\d*))?\}", self.pattern[self.pos:])):
+                low = int(match.group(1))
+                high = low if match.group(2) is None else (int(match.group(3)) if match.group(3) else None)
+                length = len(match.group(0))
+                if high is not None and high < low:
+                    raise ValueError(f"Bad repetition {match.group(0)}")
+            else:
+                return node
+            self.pos += length
+            # Lazy and greedy match the same strings
+            if self._peek() == "?":
+                self.pos += 1
+            node = ("rep", node, low, high)
+
+    def _atom(self):
+        ch = self._next()
+        if ch == "(":
+            if self.pattern.startswith("?:", self.pos):
+                self.pos += 2
+            elif self.pattern.startswith("?P<", self.pos):
+                self.pos = self.pattern.index(">", self.pos) + 1
+            elif self._peek() == "?":
+                raise ValueError("Lookarounds and inline flags are not supported")
+            node = self._alternation()
+            if self._next() != ")":
+                raise ValueError("Missing )")
+            return node
+        if ch == "[":
+            return ("set", self._class())
+        if ch == ".":
+            return ("set", _negate(((10, 10),)))
+        if ch == "\\":
+            return ("set", self._escape())
+        if ch in "^$":
+            raise ValueError("Anchors are only supported at the ends of the pattern")
+        if ch in "*+?":
+            raise ValueError(f"Nothing to repeat at position {self.pos - 1}")
+        return ("set", ((ord(ch), ord(ch)),))
+
+    def _escape(self) -> Ranges:
+        ch = self._next()
+        if ch in _CLASS_ESCAPES:
+            return _CLASS_ESCAPES[ch]
+        if ch.lower() in _CLASS_ESCAPES:
+            return _negate(_CLASS_ESCAPES[ch.lower()])
+        if ch in "xu":
+            digits = 2 if ch == "x" else 4
+            code = int(self.pattern[self.pos:self.pos + digits], 16)
+            self.pos += digits
+            return ((code, code),)
+        if ch.isalnum() and ch not in _CHAR_ESCAPES:
+            raise ValueError(f"Unsupported escape \\{ch}")
+        code = _CHAR_ESCAPES.get(ch, ord(ch))
+        return ((code, code),)
+
+    def _class_char(self) -> Ranges:
+        ch = self._next()
+        return self._escape() if ch == "\\" else ((ord(ch), ord(ch)),)
+
+    def _class(self) -> Ranges:
+        negated = self._peek() == "^"
+        if negated:
+            self.pos += 1
+        pairs: List[Tuple[int, int]] = []
+        first = True
+        while first or self._peek() != "]":
+            first = False
+            low = self._class_char()
+            if self._peek() == "-" and self.pattern[self.pos + 1:self.pos + 2] not in ("]", ""):
+                self.pos += 1
+                high = self._class_char()
+                if len(low) != 1 or len(high) != 1 or low[0][0] > high[0][1]:
+                    raise ValueError(f"Bad character range at position {self.pos}")
+                pairs.append((low[0][0], high[0][1]))
+            else:
+                pairs.extend(low)
+        self.pos += 1
+        ranges = _ranges(pairs)
+        return _negate(ranges) if negated else ranges
+
+class _NFA:
+    """Thompson construction; one accepting state"""
+
+    def __init__(self, node, max_states: int):
+        self.max_states = max_states
+        self.edges: List[List[Tuple[Ranges, int]]] = []
+        self.eps: List[List[int]] = []
+        self.start, self.end = self._build(node)
+
+    def _state(self) -> int:
+        if len(self.edges) > 50 * self.max_states:
+            raise ValueError("Pattern is too large")
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def _build(self, node) -> Tuple[int, int]:
+        kind = node[0]
+        start = self._state()
+        end = start
+        if kind == "set":
+            end = self._state()
+            self.edges[start].append((node[1], end))
+        elif kind == "cat":
+            for item in node[1]:
+                first, last = self._build(item)
+                self.eps[end].append(first)
+                end = last
+        elif kind == "alt":
+            end = self._state()
+            for option in node[1]:
+                first, last = self._build(option)
+                self.eps[start].append(first)
+                self.eps[last].append(end)
+        else:
+            _, child, low, high = node
+            for _ in range(low):
+                first, last = self._build(child)
+                self.eps[end].append(first)
+                end = last
+            exit_state = self._state()
+            if high is None:
+                first, last = self._build(child)
+                self.eps[end] += [first, exit_state]
+                self.eps[last] += [first, exit_state]
+            else:
+                for _ in range(high - low):
+                    first, last = self._build(child)
+                    self.eps[end] += [first, exit_state]
+                    end = last
+                self.eps[end].append(exit_state)
+            end = exit_state
+        return start, end
+
+class CharDFA:
+    """Deterministic automaton over characters, started in state 0
+
+    Characters are grouped into classes no transition tells apart: class
+    ``i`` is the code points from ``starts[i]`` up to the next start.
+    Only states from which a full match is still reachable are kept.
+    """
+
+    def __init__(self, starts: List[int], transitions: List[Dict[int, int]], accepting: List[bool]):
+        self.starts = starts
+        self.transitions = transitions
+        self.accepting = accepting
+
+    def char_class(self, ch: str) -> int:
+        return bisect.bisect_right(self.starts, ord(ch)) - 1
+
+    def fullmatch(self, text: str) -> bool:
+        state = 0
+        for ch in text:
+            state = self.transitions[state].get(self.char_class(ch))
+            if state is None:
+                return False
+        return self.accepting[state]
+
+    def matches_any(self, ranges: Ranges) -> bool:
+        """Whether some match contains a character from ``ranges``"""
+        for row in self.transitions:
+            for c in row:
+                low = self.starts[c]
+                high = self.starts[c + 1] - 1 if c + 1 < len(self.starts) else MAX_CHAR
+                if any(low <= r_high and r_low <= high for r_low, r_high in ranges):
+                    return True
+        return False
+
+def _check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise ValueError("Pattern takes too long to compile")
+
+def compile_regex(pattern: str, max_states: int = MAX_DFA_STATES, deadline: Optional[float] = None) -> CharDFA:
+    """The minimal DFA of ``pattern``; ValueError past ``max_states`` states
+    or the ``time.perf_counter`` ``deadline``"""
+    # The whole output is matched either way
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    if pattern.endswith("$") and not pattern.endswith("\\$"):
+        pattern = pattern[:-1]
+    nfa = _NFA(_RegexParser(pattern).parse(), max_states)
+
+    bounds = {0}
+    for edges in nfa.edges:
+        for ranges, _ in edges:
+            for low, high in ranges:
+                bounds.add(low)
+                if high < MAX_CHAR:
+                    bounds.add(high + 1)
+    starts = sorted(bounds)
+    class_edges = [
+        [
+            ([c for low, high in ranges for c in range(
+                bisect.bisect_left(starts, low),
+                bisect.bisect_left(starts, high + 1) if high < MAX_CHAR else len(starts)
+            )], target)
+            for ranges, target in edges
+        ]
+        for edges in nfa.edges
+    ]
+
+    closures: Dict[FrozenSet[int], FrozenSet[int]] = {}
+    def closure(states: FrozenSet[int]) -> FrozenSet[int]:
+        result = closures.get(states)
+        if result is None:
+            seen, stack = set(states), list(states)
+            while stack:
+                for target in nfa.eps[stack.pop()]:
+                    if target not in seen:
+                        seen.add(target)
+                        stack.append(target)
+            result = closures[states] = frozenset(seen)
+        return result
+
+    sets = [closure(frozenset([nfa.start]))]
+    index = {sets[0]: 0}
+    transitions: List[Dict[int, int]] = []
+    for current in sets:
+        _check_deadline(deadline)
+        moves: Dict[int, set] = {}
+        for state in current:
+            for classes, target in class_edges[state]:
+                for c in classes:
+                    moves.setdefault(c, set()).add(target)
+        row = {}
+        for c, targets in moves.items():
+            key = closure(frozenset(targets))
+            if key not in index:
+                if len(sets) >= max_states:
+                    raise ValueError(f"Pattern needs more than {max_states} automaton states")
+                index[key] = len(sets)
+                sets.append(key)
+            row[c] = index[key]
+        transitions.append(row)
+    accepting = [nfa.end in states for states in sets]
+
+    # Drop dead ends, so walks stop at the first character that cannot lead to a match
+    incoming: List[List[int]] = [[] for _ in sets]
+    for state, row in enumerate(transitions):
+        for target in row.values():
+            incoming[target].append(state)
+    live = {state for state, accepts in enumerate(accepting) if accepts}
+    stack = list(live)
+    while stack:
+        for source in incoming[stack.pop()]:
+            if source not in live:
+                live.add(source)
+                stack.append(source)
+    if 0 not in live:
+        raise ValueError("Pattern matches nothing")
+    order = sorted(live)
+    transitions = [{c: t for c, t in transitions[state].items() if t in live} for state in order]
+    renumber = {state: i for i, state in enumerate(order)}
+    transitions = [{c: renumber[t] for c, t in row.items()} for row in transitions]
+    return _minimize(starts, transitions, [accepting[state] for state in order], deadline)
+
+def _minimize(
+    starts: List[int],
+    transitions: List[Dict[int, int]],
+    accepting: List[bool],
+    deadline: Optional[float] = None
+) -> CharDFA:
+    """Merge states that accept the same continuations (Moore's refinement);
+    the copies a bounded repetition makes mostly collapse"""
+    blocks = [int(accepts) for accepts in accepting]
+    count = len(set(blocks))
+    while True:
+        _check_deadline(deadline)
+        signatures: Dict[tuple, int] = {}
+        refined = [
+            signatures.setdefault(
+                (blocks[state], tuple(sorted((c, blocks[t]) for c, t in row.items()))), len(signatures)
+            )
+            for state, row in enumerate(transitions)
+        ]
+        stable = len(signatures) == count
+        blocks, count = refined, len(signatures)
+        if stable:
+            break
+
+    # Block numbering follows first appearance, so state 0 stays first
+    merged: Dict[int, Dict[int, int]] = {}
+    merged_accepting: Dict[int, bool] = {}
+    for state, row in enumerate(transitions):
+        if blocks[state] not in merged:
+            merged[blocks[state]] = {c: blocks[t] for c, t in row.items()}
+            merged_accepting[blocks[state]] = accepting[state]
+    return CharDFA(starts, [merged[b] for b in range(count)], [merged_accepting[b] for b in range(count)])
+
+# JSON Schema to regex. Whitespace between tokens is limited to one space so
+# a model cannot stall the output on blanks.
+WHITESPACE = r"[ ]?"
+_STRING_CHAR = r'([^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})'
+STRING = f'"{_STRING_CHAR}*"'
+INTEGER = r"-?(0|[1-9][0-9]*)"
+NUMBER = rf"{INTEGER}(\.[0-9]+)?([eE][+-]?[0-9]+)?"
+BOOLEAN = "(true|false)"
+NULL = "null"
+_DATE = r"[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])"
+_TIME = r"([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9](\.[0-9]+)?(Z|[+-]([01][0-9]|2[0-3]):[0-5][0-9])?"
+_STRING_FORMATS = {
+    "date": _DATE,
+    "time": _TIME,
+    "date-time": f"{_DATE}T{_TIME}",
+    "uuid": r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+}
+
+def _literal(value: Any) -> str:
+    return re.escape(json.dumps(value, separators=(",", ":"), ensure_ascii=False))
+
+def _alternatives(options: List[str]) -> str:
+    return options[0] if len(options) == 1 else "(" + "|".join(options) + ")"
+
+def _array(item: str, min_items: int = 0, max_items: Optional[int] = None) -> str:
+    if max_items == 0:
+        return rf"\[{WHITESPACE}\]"
+    more = f"{{{max(min_items - 1, 0)},{'' if max_items is None else max_items - 1}}}"
+    body = f"{item}({WHITESPACE},{WHITESPACE}{item}){more}"
+    if min_items == 0:
+        body = f"({body})?"
+    return rf"\[{WHITESPACE}{body}{WHITESPACE}\]"
+
+def _open_object(value: str) -> str:
+    member = f"{STRING}{WHITESPACE}:{WHITESPACE}{value}"
+    return rf"\{{{WHITESPACE}({member}({WHITESPACE},{WHITESPACE}{member})*)?{WHITESPACE}\}}"
+
+def json_value_regex(depth: int) -> str:
+    """Any JSON value with objects and arrays nested at most ``depth`` deep"""
+    options = [STRING, NUMBER, BOOLEAN, NULL]
+    if depth > 0:
+        inner = json_value_regex(depth - 1)
+        options += [_open_object(inner), _array(inner)]
+    return _alternatives(options)
+
+class _SchemaTranslator:
+    """The subset of JSON Schema that maps onto a regular language
+
+    Object properties come out in the order the schema lists them, optional
+    ones possibly left out; additional properties are never generated.
+    Open-ended values and recursive references stop at ``max_depth`` levels
+    of objects and arrays.
+    """
+
+    def __init__(self, root: dict, max_depth: int, string_patterns: Optional[List[str]] = None):
+        self.root = root
+        self.max_depth = max_depth
+        # The client regexes of "pattern" keywords, to be checked when compiled
+        self.string_patterns = string_patterns if string_patterns is not None else []
+        self._expanding: List[Tuple[str, int]] = []
+
+    def translate(self, schema: Any, depth: int) -> str:
+        if schema is True or schema == {}:
+            return json_value_regex(depth)
+        if not isinstance(schema, dict):
+            raise ValueError(f"Unsupported schema: {schema!r}")
+        if "$ref" in schema:
+            return self._ref(schema["$ref"], depth)
+        if "const" in schema:
+            return _literal(schema["const"])
+        if "enum" in schema:
+            return _alternatives([_literal(value) for value in schema["enum"]])
+        for key in ("anyOf", "oneOf"):
+            if key in schema:
+                return _alternatives([self.translate(option, depth) for option in schema[key]])
+        if "allOf" in schema:
+            if len(schema["allOf"]) != 1:
+                raise ValueError("allOf with more than one schema is not supported")
+            return self.translate(schema["allOf"][0], depth)
+
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            return _alternatives([self.translate({**schema, "type": t}, depth) for t in kind])
+        if kind is None:
+            kind = "object" if "properties" in schema else "array" if "items" in schema else None
+        if kind is None:
+            return json_value_regex(depth)
+        if kind in ("object", "array") and depth <= 0:
+            raise ValueError(f"Schema nests objects and arrays more than {self.max_depth} levels deep")
+        if kind == "object":
+            return self._object(schema, depth - 1)
+        if kind == "array":
+            return _array(
+                self.translate(schema.get("items", {}), depth - 1),
+                int(schema.get("minItems", 0)),
+                schema.get("maxItems")
+            )
+        if kind == "string":
+            return self._string(schema)
+        if kind == "integer":
+            return INTEGER
+        if kind == "number":
+            return NUMBER
+        if kind == "boolean":
+            return BOOLEAN
+        if kind == "null":
+            return NULL
+        raise ValueError(f"Unsupported schema type: {kind}")
+
+    def _ref(self, ref: str, depth: int) -> str:
+        if not ref.startswith("#"):
+            raise ValueError(f"Only local $ref are supported: {ref}")
+        if (ref, depth) in self._expanding:
+            raise ValueError(f"$ref cycle without nesting: {ref}")
+        target: Any = self.root
+        for part in filter(None, ref[1:].split("/")):
+            target = target[part.replace("~1", "/").replace("~0", "~")]
+        self._expanding.append((ref, depth))
+        try:
+            return self.translate(target, depth)
+        finally:
+            self._expanding.pop()
+
+    def _string(self, schema: dict) -> str:
+        if "pattern" in schema:
+            pattern = schema["pattern"]
+            if pattern.startswith("^"):
+                pattern = pattern[1:]
+            if pattern.endswith("$") and not pattern.endswith("\\$"):
+                pattern = pattern[:-1]
+            self.string_patterns.append(pattern)
+            return f'"({pattern})"'
+        if schema.get("format") in _STRING_FORMATS:
+            return f'"{_STRING_FORMATS[schema["format"]]}"'
+        if "minLength" in schema or "maxLength" in schema:
+            return f'"{_STRING_CHAR}{{{int(schema.get("minLength", 0))},{schema.get("maxLength", "")}}}"'
+        return STRING
+
+    def _object(self, schema: dict, depth: int) -> str:
+        properties = schema.get("properties") or {}
+        if not properties:
+            extra = schema.get("additionalProperties", True)
+            return _open_object(self.translate(extra if isinstance(extra, dict) else {}, depth))
+
+        required = set(schema.get("required", []))
+        members = [
+            f"{WHITESPACE}{_literal(name)}{WHITESPACE}:{WHITESPACE}{self.translate(value, depth)}"
+            for name, value in properties.items()
+        ]
+        flags = [name in required for name in properties]
+        if any(flags):
+            # Commas go before the optional members after the last required
+            # one and after those before it
+            last = max(i for i, flag in enumerate(flags) if flag)
+            body = ""
+            for i, member in enumerate(members):
+                if i < last:
+                    member = f"{member}{WHITESPACE},"
+                elif i > last:
+                    member = f"{WHITESPACE},{member}"
+                body += member if flags[i] else f"({member})?"
+        else:
+            # Any subset, tried by which member comes first
+            firsts = []
+            for i, member in enumerate(members):
+                firsts.append(
+                    "".join(f"({m}{WHITESPACE},)?" for m in members[:i]) + member
+                    + "".join(f"({WHITESPACE},{m})?" for m in members[i + 1:])
+                )
+            body = f"({'|'.join(firsts)})?"
+        return rf"\{{{body}{WHITESPACE}\}}"
+
+def check_string_pattern(pattern: str, max_states: int, deadline: Optional[float] = None):
+    """ValueError unless ``pattern`` compiles within ``max_states`` and only
+    matches text that is valid unescaped inside a JSON string"""
+    if compile_regex(pattern, max_states, deadline).matches_any(_STRING_ESCAPED):
+        raise ValueError(f"pattern {pattern!r} allows quotes, backslashes or control characters")
+
+def response_format_pattern(
+    response_format: dict,
+    max_depth: int,
+    string_patterns: Optional[List[str]] = None
+) -> Optional[str]:
+    """The regex a request's ``response_format`` constrains output to; None
+    when it does not constrain it
+
+    OpenAI's {"type": "json_object"} and {"type": "json_schema",
+    "json_schema": {"schema": ...}}, plus {"type": "regex", "regex": ...}.
+    The schema's string ``pattern`` regexes are added to ``string_patterns``
+    for ``check_string_pattern``.
+    """
+    kind = response_format.get("type")
+    if kind in (None, "text"):
+        return None
+    if kind == "json_object":
+        return _open_object(json_value_regex(max_depth - 1))
+    if kind == "json_schema":
+        schema = (response_format.get("json_schema") or {}).get("schema")
+        if schema is None:
+            raise ValueError("json_schema.schema is required")
+        return _SchemaTranslator(schema, max_depth, string_patterns).translate(schema, max_depth)
+    if kind == "regex":
+        pattern = response_format.get("regex")
+        if not isinstance(pattern, str):
+            raise ValueError("regex is required")
+        return pattern
+    raise ValueError(f"Unsupported response_format type: {kind}")
+
+class Vocabulary:
+    """The text of every token of a backend, as character codes
+
+    Tokens are ordered longest first, so the ones still going at character
+    position ``j`` are the first ``active[j]``.
+    """
+
+    def __init__(self, strings: List[Optional[str]], eos_token_id: Optional[int], key: str):
+        self.size = len(strings)
+        self.eos_token_id = eos_token_id
+        self.key = key
+        order = sorted((i for i, text in enumerate(strings) if text), key=lambda i: -len(strings[i]))
+        self.token_ids = torch.tensor(order, dtype=torch.int64)
+        self.chars = sorted({ch for i in order for ch in strings[i]})
+        index = {ch: i for i, ch in enumerate(self.chars)}
+        width = len(strings[order[0]]) if order else 0
+        self.codes = torch.tensor(
+            [[index[ch] for ch in strings[i]] + [0] * (width - len(strings[i])) for i in order],
+            dtype=torch.int64
+        ).reshape(len(order), width)
+        descending = [-len(strings[i]) for i in order]
+        self.active = [bisect.bisect_right(descending, -position) for position in range(1, width + 1)]
+
+class TokenFSM:
+    """A CharDFA lifted to tokens
+
+    ``masks`` [states, words] has bit ``t % 32`` of word ``t // 32`` set in
+    row ``s`` when token ``t`` may follow state ``s``; ``next_states[s, t]``
+    is the state after it, -1 for tokens not allowed. End of sequence is
+    allowed in accepting states, and in states no token can leave so that
+    generation still ends. ``terminal`` states accept and have no way on.
+
+    Every token is walked through the DFA from every state at once, one
+    character position per gather, a block of states at a time.
+    """
+
+    BLOCK_STATES = 256
+
+    def __init__(self, dfa: CharDFA, vocabulary: Vocabulary, deadline: Optional[float] = None):
+        states, size = len(dfa.transitions), vocabulary.size
+        dead = states
+        table = torch.full((states + 1, len(dfa.starts)), dead, dtype=torch.int64)
+        for state, row in enumerate(dfa.transitions):
+            if row:
+                table[state, list(row)] = torch.tensor(list(row.values()))
+        token_classes = torch.tensor([dfa.char_class(ch) for ch in vocabulary.chars], dtype=torch.int64)
+        token_classes = token_classes[vocabulary.codes] if vocabulary.codes.numel() else vocabulary.codes
+
+        words = (size + 31) // 32
+        shifts = torch.arange(32, dtype=torch.int64)
+        accepting = torch.tensor(dfa.accepting)
+        self.next_states = torch.full((states, size), -1, dtype=torch.int16 if states < 2 ** 15 else torch.int32)
+        masks = torch.zeros(states, words, dtype=torch.int64)
+        terminal = torch.zeros(states, dtype=torch.bool)
+        for first in range(0, states, self.BLOCK_STATES):
+            _check_deadline(deadline)
+            block = torch.arange(first, min(first + self.BLOCK_STATES, states))
+            current = block.unsqueeze(1).repeat(1, len(vocabulary.token_ids))
+            for position, count in enumerate(vocabulary.active):
+                _check_deadline(deadline)
+                current[:, :count] = table[current[:, :count], token_classes[:count, position]]
+
+            allowed = torch.zeros(len(block), words * 32, dtype=torch.bool)
+            allowed[:, vocabulary.token_ids] = current != dead
+            self.next_states[block.unsqueeze(1), vocabulary.token_ids] = torch.where(
+                current != dead, current, -1
+            ).to(self.next_states.dtype)
+            leaves = allowed.any(dim=1)
+            terminal[block] = accepting[block] & ~leaves
+            if vocabulary.eos_token_id is not None:
+                allowed[:, vocabulary.eos_token_id] = accepting[block] | ~leaves
+            masks[block] = (allowed.reshape(len(block), words, 32).to(torch.int64) << shifts).sum(dim=-1)
+
+        dead_ends = int((~accepting & (self.next_states < 0).all(dim=1)).sum())
+        if dead_ends:
+            logger.warning("Constraint has states no token can continue; they end generation", states=dead_ends)
+        self.masks = torch.where(masks >= 2 ** 31, masks - 2 ** 32, masks).to(torch.int32)
+        self.terminal: List[bool] = terminal.tolist()
+
+    @property
+    def states(self) -> int:
+        return len(self.terminal)
+
+    @property
+    def nbytes(self) -> int:
+        return self.next_states.nbytes + self.masks.nbytes
+
+class Constraint:
+    """Where one sequence is in a TokenFSM"""
+
+    def __init__(self, fsm: TokenFSM):
+        self.fsm = fsm
+        self.state = 0
+
+    def mask(self) -> torch.Tensor:
+        return self.fsm.masks[self.state]
+
+    def advance(self, token_id: int):
+        state = int(self.fsm.next_states[self.state, token_id])
+        if state >= 0:
+            self.state = state
+
+    @property
+    def done(self) -> bool:
+        return self.fsm.terminal[self.state]
+
+class ConstraintCompiler:
+    """Compiles response formats into TokenFSMs, least recently used out
+
+    Automata are cached by tokenizer and pattern, so backends with the same
+    tokenizer share them, up to ``cache_size`` of them and ``cache_bytes``
+    of masks and transitions. Compilation runs on a worker thread, once per
+    key however many requests ask for it at the same time, at most
+    ``max_concurrent`` at once and each given up after ``timeout`` seconds.
+    Client regexes are held to ``max_regex_states``.
+    """
+
+    def __init__(
+        self,
+        cache_size: int,
+        max_depth: int,
+        cache_bytes: int = 0,
+        max_regex_states: int = MAX_DFA_STATES,
+        max_concurrent: int = 2,
+        timeout: float = 0.0
+    ):
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.max_depth = max_depth
+        self.max_regex_states = max_regex_states
+        self.timeout = timeout
+        self._vocabularies: "weakref.WeakKeyDictionary[Any, Vocabulary]" = weakref.WeakKeyDictionary()
+        self._fsms: "OrderedDict[Tuple[str, int, str], TokenFSM]" = OrderedDict()
+        self._bytes = 0
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def compile(self, backend, response_format: dict) -> Optional[TokenFSM]:
+        """The automaton for ``response_format`` over ``backend``'s vocabulary;
+        None when the format does not constrain output"""
+        string_patterns: List[str] = []
+        try:
+            pattern = response_format_pattern(response_format, self.max_depth, string_patterns)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise ResponseFormatException(f"Invalid response_format: {e}")
+        if pattern is None:
+            return None
+        max_states = self.max_regex_states if response_format.get("type") == "regex" else MAX_DFA_STATES
+
+        vocabulary = self._vocabularies.get(backend)
+        if vocabulary is None:
+            vocabulary = await self._once(
+                ("vocabulary", id(backend)),
+                lambda: Vocabulary(backend.token_strings(), backend.eos_token_id, backend.tokenizer_key())
+            )
+            self._vocabularies[backend] = vocabulary
+
+        key = (vocabulary.key, vocabulary.size, pattern)
+        fsm = self._fsms.get(key)
+        if fsm is not None:
+            self._fsms.move_to_end(key)
+            metrics.cache_lookups.labels(cache="token_fsm", result="hit").inc()
+            return fsm
+        metrics.cache_lookups.labels(cache="token_fsm", result="miss").inc()
+        try:
+            fsm = await self._once(
+                key, lambda: self._build(vocabulary, pattern, max_states, string_patterns), limited=True
+            )
+        except (ValueError, RecursionError) as e:
+            raise ResponseFormatException(f"Invalid response_format: {e}")
+        if key not in self._fsms:
+            self._fsms[key] = fsm
+            self._bytes += fsm.nbytes
+        while len(self._fsms) > self.cache_size or (self.cache_bytes and self._bytes > self.cache_bytes):
+            _, evicted = self._fsms.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return fsm
+
+    async def _once(self, key: Any, build: Callable[[], Any], limited: bool = False) -> Any:
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.ensure_future(self._run(build, limited))
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _run(self, build: Callable[[], Any], limited: bool) -> Any:
+        if not limited:
+            return await asyncio.to_thread(build)
+        async with self._slots:
+            return await asyncio.to_thread(build)
+
+    def _build(self, vocabulary: Vocabulary, pattern: str, max_states: int, string_patterns: List[str]) -> TokenFSM:
+        start = time.perf_counter()
+        # Checked inside the compile, since a thread cannot be interrupted
+        deadline = start + self.timeout if self.timeout else None
+        for string_pattern in string_patterns:
+            check_string_pattern(string_pattern, self.max_regex_states, deadline)
+        fsm = TokenFSM(compile_regex(pattern, max_states, deadline), vocabulary, deadline)
+        elapsed = time.perf_counter() - start
+        metrics.constraint_compile_time.observe(elapsed)
+        logger.info("Response format compiled", states=fsm.states, bytes=fsm.nbytes, seconds=round(elapsed, 3))
+        return fsm
+
+constraint_compiler = ConstraintCompiler(
+    settings.CONSTRAINT_CACHE_SIZE,
+    settings.CONSTRAINT_JSON_MAX_DEPTH,
+    cache_bytes=settings.CONSTRAINT_CACHE_MB * 1024 * 1024,
+    max_regex_states=settings.CONSTRAINT_REGEX_MAX_STATES,
+    max_concurrent=settings.CONSTRAINT_MAX_CONCURRENT_COMPILES,
+    timeout=settings.CONSTRAINT_COMPILE_TIMEOUT_SECONDS
+)
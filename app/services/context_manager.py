@@ -0,0 +1,123 @@
+from typing import Any, List, Optional, Sequence
+
+import torch
+
+from app.services.kv_cache import KVState, to_layers, from_layers
+
+class ContextManager:
+    """Keeps prompts within the model's context window
+
+    ``fit_messages`` keeps every system message plus as many of the most
+    recent turns as fit in ``max_context_tokens`` after reserving room for the
+    completion. The newest message is always kept; older turns are dropped
+    whole, oldest first.
+    """
+
+    def __init__(self, max_context_tokens: int):
+        self.max_context_tokens = max_context_tokens
+
+    def prompt_budget(self, max_new_tokens: int) -> int:
+        return max(self.max_context_tokens - max_new_tokens, 1)
+
+    def fit_messages(self, messages: Sequence[Any], encoded: List[List[int]], max_new_tokens: int) -> List[int]:
+        """Pick which messages to keep; returns their indices in order"""
+        budget = self.prompt_budget(max_new_tokens)
+        system = [i for i, msg in enumerate(messages) if msg.role == "system"]
+        used = sum(len(encoded[i]) for i in system)
+
+        kept: List[int] = []
+        for i in reversed(range(len(messages))):
+            if messages[i].role == "system":
+                continue
+            if kept and used + len(encoded[i]) > budget:
+                break
+            kept.append(i)
+            used += len(encoded[i])
+
+        # A conversation should not resume on an assistant turn
+        while len(kept) > 1 and messages[kept[-1]].role == "assistant":
+            kept.pop()
+        return sorted(system + kept)
+
+    def trim_history(self, state: KVState, new_tokens: int, max_new_tokens: int) -> int:
+        """Drop the oldest whole turns of a retained conversation until it
+        and ``new_tokens`` more fit the prompt budget; returns how many
+        tokens went. The system prompt is kept, so the caller checks that it
+        and ``new_tokens`` fit. The KV cache no longer matches and is dropped."""
+        excess = len(state.token_ids) + new_tokens - self.prompt_budget(max_new_tokens)
+        if excess <= 0:
+            return 0
+        cut = next(
+            (start for start in state.turn_starts if start - state.system_len >= excess),
+            len(state.token_ids)
+        )
+        dropped = cut - state.system_len
+        del state.token_ids[state.system_len:cut]
+        state.turn_starts = [start - dropped for start in state.turn_starts if start >= cut]
+        state.drop_cache()
+        return dropped
+
+def _rotary_inv_freq(model: Any) -> Optional[torch.Tensor]:
+    if model is None:
+        return None
+    for module in model.modules():
+        inv_freq = getattr(module, "inv_freq", None)
+        if isinstance(inv_freq, torch.Tensor):
+            return inv_freq
+    return None
+
+def _rotate_half(x: torch.Tensor) -> torch.Tensor:
+    x1, x2 = x.chunk(2, dim=-1)
+    return torch.cat((-x2, x1), dim=-1)
+
+class SinkWindowCache:
+    """Attention-sink plus sliding-window KV cache (StreamingLLM)
+
+    Once a cache grows past ``sink_tokens + window_tokens + evict_chunk``
+    positions, everything between the first ``sink_tokens`` and the most
+    recent ``window_tokens`` is evicted, so memory and per-token attention
+    cost stay bounded however long a sequence runs. Evicting in chunks keeps
+    the copy off most decode steps.
+
+    The model assigns positions from the cache length, so after eviction the
+    kept window slides down to sit right after the sinks. Its keys were
+    rotated (RoPE) at their old positions and are rotated back by the number
+    of evicted positions to stay consistent.
+    """
+
+    def __init__(self, model: Any, sink_tokens: int, window_tokens: int, evict_chunk: int = 64):
+        self.sink_tokens = sink_tokens
+        self.window_tokens = window_tokens
+        self.evict_chunk = evict_chunk
+        self.inv_freq = _rotary_inv_freq(model)
+
+    @property
+    def capacity(self) -> int:
+        return self.sink_tokens + self.window_tokens + self.evict_chunk
+
+    def _shift_keys(self, keys: torch.Tensor, shift: int) -> torch.Tensor:
+        if self.inv_freq is None:
+            return keys
+        freqs = -shift * self.inv_freq.to(torch.float32)
+        emb = torch.cat((freqs, freqs), dim=-1)
+        cos = emb.cos().to(keys.dtype)
+        sin = emb.sin().to(keys.dtype)
+        return keys * cos + _rotate_half(keys) * sin
+
+    def trim(self, state: KVState):
+        layers = to_layers(state.past_key_values)
+        if not layers:
+            return
+        cache_len = layers[0][0].shape[-2]
+        if cache_len <= self.capacity:
+            return
+
+        evicted = cache_len - self.sink_tokens - self.window_tokens
+        trimmed = []
+        for k, v in layers:
+            window_k = self._shift_keys(k[:, :, -self.window_tokens:], evicted)
+            trimmed.append((
+                torch.cat([k[:, :, :self.sink_tokens], window_k], dim=-2),
+                torch.cat([v[:, :, :self.sink_tokens], v[:, :, -self.window_tokens:]], dim=-2)
+            ))
+        state.past_key_values = from_layers(trimmed)
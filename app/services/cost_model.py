@@ -0,0 +1,49 @@
+import json
+from dataclasses import asdict, dataclass
+from typing import List
+
+import numpy as np
+
+@dataclass
+class StepSample:
+    """One measured forward pass"""
+    tokens: int
+    context_tokens: int
+    seconds: float
+
+@dataclass
+class CostModel:
+    """Latency of one forward pass over a batch
+
+    ``per_step`` is the fixed cost of a pass (weight reads, launches, Python
+    overhead) paid once per batch, ``per_token`` the compute for each token
+    fed (a whole prompt on prefill, one token per sequence on decode) and
+    ``per_context_token`` the memory-bound attention reads over every cached
+    position of every sequence in the batch. The defaults are a rough
+    starting point for a 7B model on CPU; fit real ones with
+    ``python -m app.benchmarks.calibrate``.
+    """
+    per_step: float = 0.1
+    per_token: float = 0.0015
+    per_context_token: float = 0.000002
+
+    def step_time(self, tokens: int, context_tokens: int) -> float:
+        return self.per_step + self.per_token * tokens + self.per_context_token * context_tokens
+
+    @classmethod
+    def fit(cls, samples: List[StepSample]) -> "CostModel":
+        """Least-squares fit of the three terms to measured passes"""
+        features = np.array([[1.0, s.tokens, s.context_tokens] for s in samples])
+        seconds = np.array([s.seconds for s in samples])
+        coef, *_ = np.linalg.lstsq(features, seconds, rcond=None)
+        per_step, per_token, per_context_token = (max(float(c), 0.0) for c in coef)
+        return cls(per_step=per_step, per_token=per_token, per_context_token=per_context_token)
+
+    @classmethod
+    def load(cls, path: str) -> "CostModel":
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(asdict(self), f, indent=2)
@@ -0,0 +1,524 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, List, Optional, Tuple
+
+import torch
+
+from app.core.exceptions import GenerationException, ModelNotFoundException
+from app.services.autotuner import BatchAutotuner
+from app.services.backends import InferenceBackend
+from app.services.constrained import Constraint
+from app.services.context_manager import SinkWindowCache
+from app.services.cost_model import CostModel
+from app.services.kv_cache import KVState
+from app.services.preemption import SwapPool, preemption_mode
+from app.services.sampling import sample_tokens
+from app.services.scheduler import Scheduler
+from app.utils.logging import current_sampling, logger
+from app.utils.monitoring import metrics
+from app.utils import profiler, tracing
+
+class Sequence:
+    """One generation inside the engine"""
+
+    def __init__(
+        self,
+        state: KVState,
+        max_tokens: int,
+        temperature: float,
+        stats,
+        tenant: Optional[str] = None,
+        constraint: Optional[Constraint] = None
+    ):
+        self.state = state
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stats = stats
+        self.tenant = tenant
+        # Tokens the sequence may produce next, under a response_format
+        self.constraint = constraint
+        # Output length estimate the scheduler ranks the sequence by
+        self.predicted_tokens = float(max_tokens)
+        # Trace and log sampling of the request that submitted it; the
+        # engine runs outside that request's context
+        self.trace = tracing.current_trace()
+        self.log_sampling = current_sampling()
+        self.output: asyncio.Queue = asyncio.Queue()
+        self.generated = 0
+        # Generated ids and the window of them ``detokenize`` decodes:
+        # ids before ``read_offset`` are already emitted as text
+        self.output_ids: List[int] = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.submitted = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.cancelled = False
+        # Set while preempted; ``swapped`` if the KV cache sits in the swap
+        # pool rather than being recomputed on resume
+        self.preempted_at: Optional[float] = None
+        self.swapped = False
+
+    def record(self, name: str, start: float, end: float):
+        if self.trace is not None:
+            self.trace.record(name, start, end)
+
+    def detokenize(self, decode: Callable[[List[int]], str], token_id: int, final: bool) -> str:
+        """Text that ``token_id`` adds to the output
+
+        The token is decoded together with the ones before it, since on its
+        own it loses a leading space or may be only part of a multi-byte
+        character. Text ending in an incomplete character is held back
+        until a later token completes it, or the output ends (``final``).
+        """
+        self.output_ids.append(token_id)
+        prefix = decode(self.output_ids[self.prefix_offset:self.read_offset])
+        text = decode(self.output_ids[self.prefix_offset:])
+        if not final and (len(text) <= len(prefix) or text.endswith("\ufffd")):
+            return ""
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.output_ids)
+        return text[len(prefix):]
+
+class InferenceEngine:
+    """Continuous batching over an InferenceBackend
+
+    Waiting sequences join the running batch between forward passes, up to
+    ``max_batch_size``, in the order ``scheduler`` picks, and leave it as
+    soon as they finish, so a long generation never holds a short one back.
+    Passes run on a dedicated worker thread; the event loop only moves
+    tokens to the streams.
+
+    Each pass feeds at most ``max_step_tokens``: every decoding sequence its
+    one new token, and prompts still being prefilled chunks of up to
+    ``prefill_chunk_tokens`` from what is left, so a long prompt is spread
+    over several passes instead of stalling every stream for its whole
+    prefill. A sequence emits its first token once its prompt is fully fed.
+    Zero disables either limit.
+
+    With ``kv_token_budget`` set, sequences are only admitted while the
+    running batch's token histories fit it. When decoding grows them past
+    it, the lowest-priority sequences are preempted back to the waiting
+    queue, their KV cache either moved to ``swap_pool`` or dropped to be
+    recomputed, whichever the cost model rates cheaper. Their streams just
+    pause until they are readmitted.
+
+    A sequence on a LoRA adapter is admitted once the backend's adapter
+    bank holds the adapter in a slot; until then it keeps its place in the
+    queue while others go ahead. Sequences on different adapters share
+    passes.
+
+    A sequence with a ``constraint`` (a response_format) samples only the
+    tokens its automaton allows, with the masks of the whole batch applied
+    in one operation, and finishes as soon as the output is complete.
+
+    An ``autotuner`` takes over ``max_batch_size`` and ``max_step_tokens``,
+    adjusting them between passes from the observed inter-token latency.
+
+    An engine serves one backend. To replace it, a ``clone`` is configured
+    with the new backend and takes new sequences while this one ``drain``s.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        scheduler: Optional[Scheduler] = None,
+        prefill_chunk_tokens: int = 0,
+        max_step_tokens: int = 0,
+        kv_token_budget: int = 0,
+        swap_pool: Optional[SwapPool] = None,
+        autotuner: Optional[BatchAutotuner] = None
+    ):
+        self.max_batch_size = max_batch_size
+        self.scheduler = scheduler or Scheduler()
+        self.prefill_chunk_tokens = prefill_chunk_tokens
+        self.max_step_tokens = max_step_tokens
+        self.kv_token_budget = kv_token_budget
+        self.swap_pool = swap_pool
+        self.autotuner = autotuner
+        if autotuner is not None:
+            self.max_batch_size, self.max_step_tokens = autotuner.batch_size, autotuner.step_tokens
+        self.cost_model = CostModel()
+        self.backend: Optional[InferenceBackend] = None
+        self.sink_window: Optional[SinkWindowCache] = None
+        self.waiting: List[Sequence] = []
+        self.running: List[Sequence] = []
+        self._wakeup = asyncio.Event()
+        # Set whenever nothing is queued or running
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, backend: InferenceBackend, sink_window: Optional[SinkWindowCache] = None):
+        self.backend = backend
+        self.sink_window = sink_window
+        self.cost_model = backend.cost_model or CostModel()
+
+    def clone(self) -> "InferenceEngine":
+        """An unconfigured engine with the same limits, sharing the scheduler,
+        swap pool and autotuner"""
+        return InferenceEngine(
+            self.max_batch_size,
+            self.scheduler,
+            prefill_chunk_tokens=self.prefill_chunk_tokens,
+            max_step_tokens=self.max_step_tokens,
+            kv_token_budget=self.kv_token_budget,
+            swap_pool=self.swap_pool,
+            autotuner=self.autotuner
+        )
+
+    async def generate(
+        self,
+        state: KVState,
+        max_tokens: int,
+        temperature: float,
+        stats,
+        tenant: Optional[str] = None,
+        constraint: Optional[Constraint] = None
+    ) -> AsyncGenerator[str, None]:
+        """Queue a sequence and stream its tokens as the engine produces them"""
+        seq = Sequence(state, max_tokens, temperature, stats, tenant, constraint)
+        adapters = self.backend.adapters
+        if adapters is not None and adapters.on_ready is None:
+            # Adapter reads finish on another thread
+            loop = asyncio.get_running_loop()
+            adapters.on_ready = lambda: loop.call_soon_threadsafe(lambda: self._wakeup.set())
+        stats.prompt_tokens = len(state.pending_ids())
+        self.scheduler.on_submit(seq)
+        self.waiting.append(seq)
+        self._idle.clear()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+        try:
+            while True:
+                item = await seq.output.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        except (GeneratorExit, asyncio.CancelledError):
+            seq.cancelled = True
+            metrics.requests_cancelled.inc()
+            raise
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._drop_cancelled()
+            if not self.running and not self.waiting:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._preempt()
+            self._admit()
+            if not self.running:
+                if self.waiting:
+                    # Everything waiting needs an adapter still being read
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                continue
+            batch, feeds = self._plan()
+            metrics.step_tokens.observe(sum(len(ids) for ids in feeds))
+            try:
+                results, step_start, step_end = await loop.run_in_executor(self._executor, self._step, batch, feeds)
+            except Exception as e:
+                logger.error("Engine step failed", error=str(e), batch_size=len(batch))
+                for seq in batch:
+                    self._finish(seq, error=e)
+                continue
+            self._emit(batch, results, step_start, step_end)
+
+    def _admit(self):
+        now = time.perf_counter()
+        deferred = []
+        while self.waiting and len(self.running) < self.max_batch_size:
+            seq = self.scheduler.pop_next(self.waiting, now)
+            if self.running and not self._fits(seq):
+                self.waiting.insert(0, seq)
+                break
+            try:
+                if not self._acquire_adapter(seq):
+                    deferred.append(seq)
+                    continue
+            except Exception as e:
+                logger.error("LoRA adapter unavailable", adapter=seq.state.adapter, error=str(e))
+                seq.output.put_nowait(e)
+                continue
+
+            if seq.preempted_at is not None:
+                self._resume(seq, now)
+            else:
+                metrics.queue_wait.observe(now - seq.submitted)
+                seq.record("queue", seq.submitted, now)
+                metrics.tokens.labels(kind="prompt").inc(seq.stats.prompt_tokens)
+            metrics.running_requests.inc()
+            self.running.append(seq)
+        # Still first in line once their adapter is in
+        self.waiting[:0] = deferred
+
+    def _acquire_adapter(self, seq: Sequence) -> bool:
+        if seq.state.adapter is None:
+            return True
+        if self.backend.adapters is None:
+            # Running on the base weights would answer as the wrong model
+            raise ModelNotFoundException(
+                f"LoRA adapter '{seq.state.adapter}' is not served by the {self.backend.name} backend"
+            )
+        return self.backend.adapters.acquire(seq.state.adapter)
+
+    def _release_adapter(self, seq: Sequence):
+        if seq.state.adapter is not None and self.backend.adapters is not None:
+            self.backend.adapters.release(seq.state.adapter)
+
+    def _kv_tokens(self) -> int:
+        """KV positions the running batch holds once every sequence's history is fed"""
+        return sum(len(seq.state.token_ids) for seq in self.running)
+
+    def _fits(self, seq: Sequence) -> bool:
+        if not self.kv_token_budget:
+            return True
+        return self._kv_tokens() + len(seq.state.token_ids) <= self.kv_token_budget
+
+    def _preempt(self):
+        """Move lowest-priority sequences out until the batch fits the KV budget"""
+        if not self.kv_token_budget:
+            return
+        now = time.perf_counter()
+        while len(self.running) > 1 and self._kv_tokens() > self.kv_token_budget:
+            seq = max(self.running, key=lambda s: self.scheduler.priority(s, now))
+            if self.swap_pool is not None and seq.state.past_key_values is not None:
+                mode = preemption_mode(seq.state, self.swap_pool, self.cost_model)
+            else:
+                mode = "recompute"
+            if mode == "swap":
+                self.swap_pool.swap_out(seq, seq.state)
+                seq.swapped = True
+            else:
+                seq.state.drop_cache()
+
+            self.running.remove(seq)
+            self._release_adapter(seq)
+            metrics.running_requests.dec()
+            metrics.preemptions.labels(mode=mode).inc()
+            seq.preempted_at = now
+            # Back in arrival order, ahead of anything submitted later
+            position = next((i for i, s in enumerate(self.waiting) if s.submitted > seq.submitted), len(self.waiting))
+            self.waiting.insert(position, seq)
+            logger.info(
+                "Sequence preempted",
+                mode=mode,
+                context_tokens=len(seq.state.token_ids),
+                generated=seq.generated,
+                sample=seq.log_sampling or True
+            )
+
+    def _resume(self, seq: Sequence, now: float):
+        if seq.swapped:
+            self.swap_pool.swap_in(seq, seq.state)
+            seq.swapped = False
+        seq.record("preempted", seq.preempted_at, now)
+        seq.preempted_at = None
+
+    def _drop_cancelled(self):
+        for seq in [s for s in self.running if s.cancelled]:
+            self._finish(seq)
+        if any(s.cancelled for s in self.waiting):
+            for seq in self.waiting:
+                if seq.cancelled and seq.swapped:
+                    self.swap_pool.discard(seq)
+            self.waiting = [s for s in self.waiting if not s.cancelled]
+
+    def _plan(self) -> Tuple[List[Sequence], List[List[int]]]:
+        """Sequences in the next pass and the token ids each one is fed
+
+        Decoding sequences always go; prefill chunks share what is left of
+        the step budget in admission order.
+        """
+        batch, feeds = [], []
+        budget = self.max_step_tokens or float("inf")
+        prefilling = []
+        for seq in self.running:
+            pending = seq.state.pending_ids()
+            if len(pending) == 1 and seq.generated > 0:
+                batch.append(seq)
+                feeds.append(pending)
+                budget -= 1
+            else:
+                prefilling.append((seq, pending))
+
+        for seq, pending in prefilling:
+            size = min(len(pending), self.prefill_chunk_tokens or len(pending), budget)
+            if size <= 0 and batch:
+                break
+            size = max(size, 1)
+            batch.append(seq)
+            feeds.append(pending[:size])
+            budget -= size
+        return batch, feeds
+
+    def _step(self, batch: List[Sequence], feeds: List[List[int]]) -> Tuple[List[Tuple[Optional[int], str, str, bool]], float, float]:
+        """One forward pass and sampling for ``batch`` (worker thread)
+
+        Each row gets its token, the token's own text and the text it adds
+        to the output. Sequences whose prompt is not fully fed yet get
+        ``None`` instead of a token.
+        """
+        prefilling = [seq.generated == 0 for seq in batch]
+        inputs = [(seq.state, ids) for seq, ids in zip(batch, feeds)]
+
+        step_start = time.perf_counter()
+        with profiler.phase("prefill" if any(prefilling) else "decode"):
+            logits = self.backend.forward(inputs)
+        step_end = time.perf_counter()
+
+        if self.sink_window is not None:
+            for seq in batch:
+                self.sink_window.trim(seq.state)
+
+        ready = [row for row, seq in enumerate(batch) if not seq.state.pending_ids()]
+        results: List[Tuple[Optional[int], str, str, bool]] = [(None, "", "", prefill) for prefill in prefilling]
+        if ready:
+            with profiler.phase("sampling"):
+                temperatures = torch.tensor([batch[row].temperature for row in ready])
+                constraints = [batch[row].constraint for row in ready]
+                masks = None
+                if any(c is not None for c in constraints):
+                    width = next(c for c in constraints if c is not None).mask().shape[0]
+                    unconstrained = torch.full((width,), -1, dtype=torch.int32)
+                    masks = torch.stack([c.mask() if c is not None else unconstrained for c in constraints])
+                next_ids = sample_tokens(logits[ready], temperatures, masks).tolist()
+                for constraint, token_id in zip(constraints, next_ids):
+                    if constraint is not None:
+                        constraint.advance(token_id)
+            for row, token_id in zip(ready, next_ids):
+                seq = batch[row]
+                text = seq.detokenize(self.backend.decode, token_id, seq.generated + 1 >= seq.max_tokens)
+                results[row] = (token_id, self.backend.decode([token_id]), text, prefilling[row])
+        return results, step_start, step_end
+
+    def _emit(self, batch: List[Sequence], results, step_start: float, step_end: float):
+        metrics.batch_size.observe(len(batch))
+        any_prefill = any(prefill for _, _, _, prefill in results)
+        (metrics.prefill_time if any_prefill else metrics.decode_step_time).observe(step_end - step_start)
+
+        now = time.perf_counter()
+        for seq, (token_id, token, text, prefill) in zip(batch, results):
+            seq.record("prefill" if prefill else "decode", step_start, step_end)
+            seq.record("detokenize", step_end, now)
+            if seq.cancelled:
+                self._finish(seq)
+                continue
+            if token_id is None:
+                continue
+
+            if seq.last_token_at is None:
+                metrics.time_to_first_token.observe(now - seq.submitted)
+                seq.stats.ttft = now - seq.submitted
+                seq.first_token_at = now
+            else:
+                metrics.inter_token_latency.observe(now - seq.last_token_at)
+                if self.autotuner is not None:
+                    self.autotuner.observe(now - seq.last_token_at)
+            seq.last_token_at = now
+
+            if seq.constraint is not None and token_id == self.backend.eos_token_id:
+                # End of sequence is not part of constrained output
+                self._finish(seq)
+                continue
+
+            # Only the new token is fed on the next step
+            seq.state.token_ids.append(token_id)
+            seq.generated += 1
+            seq.stats.completion_tokens = seq.generated
+            if text:
+                seq.output.put_nowait(text)
+
+            if self._should_stop(token, seq.generated, seq.max_tokens) or (seq.constraint is not None and seq.constraint.done):
+                self._finish(seq)
+
+        if self.autotuner is not None:
+            limits = self.autotuner.update(len(self.waiting))
+            if limits is not None:
+                self.max_batch_size, self.max_step_tokens = limits
+
+    def _finish(self, seq: Sequence, error: Optional[Exception] = None):
+        if seq not in self.running:
+            return
+        self.running.remove(seq)
+        self._release_adapter(seq)
+        metrics.running_requests.dec()
+        metrics.tokens.labels(kind="completion").inc(seq.generated)
+        if seq.first_token_at is not None and seq.last_token_at > seq.first_token_at:
+            metrics.tokens_per_second.observe((seq.generated - 1) / (seq.last_token_at - seq.first_token_at))
+        seq.stats.finish_reason = "length" if seq.generated >= seq.max_tokens else "stop"
+        if error is None and not seq.cancelled:
+            self.scheduler.on_finish(seq)
+        seq.output.put_nowait(error if error is not None else None)
+
+    def _should_stop(self, token: str, generated_tokens: int, max_tokens: int) -> bool:
+        """Check if generation should stop"""
+        if generated_tokens >= max_tokens:
+            return True
+        if token in self.backend.eos_tokens:
+            return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.running),
+            "waiting": len(self.waiting),
+            "max_batch_size": self.max_batch_size,
+            "policy": self.scheduler.policy,
+            "kv_tokens": self._kv_tokens(),
+            "kv_token_budget": self.kv_token_budget,
+            "swap_pool": self.swap_pool.stats() if self.swap_pool is not None else None,
+            "max_step_tokens": self.max_step_tokens,
+            "autotune": self.autotuner.stats() if self.autotuner is not None else None,
+            "lora": self.backend.adapters.stats() if self.backend is not None and self.backend.adapters is not None else None
+        }
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Let every queued and running sequence finish, then stop the worker
+        and release the backend
+
+        Sequences still unfinished after ``timeout`` seconds are failed;
+        returns how many.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            aborted = 0
+        except asyncio.TimeoutError:
+            aborted = self._abort(GenerationException("Generation aborted while the model was replaced"))
+        if self._task is not None:
+            self._task.cancel()
+        # Waits out a pass that is still on the worker thread
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self.backend = None
+        self.sink_window = None
+        return aborted
+
+    def _abort(self, error: Exception) -> int:
+        """Fail every sequence in the engine"""
+        aborted = len(self.running) + len(self.waiting)
+        for seq in list(self.running):
+            self._finish(seq, error=error)
+        for seq in self.waiting:
+            if seq.swapped:
+                self.swap_pool.discard(seq)
+            seq.output.put_nowait(error)
+        self.waiting = []
+        self._idle.set()
+        return aborted
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=True)
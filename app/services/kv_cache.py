@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+import torch
+
+# Per-layer (key, value) tensors shaped [batch, kv_heads, seq_len, head_dim]
+KVLayers = List[Tuple[torch.Tensor, torch.Tensor]]
+
+def to_layers(past_key_values: Any) -> KVLayers:
+    """Unpack a transformers cache object (or legacy tuple) into per-layer tensors"""
+    if past_key_values is None:
+        return []
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return list(past_key_values.to_legacy_cache())
+    return [(k, v) for k, v in past_key_values]
+
+def from_layers(layers: KVLayers) -> Any:
+    """Build a cache object the model accepts from per-layer tensors"""
+    if not layers:
+        return None
+    from transformers import DynamicCache
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(ddp_cache_data=layers)
+
+def kv_nbytes(past_key_values: Any) -> int:
+    """Bytes held by a KV cache"""
+    return sum(
+        k.element_size() * k.nelement() + v.element_size() * v.nelement()
+        for k, v in to_layers(past_key_values)
+    )
+
+@dataclass
+class KVState:
+    """Token history of a sequence and the KV cache covering its prefix
+
+    ``kv_len`` is the number of leading ``token_ids`` already in
+    ``past_key_values``; the rest still have to be fed to the model.
+    ``model_version`` identifies the weights the cache was computed with,
+    and ``adapter`` the LoRA adapter applied on top of them, if any.
+    ``turn_starts`` marks where each turn of a retained conversation begins
+    in ``token_ids``, so the oldest can be dropped whole; the first
+    ``system_len`` tokens are its system prompt, which is always kept.
+    """
+    token_ids: List[int] = field(default_factory=list)
+    past_key_values: Optional[Any] = None
+    kv_len: int = 0
+    model_version: int = 0
+    adapter: Optional[str] = None
+    turn_starts: List[int] = field(default_factory=list)
+    system_len: int = 0
+
+    @property
+    def nbytes(self) -> int:
+        return kv_nbytes(self.past_key_values)
+
+    def pending_ids(self) -> List[int]:
+        return self.token_ids[self.kv_len:]
+
+    def drop_cache(self):
+        """Forget the KV cache; the history is re-prefilled on next use"""
+        self.past_key_values = None
+        self.kv_len = 0
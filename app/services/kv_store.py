@@ -0,0 +1,188 @@
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+from app.services.kv_cache import KVLayers
+from app.utils.logging import logger
+
+# Spill file layout (little endian):
+#   header   magic "HKV1", version u16, dtype code u8, source dtype code u8,
+#            num_layers u32, kv_len u32
+#   shapes   per layer: batch, heads, seq_len, head_dim as u32
+#   data     per layer: keys then values, each as the encoded payload below
+# fp16 payload is the raw half-precision tensor. int8 payload is the int8
+# tensor followed by one fp16 absmax scale per (batch, head, position) row.
+
+_MAGIC = b"HKV1"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHBBII")
+_SHAPE = struct.Struct("<4I")
+
+SPILL_DTYPES = {"fp16": 0, "int8": 1}
+_TORCH_DTYPES = {0: torch.float32, 1: torch.float16, 2: torch.bfloat16}
+_TORCH_DTYPE_CODES = {dtype: code for code, dtype in _TORCH_DTYPES.items()}
+
+def _payload_nbytes(shape: Tuple[int, ...], dtype_code: int) -> int:
+    elements = int(np.prod(shape))
+    if dtype_code == SPILL_DTYPES["fp16"]:
+        return elements * 2
+    rows = elements // shape[-1]
+    return elements + rows * 2
+
+def _encode(tensor: torch.Tensor, out: np.ndarray, dtype_code: int):
+    data = tensor.detach().to("cpu", torch.float32)
+    if dtype_code == SPILL_DTYPES["fp16"]:
+        out[:] = data.to(torch.float16).numpy().reshape(-1).view(np.uint8)
+        return
+    scale = data.abs().amax(dim=-1, keepdim=True).clamp(min=1e-8) / 127.0
+    quantized = torch.round(data / scale).clamp(-127, 127).to(torch.int8)
+    elements = quantized.nelement()
+    out[:elements] = quantized.numpy().reshape(-1).view(np.uint8)
+    out[elements:] = scale.to(torch.float16).numpy().reshape(-1).view(np.uint8)
+
+def _decode(buf: np.ndarray, shape: Tuple[int, ...], dtype_code: int, dtype: torch.dtype) -> torch.Tensor:
+    if dtype_code == SPILL_DTYPES["fp16"]:
+        half = torch.from_numpy(buf.view(np.float16).reshape(shape))
+        return half.to(dtype)
+    elements = int(np.prod(shape))
+    quantized = torch.from_numpy(buf[:elements].view(np.int8).reshape(shape))
+    scale = torch.from_numpy(buf[elements:].view(np.float16).reshape(shape[:-1] + (1,)))
+    return (quantized.to(torch.float32) * scale.to(torch.float32)).to(dtype)
+
+def write_spill_file(path: str, layers: KVLayers, kv_len: int, dtype_code: int) -> int:
+    """Write KV layers to ``path`` through a memory map; returns the file size"""
+    source_dtype = layers[0][0].dtype
+    shapes = [tuple(k.shape) for k, _ in layers]
+    offset = _HEADER.size + _SHAPE.size * len(layers)
+    total = offset + sum(2 * _payload_nbytes(shape, dtype_code) for shape in shapes)
+
+    mm = np.memmap(path, dtype=np.uint8, mode="w+", shape=(total,))
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, dtype_code, _TORCH_DTYPE_CODES.get(source_dtype, 0), len(layers), kv_len
+    )
+    mm[:_HEADER.size] = np.frombuffer(header, dtype=np.uint8)
+    pos = _HEADER.size
+    for shape in shapes:
+        mm[pos:pos + _SHAPE.size] = np.frombuffer(_SHAPE.pack(*shape), dtype=np.uint8)
+        pos += _SHAPE.size
+    for (k, v), shape in zip(layers, shapes):
+        size = _payload_nbytes(shape, dtype_code)
+        for tensor in (k, v):
+            _encode(tensor, mm[pos:pos + size], dtype_code)
+            pos += size
+    mm.flush()
+    del mm
+    return total
+
+def read_spill_file(path: str) -> Tuple[KVLayers, int]:
+    """Map a spill file back into KV layers; returns ``(layers, kv_len)``"""
+    mm = np.memmap(path, dtype=np.uint8, mode="c")
+    magic, version, dtype_code, source_code, num_layers, kv_len = _HEADER.unpack_from(mm, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Not a KV spill file: {path}")
+    dtype = _TORCH_DTYPES[source_code]
+
+    pos = _HEADER.size
+    shapes = []
+    for _ in range(num_layers):
+        shapes.append(_SHAPE.unpack_from(mm, pos))
+        pos += _SHAPE.size
+    layers = []
+    for shape in shapes:
+        size = _payload_nbytes(shape, dtype_code)
+        k = _decode(mm[pos:pos + size], shape, dtype_code, dtype)
+        pos += size
+        v = _decode(mm[pos:pos + size], shape, dtype_code, dtype)
+        pos += size
+        layers.append((k, v))
+    return layers, kv_len
+
+class KVSpillStore:
+    """Cold tier for KV caches: compact memory-mapped files on local disk
+
+    Files are kept least-recently-used first and dropped once their total
+    size exceeds the disk budget; a dropped entry is simply recomputed by
+    its owner.
+    """
+
+    def __init__(self, spill_dir: str, disk_budget_bytes: int, dtype: str = "fp16"):
+        if dtype not in SPILL_DTYPES:
+            raise ValueError(f"Unsupported KV spill dtype: {dtype}")
+        self.spill_dir = spill_dir
+        self.disk_budget_bytes = disk_budget_bytes
+        self.dtype_code = SPILL_DTYPES[dtype]
+        self.files: "OrderedDict[str, int]" = OrderedDict()
+        self.spills = 0
+        self.restores = 0
+        self.dropped = 0
+        self.last_restore_ms: Optional[float] = None
+        self._restore_ms_total = 0.0
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.kv")
+
+    def disk_bytes(self) -> int:
+        return sum(self.files.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.files
+
+    def spill(self, key: str, layers: KVLayers, kv_len: int):
+        """Write ``layers`` for ``key`` and enforce the disk budget"""
+        start = time.perf_counter()
+        size = write_spill_file(self._path(key), layers, kv_len, self.dtype_code)
+        self.files[key] = size
+        self.files.move_to_end(key)
+        self.spills += 1
+        logger.info(
+            "KV cache spilled",
+            key=key,
+            bytes=size,
+            kv_len=kv_len,
+            write_ms=round((time.perf_counter() - start) * 1000, 2),
+            sample=True
+        )
+
+        while self.disk_bytes() > self.disk_budget_bytes and len(self.files) > 1:
+            oldest = next(iter(self.files))
+            self.discard(oldest)
+            self.dropped += 1
+
+    def restore(self, key: str) -> Optional[Tuple[KVLayers, int]]:
+        """Map ``key`` back into memory and remove its file, or None if it was dropped"""
+        if key not in self.files:
+            return None
+        start = time.perf_counter()
+        layers, kv_len = read_spill_file(self._path(key))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.discard(key)
+
+        self.restores += 1
+        self.last_restore_ms = elapsed_ms
+        self._restore_ms_total += elapsed_ms
+        logger.info("KV cache restored", key=key, kv_len=kv_len, restore_ms=round(elapsed_ms, 2), sample=True)
+        return layers, kv_len
+
+    def discard(self, key: str):
+        if self.files.pop(key, None) is not None:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "files": len(self.files),
+            "disk_bytes": self.disk_bytes(),
+            "spills": self.spills,
+            "restores": self.restores,
+            "dropped": self.dropped,
+            "last_restore_ms": self.last_restore_ms,
+            "avg_restore_ms": self._restore_ms_total / self.restores if self.restores else None
+        }
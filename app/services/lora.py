@@ -0,0 +1,199 @@
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+from torch import nn
+
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+
+# Multi-LoRA serving: adapters in the PEFT layout (adapter_config.json plus
+# adapter_model.safetensors or .bin) applied on top of one base model.
+# Every targeted linear layer keeps a bank of adapter slots, and each row of
+# a forward call picks its slot, so sequences on different adapters share
+# the engine's passes.
+
+# (lora_A [rank, in], lora_B [out, rank]) per module name of the base model
+AdapterWeights = Dict[str, Tuple[torch.Tensor, torch.Tensor]]
+
+class LoRALinear(nn.Module):
+    """A linear layer plus a per-row low-rank update from a bank of adapters
+
+    ``lora_a`` [slots, in, rank] and ``lora_b`` [slots, rank, out] hold one
+    adapter per slot, zero-padded to the bank's rank and with the scaling
+    folded into ``lora_b``. Slot 0 stays zero: the base model. Row ``i`` of
+    the input gets the update of slot ``bank.indices[i]``, computed with two
+    batched matmuls over the gathered slots.
+    """
+
+    def __init__(self, base: nn.Module, bank: "AdapterBank", slots: int, rank: int, dtype: torch.dtype):
+        super().__init__()
+        self.base = base
+        self.in_features = base.in_features
+        self.out_features = base.out_features
+        # Not a submodule: the bank spans the whole model
+        self.__dict__["bank"] = bank
+        self.register_buffer("lora_a", torch.zeros(slots + 1, self.in_features, rank, dtype=dtype), persistent=False)
+        self.register_buffer("lora_b", torch.zeros(slots + 1, rank, self.out_features, dtype=dtype), persistent=False)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = self.base(x)
+        indices = self.bank.indices
+        if indices is None:
+            return out
+        shape = x.shape
+        a = self.lora_a.index_select(0, indices)
+        b = self.lora_b.index_select(0, indices)
+        update = torch.bmm(torch.bmm(x.reshape(shape[0], -1, shape[-1]).to(a.dtype), a), b)
+        return out + update.reshape(*shape[:-1], self.out_features).to(out.dtype)
+
+def read_adapter_config(path: str) -> dict:
+    with open(os.path.join(path, "adapter_config.json")) as f:
+        config = json.load(f)
+    targets = config.get("target_modules") or []
+    if isinstance(targets, str):
+        raise ValueError(f"Adapter {path}: regex target_modules are not supported")
+    return {
+        "rank": int(config["r"]),
+        "alpha": float(config.get("lora_alpha", config["r"])),
+        "rslora": bool(config.get("use_rslora", False)),
+        "targets": set(targets)
+    }
+
+def read_adapter_weights(path: str) -> AdapterWeights:
+    """LoRA matrices of a PEFT adapter directory, keyed by base module name"""
+    safetensors_path = os.path.join(path, "adapter_model.safetensors")
+    if os.path.exists(safetensors_path):
+        from safetensors.torch import load_file
+        tensors = load_file(safetensors_path)
+    else:
+        tensors = torch.load(os.path.join(path, "adapter_model.bin"), map_location="cpu", weights_only=True)
+
+    weights: Dict[str, Dict[str, torch.Tensor]] = {}
+    for key, tensor in tensors.items():
+        for part in ("lora_A", "lora_B"):
+            marker = f".{part}."
+            if marker in key:
+                module = key.split(marker)[0]
+                module = module[len("base_model.model."):] if module.startswith("base_model.model.") else module
+                weights.setdefault(module, {})[part] = tensor
+    return {module: (parts["lora_A"], parts["lora_B"]) for module, parts in weights.items() if len(parts) == 2}
+
+class AdapterBank:
+    """LoRA adapters resident in a fixed number of slots, least recently used out
+
+    Wraps every linear layer of ``model`` that some adapter in ``adapters``
+    (name -> directory) targets. ``acquire`` holds an adapter in a slot for
+    a sequence: on a miss the weights are read from disk on a background
+    thread and ``acquire`` returns False until they are in and a slot is
+    free, evicting the least recently used adapter no sequence holds.
+    ``on_ready`` is called from that thread when a read finishes.
+    """
+
+    def __init__(self, model: nn.Module, adapters: Dict[str, str], slots: int, dtype: Optional[torch.dtype] = None):
+        self.paths = dict(adapters)
+        self.configs = {name: read_adapter_config(path) for name, path in self.paths.items()}
+        self.rank = max(config["rank"] for config in self.configs.values())
+        targets = set().union(*(config["targets"] for config in self.configs.values()))
+        dtype = dtype or next(model.parameters()).dtype
+
+        self.layers: Dict[str, LoRALinear] = {}
+        for name, module in list(model.named_modules()):
+            if name.split(".")[-1] not in targets or not hasattr(module, "in_features"):
+                continue
+            layer = LoRALinear(module, self, slots, self.rank, dtype)
+            parent_name, _, child = name.rpartition(".")
+            setattr(model.get_submodule(parent_name), child, layer)
+            self.layers[name] = layer
+
+        self.capacity = slots
+        self.indices: Optional[torch.Tensor] = None
+        self.resident: "OrderedDict[str, int]" = OrderedDict()
+        self.holders: Dict[str, int] = {}
+        self._free = list(range(1, slots + 1))
+        self._reads: Dict[str, Future] = {}
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lora-read")
+        self.on_ready: Optional[Callable[[], None]] = None
+        logger.info("LoRA adapters registered", adapters=len(self.paths), layers=len(self.layers), slots=slots, rank=self.rank)
+
+    def acquire(self, name: str) -> bool:
+        """Hold ``name`` in a slot; False while it is not in one yet
+
+        Raises if the adapter is unknown or could not be read.
+        """
+        if name not in self.paths:
+            raise KeyError(f"Unknown LoRA adapter: {name}")
+        if name in self.resident:
+            self.resident.move_to_end(name)
+            self.holders[name] += 1
+            metrics.cache_lookups.labels(cache="lora_adapter", result="hit").inc()
+            return True
+
+        read = self._reads.get(name)
+        if read is None:
+            metrics.cache_lookups.labels(cache="lora_adapter", result="miss").inc()
+            self._reads[name] = read = self._reader.submit(read_adapter_weights, self.paths[name])
+            read.add_done_callback(self._read_done)
+            return False
+        if not read.done():
+            return False
+        if read.exception() is not None:
+            # Read again by the next request
+            del self._reads[name]
+            raise read.exception()
+        slot = self._free_slot()
+        if slot is None:
+            return False
+        del self._reads[name]
+        self._install(name, slot, read.result())
+        self.resident[name] = slot
+        self.holders[name] = 1
+        return True
+
+    def release(self, name: str):
+        self.holders[name] -= 1
+
+    def _read_done(self, read: Future):
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def _free_slot(self) -> Optional[int]:
+        if self._free:
+            return self._free.pop()
+        for name, slot in self.resident.items():
+            if not self.holders[name]:
+                del self.resident[name]
+                del self.holders[name]
+                metrics.lora_adapter_evictions.inc()
+                return slot
+        return None
+
+    def _install(self, name: str, slot: int, weights: AdapterWeights):
+        config = self.configs[name]
+        rank = config["rank"]
+        scaling = config["alpha"] / (rank ** 0.5 if config["rslora"] else rank)
+        for module, layer in self.layers.items():
+            layer.lora_a[slot].zero_()
+            layer.lora_b[slot].zero_()
+            if module in weights:
+                lora_a, lora_b = weights[module]
+                layer.lora_a[slot, :, :rank].copy_(lora_a.t())
+                layer.lora_b[slot, :rank].copy_(lora_b.t() * scaling)
+        logger.info("LoRA adapter loaded", adapter=name, slot=slot, modules=len(weights))
+
+    def select(self, names: List[Optional[str]]):
+        """Slot of each row in the next forward call (None: the base model)"""
+        if all(name is None for name in names):
+            self.indices = None
+        else:
+            self.indices = torch.tensor([self.resident[name] if name is not None else 0 for name in names])
+
+    def stats(self) -> dict:
+        return {
+            "adapters": len(self.paths),
+            "slots": self.capacity,
+            "resident": {name: self.holders[name] for name in self.resident}
+        }
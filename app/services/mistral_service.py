@@ -184,71 +184,446 @@
 
 
 import asyncio
-from typing import List, AsyncGenerator
-from app.models.streaming_models import ChatMessage
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, AsyncGenerator, Optional
+
+from app.models.schemas import ChatMessage
+from app.services.backends import InferenceBackend, create_backend
+from app.services.constrained import Constraint, constraint_compiler
+from app.services.engine import InferenceEngine
+from app.services.scheduler import Scheduler
+from app.services.autotuner import BatchAutotuner
+from app.services.preemption import SwapPool
+from app.services.kv_cache import KVState
+from app.services.context_manager import ContextManager, SinkWindowCache
+from app.services.session_service import session_manager
+from app.core.exceptions import ModelLoadException, ModelNotLoadedException, TokenizationException
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.utils import tracing
+from app.config.settings import settings
+
+
+def _release_backend(backend: InferenceBackend):
+    """Free the weights of a backend that is no longer served; blocks for
+    as long as the collection takes, so it runs on the load thread"""
+    backend.unload()
+    gc.collect()
+
+
+@dataclass
+class GenerationStats:
+    """Filled in by ``stream_chat`` so callers can report usage once the stream ends"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    finish_reason: Optional[str] = None
+    # Seconds from submission to the first generated token
+    ttft: Optional[float] = None
+
 
 class MistralService:
-    def __init__(self):
-        self.model = None
-        self.tokenizer = None
+    def __init__(self, model_path: Optional[str] = None, primary: bool = True):
+        self.model_path = model_path or settings.MODEL_PATH
+        # The primary service is the one readiness and sessions are about;
+        # others serve further models from the registry
+        self.primary = primary
+        self.backend: Optional[InferenceBackend] = None
+        self.loaded = False
+        self.loading = False
+        self._lock = threading.Lock()
+        self._thread_pool = ThreadPoolExecutor(max_workers=1)
+        self._load_time = None
+        self._load_future: Optional[asyncio.Future] = None
+        self.load_error: Optional[str] = None
+        # Bumped by every checkpoint swap; KV caches record the version they
+        # were computed with. Token histories from before
+        # ``_history_version`` used another tokenizer.
+        self.model_version = 0
+        self._history_version = 0
+        self._swap_task: Optional[asyncio.Task] = None
+        self.swap_status: Optional[dict] = None
+        self._draining: Optional[InferenceEngine] = None
+        self.engine = InferenceEngine(
+            settings.MAX_BATCH_SIZE,
+            Scheduler(settings.SCHEDULER_POLICY, settings.SCHEDULER_AGING_RATE),
+            prefill_chunk_tokens=settings.PREFILL_CHUNK_TOKENS,
+            max_step_tokens=settings.MAX_STEP_TOKENS,
+            kv_token_budget=settings.KV_TOKEN_BUDGET,
+            swap_pool=SwapPool(
+                settings.KV_SWAP_POOL_MB * 1024 * 1024,
+                settings.KV_SWAP_BANDWIDTH_GBPS * 1e9
+            ),
+            autotuner=BatchAutotuner(
+                settings.AUTOTUNE_ITL_P95_MS / 1000,
+                settings.MAX_BATCH_SIZE,
+                settings.MAX_STEP_TOKENS or settings.AUTOTUNE_MAX_STEP_TOKENS,
+                (settings.AUTOTUNE_MIN_BATCH_SIZE, settings.AUTOTUNE_MAX_BATCH_SIZE),
+                (settings.AUTOTUNE_MIN_STEP_TOKENS, settings.AUTOTUNE_MAX_STEP_TOKENS),
+                interval_steps=settings.AUTOTUNE_INTERVAL_STEPS
+            ) if settings.AUTOTUNE_ENABLED else None
+        )
+        self.context = ContextManager(settings.MAX_CONTEXT_TOKENS)
+        self.sink_window = None
+    
+    def load_model(self):
+        """Load the configured backend in a thread-safe manner"""
+        with self._lock:
+            if self.loaded:
+                return
+            
+            self.loading = True
+            
+            try:
+                logger.info("Starting model loading", model_path=self.model_path, backend=settings.MODEL_BACKEND)
+                start_time = time.time()
+                
+                self.backend = self._create_backend(self.model_path)
+                self._configure_context()
+                
+                self.loaded = True
+                self._load_time = time.time() - start_time
+                
+                logger.info(
+                    "Model loaded successfully",
+                    model_path=self.model_path,
+                    load_time_seconds=round(self._load_time, 2)
+                )
+            except Exception as e:
+                logger.error("Model loading failed", error=str(e))
+                raise ModelLoadException(f"Model loading failed: {str(e)}")
+            finally:
+                self.loading = False
+    
+    def _create_backend(self, model_path: str) -> InferenceBackend:
+        """Load ``model_path`` with the configured backend, ready to serve"""
+        backend = create_backend(
+            settings.MODEL_BACKEND,
+            model_path,
+            cost_model_path=settings.SIM_COST_MODEL_PATH,
+            vocab_size=settings.SIM_VOCAB_SIZE,
+            mean_output_tokens=settings.SIM_MEAN_OUTPUT_TOKENS,
+            quantization=settings.QUANTIZATION,
+            quant_group_size=settings.QUANT_GROUP_SIZE,
+            quant_cache_dir=settings.QUANT_CACHE_DIR,
+            # Adapters are trained against the primary model
+            adapters=settings.LORA_ADAPTERS if self.primary else None,
+            adapter_slots=settings.LORA_MAX_ADAPTERS
+        )
+        backend.load()
+        if settings.COMPILE_MODE == "torch_compile":
+            # Before the backend serves, so no request pays for a compile
+            backend.compile(settings.COMPILE_BUCKETS, settings.COMPILE_CACHE_DIR)
+        return backend
+    
+    def _configure_context(self):
+        """Set up the context budget and KV cache mode for the loaded model"""
+        self.context = ContextManager(settings.MAX_CONTEXT_TOKENS)
+        if settings.KV_CACHE_MODE == "sink_window":
+            self.sink_window = SinkWindowCache(
+                self.backend.model,
+                sink_tokens=settings.KV_SINK_TOKENS,
+                window_tokens=settings.KV_WINDOW_TOKENS
+            )
+        else:
+            self.sink_window = None
+        self.engine.configure(self.backend, self.sink_window)
+    
+    def start_loading(self) -> asyncio.Future:
+        """Load the model in the background, once
+
+        Every caller gets the same future while a load is running or after
+        it succeeded; only a failed load is started again.
+        """
+        if self._load_future is None or (self._load_future.done() and not self.loaded):
+            loop = asyncio.get_running_loop()
+            self._load_future = loop.run_in_executor(self._thread_pool, self.load_model)
+            self._load_future.add_done_callback(self._on_load_done)
+        return self._load_future
+    
+    def _on_load_done(self, future: asyncio.Future):
+        error = future.exception() if not future.cancelled() else None
+        self.load_error = str(error) if error is not None else None
+        if self.primary:
+            metrics.model_ready.set(1 if self.loaded else 0)
+    
+    async def unload(self):
+        """Release the weights of an idle model; ``start_loading`` brings them back"""
+        with self._lock:
+            if not self.loaded:
+                return
+            backend, self.backend = self.backend, None
+            self.loaded = False
+            self._load_time = None
+            self.engine.backend = None
+            self.sink_window = self.engine.sink_window = None
+        await asyncio.get_running_loop().run_in_executor(self._thread_pool, _release_backend, backend)
+        del backend
+        logger.info("Model unloaded", model_path=self.model_path)
+    
+    @property
+    def status(self) -> str:
+        """ready, loading, failed or not_loaded"""
+        if self.loaded:
+            return "ready"
+        if self.loading or (self._load_future is not None and not self._load_future.done()):
+            return "loading"
+        if self.load_error is not None:
+            return "failed"
+        return "not_loaded"
+    
+    async def load_model_async(self):
+        """Load model asynchronously"""
+        await self.start_loading()
+    
+    @property
+    def swapping(self) -> bool:
+        return self._swap_task is not None and not self._swap_task.done()
+    
+    def start_swap(self, model_path: str) -> asyncio.Task:
+        """Replace the served checkpoint without interrupting requests
+
+        The new backend loads on the load thread while the current one keeps
+        serving. The switch itself runs within one event loop step, and
+        requests are tokenized and submitted within one too, so each request
+        runs entirely on the old model or entirely on the new one. The old
+        engine then finishes its sequences on the old weights (failing any
+        left after MODEL_SWAP_DRAIN_TIMEOUT_SECONDS) and the weights are
+        released. Session KV caches computed with them are invalidated.
+        Progress is reported in ``swap_status``.
+        """
+        if not self.loaded:
+            raise ModelNotLoadedException()
+        self.swap_status = {
+            "model_path": model_path,
+            "previous_model_path": self.model_path,
+            "phase": "loading",
+            "started_at": time.time(),
+            "seconds": None,
+            "aborted": 0,
+            "error": None
+        }
+        self._swap_task = asyncio.create_task(self._swap(model_path, self.swap_status))
+        return self._swap_task
+    
+    async def _swap(self, model_path: str, status: dict):
+        logger.info("Model swap started", model_path=model_path, previous_model_path=self.model_path)
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            backend = await loop.run_in_executor(self._thread_pool, self._create_backend, model_path)
+            old_backend = self.backend
+            same_tokenizer = await loop.run_in_executor(
+                self._thread_pool, lambda: backend.tokenizer_key() == old_backend.tokenizer_key()
+            )
+        except Exception as e:
+            status.update(phase="failed", error=str(e))
+            metrics.model_swaps.labels(result="failed").inc()
+            logger.error("Model swap failed; still serving the previous model", model_path=model_path, error=str(e))
+            return
+        
+        # The switch: no await until new requests only see the new model
+        old_engine = self.engine
+        self.engine = old_engine.clone()
+        self.backend = backend
+        self.model_path = model_path
+        self.model_version += 1
+        if not same_tokenizer:
+            self._history_version = self.model_version
+        self._configure_context()
+        session_manager.invalidate(keep_history=same_tokenizer)
+        
+        status["phase"] = "draining"
+        self._draining = old_engine
+        status["aborted"] = await old_engine.drain(settings.MODEL_SWAP_DRAIN_TIMEOUT_SECONDS or None)
+        self._draining = None
+        del old_engine
+        # Releasing the weights and collecting would stall the event loop
+        await loop.run_in_executor(self._thread_pool, _release_backend, old_backend)
+        del old_backend
+        
+        status.update(phase="done", seconds=round(time.perf_counter() - start, 2))
+        metrics.model_swaps.labels(result="done").inc()
+        logger.info(
+            "Model swap finished",
+            model_path=model_path,
+            model_version=self.model_version,
+            tokenizer_changed=not same_tokenizer,
+            aborted=status["aborted"],
+            seconds=status["seconds"]
+        )
     
     async def stream_chat(
         self, 
         messages: List[ChatMessage], 
         max_tokens: int = 1000, 
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        stats: Optional[GenerationStats] = None,
+        tenant: Optional[str] = None,
+        adapter: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream chat tokens one by one"""
+        """Stream chat tokens one by one, on LoRA ``adapter`` if given, and
+        only in the shape ``response_format`` allows"""
+        if not self.loaded:
+            raise ModelNotLoadedException()
         
-        # Format messages for the model
-        formatted_prompt = self._format_messages(messages)
+        constraint = None
+        if response_format is not None:
+            # Against the vocabulary of the backend that will generate, in
+            # case a swap lands while compiling
+            backend = None
+            while backend is not self.backend:
+                backend = self.backend
+                fsm = await constraint_compiler.compile(backend, response_format)
+            constraint = Constraint(fsm) if fsm is not None else None
         
-        # Tokenize the input
-        inputs = self.tokenizer.encode(formatted_prompt, return_tensors="pt")
+        # Tokenize each formatted message so the history can be cut at
+        # message boundaries without tokenizing twice. The template already
+        # carries the <s> markers, so no special tokens are added.
+        with tracing.span("tokenize"):
+            encoded = [
+                self.backend.encode(self._format_messages([msg]))
+                for msg in messages
+            ]
+        kept = self.context.fit_messages(messages, encoded, max_tokens)
+        if len(kept) < len(messages):
+            logger.info(
+                "Conversation truncated to fit context",
+                dropped_messages=len(messages) - len(kept),
+                max_context_tokens=self.context.max_context_tokens,
+                sample=True
+            )
         
-        # Generate tokens with streaming
-        generated_tokens = 0
-        with torch.no_grad():
-            for i in range(max_tokens):
-                # Get next token (simplified - adapt to your actual model inference)
-                outputs = self.model(inputs)
-                next_token_logits = outputs.logits[:, -1, :]
-                
-                # Apply temperature
-                if temperature > 0:
-                    next_token_logits = next_token_logits / temperature
-                    probs = torch.softmax(next_token_logits, dim=-1)
-                    next_token = torch.multinomial(probs, num_samples=1)
-                else:
-                    next_token = torch.argmax(next_token_logits, dim=-1, keepdim=True)
-                
-                # Decode the token
-                next_token_text = self.tokenizer.decode(next_token[0])
-                
-                # Yield the token
-                yield next_token_text
-                
-                # Append to input for next iteration
-                inputs = torch.cat([inputs, next_token], dim=-1)
-                
-                generated_tokens += 1
-                
-                # Check for stop conditions
-                if self._should_stop(next_token_text, generated_tokens, max_tokens):
-                    break
-                
-                # Small delay to make streaming visible
-                await asyncio.sleep(0.01)
+        state = KVState(
+            token_ids=[token for i in kept for token in encoded[i]],
+            model_version=self.model_version,
+            adapter=adapter
+        )
+        
+        async for token in self.generate(state, max_tokens, temperature, stats, tenant, constraint):
+            yield token
+    
+    async def stream_session_turn(
+        self,
+        state: KVState,
+        messages: List[ChatMessage],
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stats: Optional[GenerationStats] = None,
+        tenant: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """Continue a retained conversation with the turn's new messages
+
+        Only the new messages are tokenized and prefilled; earlier turns are
+        already covered by ``state.past_key_values``.
+        """
+        if not self.loaded:
+            raise ModelNotLoadedException()
+        
+        if state.model_version != self.model_version:
+            # The cache came from weights that have since been swapped out
+            state.drop_cache()
+            if state.model_version < self._history_version and state.token_ids:
+                logger.warning(
+                    "Session history dropped after a tokenizer change",
+                    context_tokens=len(state.token_ids)
+                )
+                state.token_ids.clear()
+                state.turn_starts.clear()
+                state.system_len = 0
+            state.model_version = self.model_version
+        
+        # The system prompt opens a new conversation and is kept through
+        # every trim, so it is tokenized on its own
+        system_ids: List[int] = []
+        with tracing.span("tokenize"):
+            if not state.token_ids and any(msg.role == "system" for msg in messages):
+                system_ids = self.backend.encode(
+                    self._format_messages([msg for msg in messages if msg.role == "system"])
+                )
+                messages = [msg for msg in messages if msg.role != "system"]
+            new_ids = self.backend.encode(self._format_messages(messages))
+        
+        if self.sink_window is None:
+            if state.system_len + len(system_ids) + len(new_ids) > self.context.prompt_budget(max_tokens):
+                metrics.requests_rejected.labels(reason="context_overflow").inc()
+                raise TokenizationException(
+                    f"System prompt and message exceed the model context of {self.context.max_context_tokens} tokens"
+                )
+            dropped = self.context.trim_history(state, len(system_ids) + len(new_ids), max_tokens)
+            if dropped:
+                logger.info(
+                    "Session history truncated to fit context",
+                    dropped_tokens=dropped,
+                    max_context_tokens=self.context.max_context_tokens,
+                    sample=True
+                )
+        
+        # A failed turn leaves the history as it was
+        history_len = len(state.token_ids)
+        if system_ids:
+            state.token_ids.extend(system_ids)
+            state.system_len = len(system_ids)
+        state.turn_starts.append(len(state.token_ids))
+        state.token_ids.extend(new_ids)
+        try:
+            async for token in self.generate(state, max_tokens, temperature, stats, tenant):
+                yield token
+        except Exception:
+            del state.token_ids[history_len:]
+            state.turn_starts.pop()
+            if system_ids:
+                state.system_len = 0
+            state.drop_cache()
+            raise
+    
+    async def generate(
+        self,
+        state: KVState,
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None,
+        tenant: Optional[str] = None,
+        constraint: Optional[Constraint] = None
+    ) -> AsyncGenerator[str, None]:
+        """Decode from ``state``, feeding only tokens not yet in its KV cache
+
+        The sequence joins the engine's running batch; tokens are yielded as
+        the engine produces them. ``tenant`` keys the output-length history
+        the scheduler predicts from.
+        """
+        if stats is None:
+            stats = GenerationStats()
+        
+        if self.sink_window is None:
+            room = self.context.max_context_tokens - len(state.token_ids)
+            if room <= 0:
+                metrics.requests_rejected.labels(reason="context_overflow").inc()
+                raise TokenizationException(
+                    f"Conversation exceeds the model context of {self.context.max_context_tokens} tokens"
+                )
+            max_tokens = min(max_tokens, room)
+        
+        async for token in self.engine.generate(state, max_tokens, temperature, stats, tenant, constraint):
+            yield token
     
     async def chat(
         self,
         messages: List[ChatMessage],
         max_tokens: int = 1000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        stats: Optional[GenerationStats] = None,
+        tenant: Optional[str] = None,
+        adapter: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> str:
         """Non-streaming chat completion"""
         full_response = ""
-        async for token in self.stream_chat(messages, max_tokens, temperature):
+        async for token in self.stream_chat(messages, max_tokens, temperature, stats, tenant, adapter, response_format):
             full_response += token
         return full_response
     
@@ -264,10 +639,26 @@ class MistralService:
                 formatted += f" {msg.content}</s>"
         return formatted
     
-    def _should_stop(self, token: str, generated_tokens: int, max_tokens: int) -> bool:
-        """Check if generation should stop"""
-        if generated_tokens >= max_tokens:
-            return True
-        if token in ["</s>", "<|endoftext|>"]:
-            return True
-        return False
\ No newline at end of file
+    def get_health_status(self) -> dict:
+        """Get service health status"""
+        return {
+            "status": self.status,
+            "loaded": self.loaded,
+            "loading": self.loading,
+            "load_error": self.load_error,
+            "load_time": self._load_time,
+            "model_path": self.model_path,
+            "model_version": self.model_version,
+            "backend": settings.MODEL_BACKEND,
+            "engine": self.engine.stats(),
+            "swap": self.swap_status,
+            "draining_engine": self._draining.stats() if self._draining is not None else None
+        }
+    
+    def shutdown(self):
+        """Cleanup resources"""
+        self._thread_pool.shutdown(wait=True)
+        self.engine.shutdown()
+
+# Global service instance
+mistral_service = MistralService()
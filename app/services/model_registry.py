@@ -0,0 +1,238 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from app.core.exceptions import ModelNotFoundException, ModelNotLoadedException
+from app.services.mistral_service import MistralService, mistral_service
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.config.settings import settings
+
+def checkpoint_bytes(model_path: str) -> int:
+    """Size of a local checkpoint's weight files; 0 when it is not a local directory"""
+    if not os.path.isdir(model_path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(model_path, name))
+        for name in os.listdir(model_path)
+        if name.endswith((".safetensors", ".bin"))
+    )
+
+class ModelEntry:
+    """One servable model and its usage"""
+
+    def __init__(self, model_id: str, service: MistralService, pinned: bool = False, adapter: Optional[str] = None):
+        self.model_id = model_id
+        self.service = service
+        # Pinned models are loaded at startup and never evicted
+        self.pinned = pinned
+        # LoRA adapter applied on top of ``service``'s model
+        self.adapter = adapter
+        # Requests holding the model, and requests waiting for it to load
+        self.active = 0
+        self.waiters = 0
+        self.last_used = 0.0
+        # Request count decaying with the traffic half-life, as of ``traffic_at``
+        self.traffic = 0.0
+        self.traffic_at = time.monotonic()
+        # Weight memory when last resident, for the next load's estimate
+        self.nbytes = 0
+        self.load_future: Optional[asyncio.Future] = None
+
+    def traffic_now(self, now: float, half_life: float) -> float:
+        return self.traffic * 0.5 ** ((now - self.traffic_at) / half_life)
+
+    @property
+    def resident_bytes(self) -> int:
+        # An adapter's weights are counted with its base model
+        if not self.service.loaded or self.adapter is not None:
+            return 0
+        return self.service.backend.weight_bytes()
+
+class ModelRegistry:
+    """Routes requests to models by id and manages which ones are resident
+
+    Models other than the pinned default load when a request first asks for
+    them. Loads run one at a time; when several models are waiting, the one
+    with the most recent traffic loads first. Before a load, idle models are
+    unloaded least recently used first until the resident weights plus the
+    new model's estimated size fit ``memory_budget_bytes``; if the rest are
+    busy the load waits for one to be released.
+
+    LoRA ``adapters`` of the default model are registered under their own
+    ids; they ride on the default model and its adapter bank.
+
+    ``acquire`` hands out a model's entry for one request, which must
+    ``release`` it when done; a model is never unloaded while held.
+    """
+
+    def __init__(
+        self,
+        default_id: str,
+        default: MistralService,
+        models: Dict[str, str],
+        adapters: Dict[str, str],
+        memory_budget_bytes: int,
+        traffic_half_life: float
+    ):
+        self.default_id = default_id
+        self.memory_budget_bytes = memory_budget_bytes
+        self.traffic_half_life = traffic_half_life
+        self.entries: Dict[str, ModelEntry] = {default_id: ModelEntry(default_id, default, pinned=True)}
+        for model_id, model_path in models.items():
+            if model_id not in self.entries:
+                self.entries[model_id] = ModelEntry(model_id, MistralService(model_path, primary=False))
+        for adapter in adapters:
+            if adapter not in self.entries:
+                self.entries[adapter] = ModelEntry(adapter, default, pinned=True, adapter=adapter)
+        self._loader: Optional[asyncio.Task] = None
+        self._released = asyncio.Event()
+
+    def resolve(self, model_id: Optional[str]) -> ModelEntry:
+        entry = self.entries.get(model_id)
+        if entry is not None:
+            return entry
+        # The default model also answers to the path it currently serves
+        default = self.entries[self.default_id]
+        if model_id == default.service.model_path:
+            return default
+        # A single model answers to any name, as before there was a registry
+        if len(self.entries) == 1:
+            return self.entries[self.default_id]
+        raise ModelNotFoundException(f"The model '{model_id}' does not exist")
+
+    async def acquire(self, model_id: Optional[str]) -> ModelEntry:
+        """The entry for ``model_id`` with its model loaded, held until ``release``"""
+        entry = self.resolve(model_id)
+        now = time.monotonic()
+        entry.traffic = entry.traffic_now(now, self.traffic_half_life) + 1
+        entry.traffic_at = now
+        entry.last_used = now
+
+        if entry.pinned:
+            if not entry.service.loaded:
+                metrics.requests_rejected.labels(reason="model_not_loaded").inc()
+                raise ModelNotLoadedException(
+                    f"Model service is not available ({entry.service.status})",
+                    headers={"Retry-After": str(settings.NOT_READY_RETRY_AFTER_SECONDS)}
+                )
+        else:
+            entry.waiters += 1
+            try:
+                while not entry.service.loaded:
+                    if entry.load_future is None:
+                        entry.load_future = asyncio.get_running_loop().create_future()
+                    self._start_loader()
+                    await asyncio.shield(entry.load_future)
+            finally:
+                entry.waiters -= 1
+        entry.active += 1
+        return entry
+
+    def release(self, entry: ModelEntry):
+        entry.active -= 1
+        entry.last_used = time.monotonic()
+        self._released.set()
+
+    def _start_loader(self):
+        if self._loader is None or self._loader.done():
+            self._loader = asyncio.create_task(self._load_pending())
+
+    async def _load_pending(self):
+        """Load waited-for models, busiest first, until none are left"""
+        while True:
+            # A future is open from the first waiter until the load ends
+            pending = [e for e in self.entries.values() if e.load_future is not None]
+            if not pending:
+                return
+            now = time.monotonic()
+            entry = max(pending, key=lambda e: e.traffic_now(now, self.traffic_half_life))
+            # While the load waits for room, busier models may queue up
+            if not await self._make_room(entry):
+                continue
+            future = entry.load_future
+            try:
+                await entry.service.start_loading()
+                entry.nbytes = entry.resident_bytes
+                metrics.model_loads.labels(result="done").inc()
+                if not future.done():
+                    future.set_result(None)
+            except Exception as e:
+                logger.error("Model load failed", model=entry.model_id, error=str(e))
+                metrics.model_loads.labels(result="failed").inc()
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                entry.load_future = None
+                self._update_metrics()
+
+    async def _make_room(self, entry: ModelEntry) -> bool:
+        """Evict idle models until ``entry`` fits the budget; False if it had
+        to wait for a busy model to be released first"""
+        if not self.memory_budget_bytes:
+            return True
+        needed = entry.nbytes or checkpoint_bytes(entry.service.model_path)
+        while self.resident_bytes() + needed > self.memory_budget_bytes:
+            idle = [
+                e for e in self.entries.values()
+                if e.service.loaded and not e.pinned and not e.active and not e.waiters
+            ]
+            if idle:
+                victim = min(idle, key=lambda e: e.last_used)
+                victim.nbytes = victim.resident_bytes
+                await victim.service.unload()
+                metrics.model_evictions.inc()
+                logger.info("Model evicted", model=victim.model_id, freed_bytes=victim.nbytes, for_model=entry.model_id)
+                continue
+            if not any(e.service.loaded and not e.pinned and e.active for e in self.entries.values()):
+                logger.warning(
+                    "Model memory budget exceeded; nothing left to evict",
+                    model=entry.model_id,
+                    needed_bytes=needed,
+                    resident_bytes=self.resident_bytes(),
+                    memory_budget_bytes=self.memory_budget_bytes
+                )
+                return True
+            self._released.clear()
+            await self._released.wait()
+            return False
+        return True
+
+    def resident_bytes(self) -> int:
+        return sum(entry.resident_bytes for entry in self.entries.values())
+
+    def _update_metrics(self):
+        metrics.model_memory_bytes.set(self.resident_bytes())
+
+    def model_ids(self) -> List[str]:
+        return list(self.entries)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "resident_bytes": self.resident_bytes(),
+            "models": {
+                entry.model_id: {
+                    "model_path": entry.service.model_path,
+                    "status": entry.service.status,
+                    "pinned": entry.pinned,
+                    "adapter": entry.adapter,
+                    "active": entry.active,
+                    "waiting": entry.waiters,
+                    "traffic": round(entry.traffic_now(now, self.traffic_half_life), 3),
+                    "resident_bytes": entry.resident_bytes
+                }
+                for entry in self.entries.values()
+            }
+        }
+
+model_registry = ModelRegistry(
+    default_id=settings.MODEL_ID,
+    default=mistral_service,
+    models=settings.MODELS,
+    adapters=settings.LORA_ADAPTERS,
+    memory_budget_bytes=settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+    traffic_half_life=settings.MODEL_TRAFFIC_HALF_LIFE_SECONDS
+)
@@ -0,0 +1,90 @@
+from typing import Any, Dict, Hashable, Tuple
+
+import torch
+
+from app.services.cost_model import CostModel
+from app.services.kv_cache import KVState, from_layers, to_layers
+from app.utils.monitoring import metrics
+
+class SwapPool:
+    """Host-memory tier for the KV caches of preempted sequences
+
+    Swapped-out layers are copied into pinned host buffers when a GPU is
+    present, so the copies back can run asynchronously. On a CPU-only host
+    the tensors already live in host memory and are kept as they are; the
+    pool then only moves them outside the running batch's KV budget.
+    """
+
+    def __init__(self, capacity_bytes: int, bandwidth_bytes_per_s: float):
+        self.capacity_bytes = capacity_bytes
+        self.bandwidth_bytes_per_s = bandwidth_bytes_per_s
+        self.entries: Dict[Hashable, Tuple[Any, Any, int]] = {}
+        self.used_bytes = 0
+        self.swaps_out = 0
+        self.swaps_in = 0
+
+    def fits(self, nbytes: int) -> bool:
+        return self.used_bytes + nbytes <= self.capacity_bytes
+
+    def transfer_time(self, nbytes: int) -> float:
+        """Seconds to copy ``nbytes`` out and back in again"""
+        return 2 * nbytes / self.bandwidth_bytes_per_s
+
+    def swap_out(self, key: Hashable, state: KVState):
+        layers = to_layers(state.past_key_values)
+        nbytes = state.nbytes
+        device = layers[0][0].device if layers else None
+        if device is None or device.type == "cpu":
+            payload = state.past_key_values
+        else:
+            pin = torch.cuda.is_available()
+            payload = [
+                tuple(torch.empty(t.shape, dtype=t.dtype, pin_memory=pin).copy_(t, non_blocking=pin) for t in layer)
+                for layer in layers
+            ]
+            torch.cuda.synchronize()
+
+        self.entries[key] = (payload, device, nbytes)
+        self.used_bytes += nbytes
+        self.swaps_out += 1
+        state.past_key_values = None
+        metrics.kv_cache_bytes.labels(tier="swapped").set(self.used_bytes)
+
+    def swap_in(self, key: Hashable, state: KVState):
+        payload, device, nbytes = self.entries.pop(key)
+        if device is None or device.type == "cpu":
+            state.past_key_values = payload
+        else:
+            state.past_key_values = from_layers([
+                (k.to(device, non_blocking=True), v.to(device, non_blocking=True)) for k, v in payload
+            ])
+        self.used_bytes -= nbytes
+        self.swaps_in += 1
+        metrics.kv_cache_bytes.labels(tier="swapped").set(self.used_bytes)
+
+    def discard(self, key: Hashable):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.used_bytes -= entry[2]
+            metrics.kv_cache_bytes.labels(tier="swapped").set(self.used_bytes)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self.entries),
+            "used_bytes": self.used_bytes,
+            "capacity_bytes": self.capacity_bytes,
+            "swaps_out": self.swaps_out,
+            "swaps_in": self.swaps_in
+        }
+
+def preemption_mode(state: KVState, pool: SwapPool, cost_model: CostModel) -> str:
+    """"swap" or "recompute", whichever the cost model says resumes faster
+
+    Recomputing costs a prefill over the cached prefix; swapping costs the
+    copy out and back over the host link, and needs room in the pool.
+    """
+    nbytes = state.nbytes
+    if not pool.fits(nbytes):
+        return "recompute"
+    recompute = cost_model.step_time(state.kv_len, state.kv_len)
+    return "swap" if pool.transfer_time(nbytes) < recompute else "recompute"
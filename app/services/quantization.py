@@ -0,0 +1,202 @@
+import hashlib
+import os
+import re
+from typing import List, Optional
+
+import torch
+from torch import nn
+
+from app.utils.logging import logger
+
+# Weight-only quantization for CPU serving. Linear weights are stored as
+# integers and multiplied by torch's fused CPU kernels, which dequantize on
+# the fly.
+#   int8: symmetric, one scale per output channel (the layout
+#         _weight_int8pack_mm takes)
+#   int4: asymmetric, a scale and zero point per group of ``group_size``
+#         input features, packed for _weight_int4pack_mm_for_cpu
+# Those kernels only have fast paths for bf16 activations (in fp32 they are
+# slower than the unquantized matmul), so quantized models run in bf16.
+
+QUANT_BITS = {"int8": 8, "int4": 4}
+# The fused kernel each mode runs on; the int4 CPU one is torch 2.6+
+KERNELS = {8: "_weight_int8pack_mm", 4: "_weight_int4pack_mm_for_cpu"}
+INT4_GROUP_SIZES = (32, 64, 128, 256)
+ACTIVATION_DTYPE = torch.bfloat16
+
+class QuantizedLinear(nn.Module):
+    """Drop-in replacement for nn.Linear with integer weights"""
+
+    def __init__(self, in_features: int, out_features: int, bits: int, group_size: int, bias: bool, dtype: torch.dtype):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        self.group_size = group_size
+        if bits == 8:
+            self.register_buffer("weight", torch.empty(out_features, in_features, dtype=torch.int8))
+            self.register_buffer("scales", torch.empty(out_features, dtype=dtype))
+        else:
+            self.register_buffer("weight", torch.empty(out_features, in_features // 2, dtype=torch.uint8))
+            self.register_buffer("scales", torch.empty(in_features // group_size, out_features, 2, dtype=dtype))
+        self.bias = nn.Parameter(torch.empty(out_features, dtype=dtype), requires_grad=False) if bias else None
+
+    @staticmethod
+    def supports(linear: nn.Linear, bits: int, group_size: int) -> bool:
+        if bits == 8:
+            return True
+        return group_size in INT4_GROUP_SIZES and linear.in_features % group_size == 0
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, bits: int, group_size: int) -> "QuantizedLinear":
+        weight = linear.weight.detach().float()
+        dtype = linear.weight.dtype
+        module = cls(linear.in_features, linear.out_features, bits, group_size, linear.bias is not None, dtype)
+
+        if bits == 8:
+            scales = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+            module.weight = torch.round(weight / scales[:, None]).clamp(-127, 127).to(torch.int8)
+            module.scales = scales.to(dtype)
+        else:
+            groups = weight.reshape(linear.out_features, -1, group_size)
+            low, high = groups.amin(dim=-1), groups.amax(dim=-1)
+            scales = ((high - low) / 15).clamp(min=1e-8)
+            q = torch.round((groups - low[..., None]) / scales[..., None]).clamp(0, 15)
+            module.weight = torch.ops.aten._convert_weight_to_int4pack_for_cpu(
+                q.to(torch.int32).reshape(linear.out_features, linear.in_features), 1
+            )
+            # The kernel computes (q - 8) * scale + zero
+            zeros = low + scales * 8
+            module.scales = torch.stack([scales, zeros], dim=-1).transpose(0, 1).contiguous().to(dtype)
+
+        if linear.bias is not None:
+            module.bias = nn.Parameter(linear.bias.detach().clone(), requires_grad=False)
+        return module
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        shape = x.shape
+        x = x.reshape(-1, self.in_features)
+        scales = self.scales if self.scales.dtype == x.dtype else self.scales.to(x.dtype)
+        if self.bits == 8:
+            out = torch.ops.aten._weight_int8pack_mm(x, self.weight, scales)
+        else:
+            out = torch.ops.aten._weight_int4pack_mm_for_cpu(x, self.weight, self.group_size, scales)
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*shape[:-1], self.out_features)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}, group_size={self.group_size}"
+
+def _replace_linears(model: nn.Module, build, skip: tuple) -> int:
+    replaced = 0
+    for name, module in list(model.named_modules()):
+        if not isinstance(module, nn.Linear) or name.split(".")[-1] in skip:
+            continue
+        replacement = build(module)
+        if replacement is None:
+            continue
+        parent_name, _, child = name.rpartition(".")
+        setattr(model.get_submodule(parent_name), child, replacement)
+        replaced += 1
+    return replaced
+
+def quantize_model(model: nn.Module, bits: int, group_size: int, skip: tuple = ("lm_head",)) -> int:
+    """Cast ``model`` to ACTIVATION_DTYPE and swap every supported nn.Linear
+    for a QuantizedLinear in place; returns how many"""
+    model.to(ACTIVATION_DTYPE)
+    return _replace_linears(
+        model,
+        lambda linear: QuantizedLinear.from_linear(linear, bits, group_size)
+        if QuantizedLinear.supports(linear, bits, group_size) else None,
+        skip
+    )
+
+def kernels_available(bits: int) -> bool:
+    return hasattr(torch.ops.aten, KERNELS[bits])
+
+def cache_paths(model_path: str, mode: str, group_size: int, cache_dir: str) -> List[str]:
+    """Where the quantized weights of ``model_path`` may be kept, preferred
+    first: next to a local checkpoint, then under ``cache_dir`` (the only
+    place for a hub model id, the fallback for a read-only checkpoint)"""
+    group = f"-g{group_size}" if mode == "int4" else ""
+    filename = f"quantized-{mode}{group}-torch{torch.__version__.split('+')[0]}.pt"
+    paths = []
+    if os.path.isdir(model_path):
+        paths.append(os.path.join(model_path, filename))
+        model_path = os.path.abspath(model_path)
+    paths.append(os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9._-]", "_", model_path), filename))
+    return paths
+
+def checkpoint_fingerprint(model_path: str) -> str:
+    """Changes whenever the weights or config of a local checkpoint are
+    rewritten, so a checkpoint replaced in place is quantized again"""
+    if not os.path.isdir(model_path):
+        return model_path
+    entries = []
+    for name in sorted(os.listdir(model_path)):
+        if name.startswith("quantized-") or not name.endswith((".safetensors", ".bin", ".json")):
+            continue
+        stat = os.stat(os.path.join(model_path, name))
+        entries.append((name, stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr(entries).encode()).hexdigest()
+
+def save_quantized(model: nn.Module, path: str, fingerprint: str):
+    """Write all tensors of a quantized model, non-persistent buffers
+    included, tagged with the fingerprint of the checkpoint they came from"""
+    tensors = model.state_dict()
+    for name, buffer in model.named_buffers():
+        tensors.setdefault(name, buffer)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        torch.save({"checkpoint": fingerprint, "tensors": tensors}, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_quantized(
+    config,
+    path: str,
+    bits: int,
+    group_size: int,
+    fingerprint: str,
+    skip: tuple = ("lm_head",)
+) -> Optional[nn.Module]:
+    """Rebuild a quantized model from ``path`` without loading the full
+    precision weights; None if the file is missing, stale or does not match"""
+    from transformers import AutoModelForCausalLM
+
+    if not os.path.exists(path):
+        return None
+    saved = torch.load(path, map_location="cpu", weights_only=True)
+    if not isinstance(saved, dict) or saved.get("checkpoint") != fingerprint:
+        logger.info("Quantized weight cache is stale", path=path)
+        return None
+    tensors = saved["tensors"]
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config)
+    _replace_linears(
+        model,
+        lambda linear: QuantizedLinear(
+            linear.in_features, linear.out_features, bits, group_size, linear.bias is not None, ACTIVATION_DTYPE
+        ) if QuantizedLinear.supports(linear, bits, group_size) else None,
+        skip
+    )
+
+    for name, tensor in tensors.items():
+        module_name, _, attr = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = nn.Parameter(tensor, requires_grad=False)
+        elif attr in module._buffers:
+            module._buffers[attr] = tensor
+    model.tie_weights()
+
+    missing = [name for name, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if missing:
+        logger.warning("Quantized weight cache does not match the model", path=path, missing=missing[:5])
+        return None
+    return model.eval()
@@ -0,0 +1,35 @@
+from typing import Optional
+
+import torch
+
+_BIT_SHIFTS = torch.arange(32, dtype=torch.int32)
+# 0xFF800000, -inf as float32
+_NEG_INF_BITS = -0x800000
+
+def apply_token_masks(logits: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+    """Set the logits of tokens a row may not produce to -inf
+
+    ``masks`` [batch, words] are packed int32 bitmasks: token ``t`` is
+    allowed when bit ``t % 32`` of word ``t // 32`` is set.
+    """
+    # Each bit becomes the float32 pattern of 0.0 (set) or -inf (clear) and
+    # is added: integer ops throughout, far cheaper than a boolean masked_fill
+    bias = (((masks.unsqueeze(-1) >> _BIT_SHIFTS) & 1) - 1) & _NEG_INF_BITS
+    return logits + bias.view(torch.float32).reshape(masks.shape[0], -1)[:, :logits.shape[-1]].to(logits.dtype)
+
+def sample_tokens(logits: torch.Tensor, temperatures: torch.Tensor, masks: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Pick one token per row of ``logits`` [batch, vocab]
+
+    Rows with a positive temperature are sampled from the tempered softmax;
+    rows at temperature 0 take the argmax. With ``masks`` only the tokens
+    each row's bitmask allows are considered.
+    """
+    if masks is not None:
+        logits = apply_token_masks(logits, masks)
+    greedy = logits.argmax(dim=-1)
+    hot = temperatures > 0
+    if not bool(hot.any()):
+        return greedy
+    scaled = logits.float() / temperatures.clamp(min=1e-5).unsqueeze(-1)
+    sampled = torch.multinomial(torch.softmax(scaled, dim=-1), num_samples=1).squeeze(-1)
+    return torch.where(hot, sampled, greedy)
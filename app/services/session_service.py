@@ -0,0 +1,216 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from app.services.kv_cache import KVState, to_layers, from_layers
+from app.services.kv_store import KVSpillStore
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.config.settings import settings
+
+class ChatSession:
+    """Server-side conversation: token history plus the KV cache covering it"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.state = KVState()
+        self.created = time.time()
+        self.last_used = self.created
+        self.turns = 0
+        # Held for the duration of a turn; a locked session is pinned in memory
+        self.lock = asyncio.Lock()
+
+    @property
+    def pinned(self) -> bool:
+        return self.lock.locked()
+
+    @property
+    def nbytes(self) -> int:
+        return self.state.nbytes
+
+    def touch(self):
+        self.last_used = time.time()
+
+class SessionManager:
+    """Keeps chat sessions alive within a TTL and a KV memory budget
+
+    Sessions are ordered least-recently-used first. Expired sessions are
+    dropped. When the in-memory KV caches exceed the budget, the least
+    recently used idle sessions have their caches spilled to ``spill_store``
+    (or dropped, without one) and mapped back in by ``ensure_resident`` on
+    their next turn. Sessions in the middle of a turn are never evicted.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        memory_budget_bytes: int,
+        max_sessions: int,
+        spill_store: Optional[KVSpillStore] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_sessions = max_sessions
+        self.spill_store = spill_store
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    async def create(self) -> ChatSession:
+        await self.evict()
+        session = ChatSession(f"sess-{uuid.uuid4()}")
+        self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.last_used > self.ttl_seconds and not session.pinned:
+            self._remove(session, reason="ttl")
+            return None
+        session.touch()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def close(self, session_id: str):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._remove(session, reason="closed")
+
+    def total_bytes(self) -> int:
+        return sum(session.nbytes for session in self.sessions.values())
+
+    async def evict(self):
+        """Drop expired and over-count sessions, then offload LRU idle KV caches
+        until the resident ones fit the memory budget"""
+        now = time.time()
+        for session in list(self.sessions.values()):
+            if not session.pinned and now - session.last_used > self.ttl_seconds:
+                self._remove(session, reason="ttl")
+
+        for session in list(self.sessions.values()):
+            if len(self.sessions) < self.max_sessions:
+                break
+            if not session.pinned:
+                self._remove(session, reason="max_sessions")
+
+        total = self.total_bytes()
+        for session in list(self.sessions.values()):
+            if total <= self.memory_budget_bytes:
+                break
+            if session.pinned or session.state.past_key_values is None:
+                continue
+            total -= session.nbytes
+            # Pin while the cache is written so a new turn cannot start on it
+            async with session.lock:
+                await self._offload(session)
+
+        self._update_metrics()
+
+    def _update_metrics(self):
+        resident = self.total_bytes()
+        metrics.kv_cache_bytes.labels(tier="resident").set(resident)
+        if self.spill_store is not None:
+            metrics.kv_cache_bytes.labels(tier="spilled").set(self.spill_store.disk_bytes())
+        if self.memory_budget_bytes:
+            metrics.kv_cache_utilization.set(resident / self.memory_budget_bytes)
+
+    async def _offload(self, session: ChatSession):
+        state = session.state
+        if self.spill_store is not None:
+            await asyncio.to_thread(
+                self.spill_store.spill,
+                session.session_id,
+                to_layers(state.past_key_values),
+                state.kv_len
+            )
+            state.past_key_values = None
+        else:
+            state.drop_cache()
+
+    async def ensure_resident(self, session: ChatSession):
+        """Bring a session's spilled KV cache back into memory before a turn
+
+        If the spill file was dropped the cache stays empty and the whole
+        history is prefilled again.
+        """
+        state = session.state
+        if state.kv_len == 0:
+            return
+        if state.past_key_values is not None:
+            metrics.cache_lookups.labels(cache="session_kv", result="hit").inc()
+            return
+        restored = None
+        if self.spill_store is not None:
+            start = time.perf_counter()
+            restored = await asyncio.to_thread(self.spill_store.restore, session.session_id)
+            if restored is not None:
+                metrics.kv_restore_time.observe(time.perf_counter() - start)
+        if restored is None:
+            metrics.cache_lookups.labels(cache="session_kv", result="miss").inc()
+            state.drop_cache()
+            return
+        metrics.cache_lookups.labels(cache="session_kv", result="cold_hit").inc()
+        layers, kv_len = restored
+        state.past_key_values = from_layers(layers)
+        state.kv_len = kv_len
+
+    def invalidate(self, keep_history: bool = True):
+        """Forget KV caches computed with weights that were swapped out
+
+        Idle sessions lose their resident and spilled caches, so the next
+        turn prefills the history on the new weights; without
+        ``keep_history`` (the tokenizer changed too) they are closed.
+        Sessions in the middle of a turn are caught by the model version
+        check when their next turn starts.
+        """
+        for session in list(self.sessions.values()):
+            if session.pinned:
+                continue
+            if not keep_history:
+                self._remove(session, reason="model_swap")
+                continue
+            session.state.drop_cache()
+            if self.spill_store is not None:
+                self.spill_store.discard(session.session_id)
+        self._update_metrics()
+
+    def stats(self) -> dict:
+        resident = [s for s in self.sessions.values() if s.state.past_key_values is not None]
+        return {
+            "sessions": len(self.sessions),
+            "resident_sessions": len(resident),
+            "resident_bytes": self.total_bytes(),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "spill": self.spill_store.stats() if self.spill_store is not None else None
+        }
+
+    def _remove(self, session: ChatSession, reason: str):
+        self.sessions.pop(session.session_id, None)
+        if self.spill_store is not None:
+            self.spill_store.discard(session.session_id)
+        logger.info(
+            "Chat session evicted",
+            session_id=session.session_id,
+            reason=reason,
+            turns=session.turns,
+            kv_bytes=session.nbytes
+        )
+
+    async def run_sweeper(self, interval: float = 30.0):
+        """Periodically expire idle sessions"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.evict()
+
+session_manager = SessionManager(
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    memory_budget_bytes=settings.SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    max_sessions=settings.SESSION_MAX_COUNT,
+    spill_store=KVSpillStore(
+        spill_dir=settings.KV_SPILL_DIR,
+        disk_budget_bytes=settings.KV_SPILL_DISK_BUDGET_MB * 1024 * 1024,
+        dtype=settings.KV_SPILL_DTYPE
+    ) if settings.KV_SPILL_ENABLED else None
+)
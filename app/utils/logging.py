@@ -1,42 +1,287 @@
+import atexit
 import logging
+import queue
+import random
 import sys
-from typing import Any, Dict
+import threading
+import time
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 import structlog
 from app.config.settings import settings
+from app.utils.monitoring import metrics
+
+# Request-path logging only runs the cheap structlog processors and queues
+# the event dict with its timestamp; JSON rendering and the writes to stdout
+# happen on a background thread that drains the queue in batches.
+# Per-request events logged with ``sample=True`` are kept at LOG_SAMPLE_RATE.
+# The decision is made once per request, from its id, so a request's events
+# are kept or dropped together; the events of a dropped request are held
+# until it ends and written after all if it turns out slow (a
+# ``processing_time`` over LOG_SLOW_REQUEST_SECONDS). Code running outside
+# the request's context passes its RequestSampling as ``sample``; events with
+# no request at all are sampled one by one. Warnings and errors are never
+# sampled and never dropped.
+
+_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+# Sampled-out events a request holds on to in case it turns out slow
+_MAX_HELD_EVENTS = 64
+
+class RequestSampling:
+    """Whether one request's sampled events are kept"""
+
+    __slots__ = ("keep", "held")
+
+    def __init__(self, request_id: str):
+        self.keep = zlib.crc32(request_id.encode()) / 2 ** 32 < settings.LOG_SAMPLE_RATE
+        self.held: List[Any] = []
+
+    def hold(self, item: Any):
+        if len(self.held) < _MAX_HELD_EVENTS:
+            self.held.append(item)
+        else:
+            metrics.log_events_dropped.labels(reason="sampled").inc()
+
+    def release(self, writer: "BatchLogWriter"):
+        for item in self.held:
+            writer.put(item, item[1])
+        self.held.clear()
+
+    def close(self):
+        """End of the request: the events still held are dropped"""
+        if self.held:
+            metrics.log_events_dropped.labels(reason="sampled").inc(len(self.held))
+            self.held.clear()
+
+_request_sampling: ContextVar[Optional[RequestSampling]] = ContextVar("log_sampling", default=None)
+
+def start_request_sampling(request_id: str) -> RequestSampling:
+    """Decide sampling for the request running in the current context"""
+    sampling = RequestSampling(request_id)
+    _request_sampling.set(sampling)
+    return sampling
+
+def current_sampling() -> Optional[RequestSampling]:
+    return _request_sampling.get()
+
+def _sample(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the events marked ``sample`` of requests that are sampled out
+
+    Runs last before the writer, so held events are complete.
+    """
+    sample = event_dict.pop("sample", False)
+    if sample is False:
+        return event_dict
+    levelno = _LEVELS.get(method_name, logging.ERROR)
+    if levelno >= logging.WARNING:
+        return event_dict
+    sampling = sample if isinstance(sample, RequestSampling) else _request_sampling.get()
+    if sampling is None:
+        if random.random() < settings.LOG_SAMPLE_RATE:
+            return event_dict
+        metrics.log_events_dropped.labels(reason="sampled").inc()
+        raise structlog.DropEvent
+    if sampling.keep:
+        return event_dict
+    if event_dict.get("processing_time", 0) >= settings.LOG_SLOW_REQUEST_SECONDS:
+        sampling.release(logger.writer)
+        return event_dict
+    sampling.hold((time.time(), levelno, logger.name, event_dict))
+    raise structlog.DropEvent
+
+def _to_writer(logger, method_name: str, event_dict: Dict[str, Any]):
+    """Last processor: pass the event dict itself on to the QueueLogger"""
+    return (event_dict,), {}
+
+def _iso(created: float) -> str:
+    return datetime.fromtimestamp(created, timezone.utc).isoformat().replace("+00:00", "Z")
+
+def _record_timestamp(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    event_dict["timestamp"] = _iso(event_dict["_record"].created)
+    return event_dict
+
+class BatchLogWriter:
+    """Renders log events to JSON lines and writes them in batches
+
+    Asynchronous by default: a daemon thread drains the queue. When the
+    queue is full, info and debug events are dropped (and counted) rather
+    than blocking the caller; warnings and errors wait for room. Queue items
+    are (created, levelno, logger name, event dict) from structlog or
+    LogRecords from plain stdlib loggers.
+    """
+
+    def __init__(self, stream, asynchronous: bool = True, max_queue: int = 10000, batch_size: int = 256):
+        self.stream = stream
+        self.batch_size = batch_size
+        self._render = structlog.processors.JSONRenderer()
+        self._formatter = structlog.stdlib.ProcessorFormatter(
+            processor=self._render,
+            foreign_pre_chain=[
+                structlog.stdlib.add_logger_name,
+                structlog.stdlib.add_log_level,
+                _record_timestamp
+            ]
+        )
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        if asynchronous:
+            self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, item: Any, levelno: int):
+        if self._thread is None:
+            self._write([self._format(item)])
+            return
+        if levelno >= logging.WARNING:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            metrics.log_events_dropped.labels(reason="queue_full").inc()
+
+    def _format(self, item: Any) -> str:
+        try:
+            if isinstance(item, logging.LogRecord):
+                return self._formatter.format(item)
+            created, _, _, event_dict = item
+            event_dict["timestamp"] = _iso(created)
+            return self._render(None, None, event_dict)
+        except Exception as e:
+            return f"Unformattable log event ({e}): {item!r}"
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in batch:
+                if item is None:
+                    self._write(lines)
+                    return
+                lines.append(self._format(item))
+            self._write(lines)
+
+    def _write(self, lines: List[str]):
+        if lines:
+            with self._write_lock:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+
+    def close(self, timeout: float = 5.0):
+        """Write out everything queued so far and stop the thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout)
+
+class QueueLogger:
+    """structlog logger handing finished event dicts to a BatchLogWriter"""
+
+    def __init__(self, name: str, writer: BatchLogWriter):
+        self.name = name
+        self.writer = writer
+
+    def _emit(self, levelno: int, event_dict: Dict[str, Any]):
+        self.writer.put((time.time(), levelno, self.name, event_dict), levelno)
+
+    def debug(self, event_dict):
+        self._emit(logging.DEBUG, event_dict)
+
+    def info(self, event_dict):
+        self._emit(logging.INFO, event_dict)
+
+    def warning(self, event_dict):
+        self._emit(logging.WARNING, event_dict)
+
+    def error(self, event_dict):
+        self._emit(logging.ERROR, event_dict)
+
+    def critical(self, event_dict):
+        self._emit(logging.CRITICAL, event_dict)
+
+    msg = info
+    warn = warning
+    exception = error
+    fatal = critical
+
+class QueueLoggerFactory:
+    """Names each logger after the module that first uses it, as
+    structlog's stdlib LoggerFactory does"""
+
+    def __init__(self, writer: BatchLogWriter):
+        self.writer = writer
+
+    def __call__(self, *args) -> QueueLogger:
+        if args:
+            return QueueLogger(args[0], self.writer)
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_globals.get("__name__", "").startswith(("structlog", __name__)):
+            frame = frame.f_back
+        name = frame.f_globals.get("__name__", "?") if frame is not None else "?"
+        return QueueLogger(name, self.writer)
+
+class QueueLogHandler(logging.Handler):
+    """Routes records of plain stdlib loggers (uvicorn, httpx, ...) to the writer"""
+
+    def __init__(self, writer: BatchLogWriter):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record: logging.LogRecord):
+        self.writer.put(record, record.levelno)
 
 def setup_logging():
     """Setup structured logging"""
-    
+
     # Remove existing handlers
     for handler in logging.root.handlers[:]:
         logging.root.removeHandler(handler)
-    
-    # Configure structlog
+
+    writer = BatchLogWriter(
+        sys.stdout,
+        asynchronous=settings.LOG_ASYNC,
+        max_queue=settings.LOG_QUEUE_SIZE,
+        batch_size=settings.LOG_BATCH_SIZE
+    )
+    atexit.register(writer.close)
+
+    # Configure structlog; rendering happens on the writer
     structlog.configure(
         processors=[
-            structlog.stdlib.filter_by_level,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
-            structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer()
+            _sample,
+            _to_writer
         ],
         context_class=dict,
-        logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
+        logger_factory=QueueLoggerFactory(writer),
+        wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, settings.LOG_LEVEL.upper())),
         cache_logger_on_first_use=True,
     )
-    
+
     # Configure standard logging
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, settings.LOG_LEVEL.upper()),
-    )
-    
+    logging.root.addHandler(QueueLogHandler(writer))
+    logging.root.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
+
     return structlog.get_logger()
 
-logger = setup_logging()
\ No newline at end of file
+logger = setup_logging()
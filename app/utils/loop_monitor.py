@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from app.utils.logging import logger
+from app.utils.monitoring import metrics
+from app.config.settings import settings
+
+class LoopMonitor:
+    """Measures event-loop lag and reports callbacks that block the loop
+
+    A task on the loop sleeps for ``interval`` seconds and records how late
+    it woke up as ``hostllm_event_loop_lag_seconds``. A watchdog thread
+    checks the task's heartbeat; once the loop has not come back for
+    ``block_threshold`` seconds it samples the loop thread's stack and logs
+    it with the task that was running, once per stall.
+    """
+
+    def __init__(self, interval: float, block_threshold: float):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start monitoring the running loop (call from inside it)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            metrics.event_loop_lag.observe(max(now - expected, 0.0))
+            self._heartbeat = now
+
+    def _watch(self):
+        poll = min(self.block_threshold / 2, self.interval)
+        while not self._stop.wait(poll):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.block_threshold or self._reported_heartbeat == heartbeat:
+                continue
+            self._reported_heartbeat = heartbeat
+            self._report(stalled)
+
+    def _report(self, stalled: float):
+        metrics.event_loop_blocked.inc()
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=25)) if frame is not None else ""
+
+        task = asyncio.current_task(self._loop)
+        coroutine = None
+        if task is not None:
+            coro = task.get_coro()
+            coroutine = getattr(coro, "__qualname__", repr(coro))
+
+        logger.warning(
+            "Event loop blocked",
+            blocked_ms=round(stalled * 1000, 1),
+            task=task.get_name() if task is not None else None,
+            coroutine=coroutine,
+            stack=stack
+        )
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    block_threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000
+)
@@ -0,0 +1,222 @@
+import os
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+from app.config.settings import settings
+
+# With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory before start-up: every worker then writes its samples there and
+# /metrics aggregates all of them.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STEP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1.28)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+STEP_TOKEN_BUCKETS = (1, 4, 16, 64, 256, 512, 1024, 2048, 4096, 8192)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+class _NoopMetric:
+    """Stand-in used when metrics are disabled so call sites stay unconditional"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+_NOOP = _NoopMetric()
+
+def _metric(cls, name: str, documentation: str, **kwargs):
+    if not settings.ENABLE_METRICS:
+        return _NOOP
+    if cls is not Gauge:
+        kwargs.pop("multiprocess_mode", None)
+    return cls(name, documentation, **kwargs)
+
+class Metrics:
+    """Prometheus metrics for the inference hot paths"""
+
+    def __init__(self):
+        self.time_to_first_token = _metric(
+            Histogram, "hostllm_time_to_first_token_seconds",
+            "Time from generation start (including queue wait) to the first token",
+            buckets=LATENCY_BUCKETS
+        )
+        self.inter_token_latency = _metric(
+            Histogram, "hostllm_inter_token_latency_seconds",
+            "Time between consecutive streamed tokens",
+            buckets=STEP_BUCKETS
+        )
+        self.queue_wait = _metric(
+            Histogram, "hostllm_queue_wait_seconds",
+            "Time a request waited for a generation slot",
+            buckets=LATENCY_BUCKETS
+        )
+        self.prefill_time = _metric(
+            Histogram, "hostllm_prefill_seconds",
+            "Prompt prefill forward pass time",
+            buckets=LATENCY_BUCKETS
+        )
+        self.decode_step_time = _metric(
+            Histogram, "hostllm_decode_step_seconds",
+            "Single decode step forward pass time",
+            buckets=STEP_BUCKETS
+        )
+        self.batch_size = _metric(
+            Histogram, "hostllm_batch_size",
+            "Sequences per forward pass",
+            buckets=BATCH_BUCKETS
+        )
+        self.step_tokens = _metric(
+            Histogram, "hostllm_step_tokens",
+            "Tokens fed per forward pass, prefill chunks included",
+            buckets=STEP_TOKEN_BUCKETS
+        )
+        self.tokens_per_second = _metric(
+            Histogram, "hostllm_request_tokens_per_second",
+            "Decode throughput of a single request",
+            buckets=THROUGHPUT_BUCKETS
+        )
+        self.tokens = _metric(
+            Counter, "hostllm_tokens_total",
+            "Tokens processed, by kind (prompt or completion)",
+            labelnames=["kind"]
+        )
+        self.model_ready = _metric(
+            Gauge, "hostllm_model_ready",
+            "1 once the model is loaded and warmed up",
+            multiprocess_mode="liveall"
+        )
+        self.model_swaps = _metric(
+            Counter, "hostllm_model_swaps_total",
+            "Checkpoint hot swaps, by result (done or failed)",
+            labelnames=["result"]
+        )
+        self.model_loads = _metric(
+            Counter, "hostllm_model_loads_total",
+            "On-demand loads of registry models, by result (done or failed)",
+            labelnames=["result"]
+        )
+        self.model_evictions = _metric(
+            Counter, "hostllm_model_evictions_total",
+            "Registry models unloaded to make room for another"
+        )
+        self.model_memory_bytes = _metric(
+            Gauge, "hostllm_model_memory_bytes",
+            "Weight memory of all resident models",
+            multiprocess_mode="livesum"
+        )
+        self.lora_adapter_evictions = _metric(
+            Counter, "hostllm_lora_adapter_evictions_total",
+            "LoRA adapters dropped from their slot for another adapter"
+        )
+        self.constraint_compile_time = _metric(
+            Histogram, "hostllm_constraint_compile_seconds",
+            "Time to compile a response_format into token masks",
+            buckets=LATENCY_BUCKETS
+        )
+        self.running_requests = _metric(
+            Gauge, "hostllm_running_requests",
+            "Requests currently generating",
+            multiprocess_mode="livesum"
+        )
+        self.kv_cache_bytes = _metric(
+            Gauge, "hostllm_kv_cache_bytes",
+            "KV cache bytes held, by tier (resident, spilled or swapped)",
+            labelnames=["tier"],
+            multiprocess_mode="livesum"
+        )
+        self.kv_cache_utilization = _metric(
+            Gauge, "hostllm_kv_cache_utilization_ratio",
+            "Resident session KV bytes over the session memory budget",
+            multiprocess_mode="liveall"
+        )
+        self.kv_restore_time = _metric(
+            Histogram, "hostllm_kv_restore_seconds",
+            "Time to map a spilled KV cache back into memory",
+            buckets=STEP_BUCKETS
+        )
+        self.cache_lookups = _metric(
+            Counter, "hostllm_cache_lookups_total",
+            "Cache lookups by cache and result (hit, cold_hit or miss)",
+            labelnames=["cache", "result"]
+        )
+        self.requests_rejected = _metric(
+            Counter, "hostllm_requests_rejected_total",
+            "Requests refused before generation, by reason",
+            labelnames=["reason"]
+        )
+        self.engine_max_batch_size = _metric(
+            Gauge, "hostllm_engine_max_batch_size",
+            "Current batch size limit of the engine",
+            multiprocess_mode="liveall"
+        )
+        self.engine_max_step_tokens = _metric(
+            Gauge, "hostllm_engine_max_step_tokens",
+            "Current per-pass token budget of the engine",
+            multiprocess_mode="liveall"
+        )
+        self.autotune_itl_p95 = _metric(
+            Gauge, "hostllm_autotune_itl_p95_seconds",
+            "p95 inter-token latency at the autotuner's last evaluation",
+            multiprocess_mode="liveall"
+        )
+        self.autotune_adjustments = _metric(
+            Counter, "hostllm_autotune_adjustments_total",
+            "Batch limit changes made by the autotuner, by direction (up or down)",
+            labelnames=["direction"]
+        )
+        self.preemptions = _metric(
+            Counter, "hostllm_preemptions_total",
+            "Running sequences preempted for KV room, by mode (swap or recompute)",
+            labelnames=["mode"]
+        )
+        self.requests_cancelled = _metric(
+            Counter, "hostllm_requests_cancelled_total",
+            "Generations abandoned because the client went away"
+        )
+        self.event_loop_lag = _metric(
+            Histogram, "hostllm_event_loop_lag_seconds",
+            "Delay of the event loop in running a scheduled wake-up",
+            buckets=STEP_BUCKETS
+        )
+        self.event_loop_blocked = _metric(
+            Counter, "hostllm_event_loop_blocked_total",
+            "Times a single callback held the event loop past the blocking threshold"
+        )
+        self.output_length_prediction_ratio = _metric(
+            Histogram, "hostllm_output_length_prediction_ratio",
+            "Actual over predicted output tokens of finished sequences",
+            buckets=(0.125, 0.25, 0.5, 0.8, 0.9, 1.1, 1.25, 2.0, 4.0, 8.0)
+        )
+        self.log_events_dropped = _metric(
+            Counter, "hostllm_log_events_dropped_total",
+            "Log events not written, by reason (sampled or queue_full)",
+            labelnames=["reason"]
+        )
+
+metrics = Metrics()
+
+def render_metrics() -> bytes:
+    """Metrics exposition for this process, or all workers in multiprocess mode"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the multiprocess directory"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,174 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# Statistical profiler for the live process. While a profile runs, a sampler
+# thread reads every thread's current stack via sys._current_frames at a fixed
+# rate. Hot-path code tags what it is doing with ``phase("decode")`` etc.;
+# outside a profile that is a single global check.
+
+_thread_phases: Dict[int, str] = {}
+_profiling = False
+
+# Leaf frames of threads parked waiting for work
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+Frame = Tuple[str, str, int]
+
+@contextmanager
+def _phase(name: str):
+    ident = threading.get_ident()
+    previous = _thread_phases.get(ident)
+    _thread_phases[ident] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            _thread_phases.pop(ident, None)
+        else:
+            _thread_phases[ident] = previous
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+def phase(name: str):
+    """Tag samples taken on this thread with ``name`` (prefill, decode, ...)"""
+    if not _profiling:
+        return _NULL_PHASE
+    return _phase(name)
+
+class ProfileResult:
+    """Aggregated samples keyed by (thread, phase, stack)"""
+
+    def __init__(self, samples: Counter, interval: float, duration: float):
+        self.samples = samples
+        self.interval = interval
+        self.duration = duration
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed stacks, one ``frames count`` line per stack"""
+        lines = []
+        for (thread, tag, stack), count in self.samples.most_common():
+            frames = [thread, f"phase:{tag}"] + [f"{func} ({os.path.basename(path)}:{line})" for func, path, line in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """speedscope file with one sampled profile per thread and phase"""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        profiles: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+        for (thread, tag, stack), count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    func, path, line = frame
+                    frames.append({"name": func, "file": path, "line": line})
+                indices.append(frame_index[frame])
+
+            profile = profiles.get((thread, tag))
+            if profile is None:
+                profile = profiles[(thread, tag)] = {
+                    "type": "sampled",
+                    "name": f"{thread} [{tag}]",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": []
+                }
+            profile["samples"].append(indices)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"hostllm profile ({self.duration:.1f}s)",
+            "exporter": "app.utils.profiler",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values())
+        }
+
+class SamplingProfiler:
+    """Runs one sampling session at a time across all threads of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, seconds: float, hz: float, include_idle: bool = False) -> Optional[ProfileResult]:
+        """Sample for ``seconds``; returns None if another profile is running"""
+        global _profiling
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            _profiling = True
+            interval = 1.0 / hz
+            own_ident = threading.get_ident()
+            names = {}
+            samples: Counter = Counter()
+
+            start = time.perf_counter()
+            deadline = start + seconds
+            next_tick = start
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now < next_tick:
+                    time.sleep(next_tick - now)
+                next_tick += interval
+
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = self._stack(frame)
+                    if not include_idle and (os.path.basename(stack[-1][1]), stack[-1][0]) in _IDLE_LEAVES:
+                        continue
+                    if ident not in names:
+                        names[ident] = self._thread_name(ident)
+                    samples[(names[ident], _thread_phases.get(ident, "none"), stack)] += 1
+
+            return ProfileResult(samples, interval, time.perf_counter() - start)
+        finally:
+            _profiling = False
+            self._lock.release()
+
+    @staticmethod
+    def _stack(frame) -> Tuple[Frame, ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    @staticmethod
+    def _thread_name(ident: int) -> str:
+        for thread in threading.enumerate():
+            if thread.ident == ident:
+                return thread.name
+        return f"thread-{ident}"
+
+profiler = SamplingProfiler()
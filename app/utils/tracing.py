@@ -0,0 +1,239 @@
+import json
+import os
+import secrets
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config.settings import settings
+
+# Per-request phase timing. A RequestTrace is bound to the request's context
+# by TracingMiddleware; code on the request path wraps its phases in
+# ``span("name")`` or reports them with ``record``. Repeated phases (decode
+# steps, detokenization, chunk serialization) are aggregated per name so a
+# trace stays a handful of entries however long the generation runs. Without
+# the middleware there is no bound trace and both calls return immediately.
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+_NULL_SPAN = nullcontext()
+
+class RequestTrace:
+    """Phase timings of one request, relative to its start"""
+
+    __slots__ = ("trace_id", "method", "path", "status", "start_unix", "start", "end", "phases")
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = secrets.token_hex(16)
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.start_unix = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        # name -> [first start, last end, total seconds, count]
+        self.phases: Dict[str, List[float]] = {}
+
+    def record(self, name: str, start: float, end: float):
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [start, end, end - start, 1]
+        else:
+            phase[1] = end
+            phase[2] += end - start
+            phase[3] += 1
+
+    def finish(self, status: Optional[int] = None):
+        self.end = time.perf_counter()
+        if status is not None:
+            self.status = status
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value for the phases recorded so far"""
+        entries = [
+            f"{name};dur={phase[2] * 1000:.2f}" for name, phase in self.phases.items()
+        ]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "start": self.start_unix,
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "phases": {
+                name: {
+                    "offset_ms": round((phase[0] - self.start) * 1000, 3),
+                    "duration_ms": round(phase[2] * 1000, 3),
+                    "count": int(phase[3])
+                }
+                for name, phase in self.phases.items()
+            }
+        }
+
+class _Span:
+    __slots__ = ("trace", "name", "begin")
+
+    def __init__(self, trace: RequestTrace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.record(self.name, self.begin, time.perf_counter())
+        return False
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def span(name: str):
+    """Time a phase of the current request; a no-op when tracing is off"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+def record(name: str, start: float, end: float):
+    """Report an already measured phase (``time.perf_counter`` values)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, start, end)
+
+class TraceBuffer:
+    """Ring buffer of recently completed traces"""
+
+    def __init__(self, size: int):
+        self.traces: Deque[RequestTrace] = deque(maxlen=size)
+
+    def add(self, trace: RequestTrace):
+        self.traces.append(trace)
+
+    def recent(self, limit: int) -> List[RequestTrace]:
+        return list(self.traces)[-limit:]
+
+trace_buffer = TraceBuffer(settings.TRACE_BUFFER_SIZE)
+
+class TracingMiddleware:
+    """ASGI middleware binding a RequestTrace to each HTTP request
+
+    The ``Server-Timing`` header carries the phases finished before the
+    response starts; for streamed responses the generation phases land in
+    the buffered trace once the body is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                trace.finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if trace.end is None:
+                trace.finish()
+            trace_buffer.add(trace)
+            _current_trace.reset(token)
+
+def to_chrome_trace(traces: List[RequestTrace]) -> Dict[str, Any]:
+    """Chrome trace event format (chrome://tracing, Perfetto); one row per request"""
+    events = []
+    for tid, trace in enumerate(traces):
+        base_us = trace.start_unix * 1e6
+        end = trace.end if trace.end is not None else time.perf_counter()
+        events.append({
+            "name": f"{trace.method} {trace.path}",
+            "ph": "X",
+            "ts": base_us,
+            "dur": (end - trace.start) * 1e6,
+            "pid": 1,
+            "tid": tid,
+            "args": {"trace_id": trace.trace_id, "status": trace.status}
+        })
+        for name, (first, last, total, count) in trace.phases.items():
+            events.append({
+                "name": name,
+                "ph": "X",
+                "ts": base_us + (first - trace.start) * 1e6,
+                "dur": (last - first) * 1e6,
+                "pid": 1,
+                "tid": tid,
+                "args": {"busy_ms": round(total * 1000, 3), "count": int(count)}
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def to_otlp_json(traces: List[RequestTrace]) -> Dict[str, Any]:
+    """OTLP/JSON ``ExportTraceServiceRequest`` with a root span per request"""
+    spans = []
+    for trace in traces:
+        base_ns = int(trace.start_unix * 1e9)
+        end = trace.end if trace.end is not None else time.perf_counter()
+        root_id = secrets.token_hex(8)
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": root_id,
+            "name": f"{trace.method} {trace.path}",
+            "kind": 2,
+            "startTimeUnixNano": str(base_ns),
+            "endTimeUnixNano": str(base_ns + int((end - trace.start) * 1e9)),
+            "attributes": [
+                {"key": "http.request.method", "value": {"stringValue": trace.method}},
+                {"key": "url.path", "value": {"stringValue": trace.path}},
+                {"key": "http.response.status_code", "value": {"intValue": str(trace.status or 0)}}
+            ]
+        })
+        for name, (first, last, total, count) in trace.phases.items():
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": secrets.token_hex(8),
+                "parentSpanId": root_id,
+                "name": name,
+                "kind": 1,
+                "startTimeUnixNano": str(base_ns + int((first - trace.start) * 1e9)),
+                "endTimeUnixNano": str(base_ns + int((last - trace.start) * 1e9)),
+                "attributes": [
+                    {"key": "busy_ms", "value": {"doubleValue": round(total * 1000, 3)}},
+                    {"key": "count", "value": {"intValue": str(int(count))}}
+                ]
+            })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "hostllm"}}]},
+            "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": spans}]
+        }]
+    }
+
+def export_traces(traces: List[RequestTrace], fmt: str) -> Dict[str, Any]:
+    """Render traces as ``chrome`` or ``otlp`` JSON, saving a copy under
+    TRACE_EXPORT_DIR when it is configured"""
+    payload = to_chrome_trace(traces) if fmt == "chrome" else to_otlp_json(traces)
+    if settings.TRACE_EXPORT_DIR:
+        os.makedirs(settings.TRACE_EXPORT_DIR, exist_ok=True)
+        path = os.path.join(settings.TRACE_EXPORT_DIR, f"traces-{int(time.time())}-{fmt}.json")
+        with open(path, "w") as f:
+            json.dump(payload, f)
+    return payload
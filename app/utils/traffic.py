@@ -0,0 +1,121 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional
+
+from app.config.settings import settings
+from app.utils.logging import logger
+
+# Production traffic log for capacity planning. One fixed-size record per
+# completed chat request; prompt and completion text are never stored.
+#
+# File layout (little endian):
+#   header   magic "HTR1", version u16
+#   records  arrival unix time f64, API key hash u64, prompt tokens u32,
+#            max_tokens u32, output tokens u32, TTFT seconds f32,
+#            end-to-end seconds f32, HTTP status u16, flags u8 (bit 0: stream)
+
+_MAGIC = b"HTR1"
+_VERSION = 1
+_HEADER = struct.Struct("<4sH")
+_RECORD = struct.Struct("<dQIIIffHB")
+
+FLAG_STREAM = 1
+
+@dataclass
+class TrafficRecord:
+    arrival: float
+    tenant: int
+    prompt_tokens: int
+    max_tokens: int
+    output_tokens: int
+    ttft: float
+    e2e: float
+    status: int
+    stream: bool
+
+def tenant_hash(api_key: str) -> int:
+    """Stable 64-bit tenant id; the key itself is not recoverable"""
+    return int.from_bytes(hashlib.sha256(api_key.encode()).digest()[:8], "little")
+
+def read_traffic(path: str) -> List[TrafficRecord]:
+    with open(path, "rb") as f:
+        return list(iter_traffic(f))
+
+def iter_traffic(f: BinaryIO) -> Iterator[TrafficRecord]:
+    magic, version = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a traffic recording")
+    while True:
+        chunk = f.read(_RECORD.size)
+        # A truncated last record means the writer died mid-write
+        if len(chunk) < _RECORD.size:
+            return
+        arrival, tenant, prompt, max_tokens, output, ttft, e2e, status, flags = _RECORD.unpack(chunk)
+        yield TrafficRecord(arrival, tenant, prompt, max_tokens, output, ttft, e2e, status, bool(flags & FLAG_STREAM))
+
+class TrafficRecorder:
+    """Appends request records to ``<directory>/traffic-<start>-<pid>.htr``
+
+    Writes go through a buffered file, so a record costs a struct pack and a
+    memory copy; the buffer is flushed as it fills and on ``close``.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+        self.path: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _open(self) -> BinaryIO:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"traffic-{int(time.time())}-{os.getpid()}.htr")
+        f = open(self.path, "ab", buffering=64 * 1024)
+        f.write(_HEADER.pack(_MAGIC, _VERSION))
+        logger.info("Recording traffic", path=self.path)
+        return f
+
+    def record(
+        self,
+        api_key: str,
+        arrival: float,
+        prompt_tokens: int,
+        max_tokens: int,
+        output_tokens: int,
+        ttft: Optional[float],
+        e2e: float,
+        status: int,
+        stream: bool
+    ):
+        if not self.enabled:
+            return
+        data = _RECORD.pack(
+            arrival,
+            tenant_hash(api_key),
+            prompt_tokens,
+            max_tokens,
+            output_tokens,
+            ttft if ttft is not None else e2e,
+            e2e,
+            status,
+            FLAG_STREAM if stream else 0
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(data)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+traffic_recorder = TrafficRecorder(settings.TRAFFIC_RECORD_DIR)
@@ -46,8 +46,17 @@ export LOG_LEVEL="INFO"
 export MAX_CONCURRENT_REQUESTS="100"
 export REQUEST_TIMEOUT="300"
 
+# Prometheus multiprocess mode: one shared sample directory for all workers
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/hostllm-prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start the server
 echo "🌐 Starting server on ${HOST}:${PORT}..."
 echo "📊 Access the API at: http://localhost:8000"
 echo "📚 API docs at: http://localhost:8000/docs"
-uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 4
+echo "📈 Metrics at: http://localhost:8000/metrics"
+# One worker: model state lives in the process, so a hot swap
+# (POST /admin/model/swap) would only reach the worker that received it.
+# The swap endpoint refuses to run with WORKERS above 1.
+uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"